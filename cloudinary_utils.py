@@ -2,6 +2,8 @@
 import cloudinary.uploader
 from cloudinary.utils import cloudinary_url
 
+from documents import resilience
+
 def upload_file_to_cloudinary(file_obj, filename, folder="manual_uploads"):
     """
     Upload a file to Cloudinary with correct resource_type handling.
@@ -20,16 +22,24 @@ def upload_file_to_cloudinary(file_obj, filename, folder="manual_uploads"):
     else:
         resource_type = 'auto'  # Let Cloudinary decide for images/videos
         
-    try:
-        result = cloudinary.uploader.upload(
+    def upload():
+        # Rewind so a retry sends the whole file again
+        if hasattr(file_obj, 'seek'):
+            file_obj.seek(0)
+        return cloudinary.uploader.upload(
             file_obj,
             public_id=filename,
             folder=folder,
             resource_type=resource_type,
             use_filename=True,
             unique_filename=False,
-            overwrite=True
+            overwrite=True,
+            timeout=resilience.upload_timeout(),
         )
+
+    try:
+        # Fixed public_id with overwrite=True, so a retried upload replaces rather than duplicates
+        result = resilience.guarded('upload', upload)
         return result
     except Exception as e:
         print(f"Error uploading to Cloudinary: {e}")
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document
+from .models import Document, StorageTombstone, StoredBlob
 
 
 @admin.register(Document)
@@ -8,12 +8,33 @@ class DocumentAdmin(admin.ModelAdmin):
     list_display = ['student', 'document_type', 'title', 'uploaded_by', 'uploaded_at']
     list_filter = ['document_type', 'uploaded_at', 'uploaded_by']
     search_fields = ['student__username', 'student__email', 'title']
-    readonly_fields = ['uploaded_at', 'updated_at']
+    readonly_fields = ['uploaded_at', 'updated_at', 'size_bytes', 'original_size_bytes', 'content_type', 'sha256', 'original_filename']
     fieldsets = (
         ('Document Information', {
             'fields': ('student', 'document_type', 'title', 'file')
         }),
+        ('File Metadata', {
+            'fields': ('original_filename', 'content_type', 'size_bytes', 'original_size_bytes', 'sha256'),
+            'classes': ('collapse',)
+        }),
         ('Upload Information', {
             'fields': ('uploaded_by', 'uploaded_at', 'updated_at')
         }),
     )
+
+
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    """Admin interface for deduplicated file blobs"""
+    list_display = ['sha256', 'name', 'size_bytes', 'ref_count', 'created_at']
+    search_fields = ['sha256', 'name']
+    readonly_fields = ['sha256', 'name', 'size_bytes', 'ref_count', 'created_at']
+
+
+@admin.register(StorageTombstone)
+class StorageTombstoneAdmin(admin.ModelAdmin):
+    """Admin interface for stored files waiting to be deleted"""
+    list_display = ['name', 'storage', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['storage']
+    search_fields = ['name']
+    readonly_fields = ['storage', 'name', 'attempts', 'next_attempt_at', 'claim', 'last_error', 'created_at']
@@ -0,0 +1,170 @@
+"""
+Batch document uploads.
+
+A batch is validated as a whole by ``BatchUploadFormSet``, then saved in one
+go: files are pushed to storage concurrently with a bounded thread pool and
+the Document rows are written with a single ``bulk_create`` inside one
+transaction. If anything fails, files that already reached storage or the
+spool are removed again.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from . import blobs, derivatives, transfers
+from .models import Document, StoredBlob, document_upload_path
+from .signals import documents_bulk_created
+from .utils import compute_file_metadata
+
+logger = logging.getLogger(__name__)
+
+
+def max_workers():
+    return getattr(settings, 'DOCUMENT_BATCH_UPLOAD_MAX_WORKERS', 4)
+
+
+def save_batch(items, student, uploaded_by):
+    """
+    Create one Document per ``(document_type, title, uploaded_file)`` item.
+    Returns the created documents.
+    """
+    documents = []
+    for document_type, title, uploaded in items:
+        document = Document(
+            student=student,
+            uploaded_by=uploaded_by,
+            document_type=document_type,
+            title=title,
+        )
+        for field, value in compute_file_metadata(uploaded).items():
+            setattr(document, field, value)
+        documents.append(document)
+    uploads = [uploaded for _, _, uploaded in items]
+
+    stored = []
+    try:
+        if transfers.async_enabled():
+            for document, uploaded in zip(documents, uploads):
+                document.file = uploaded
+                transfers.spool_document_file(document)
+            _create(documents)
+        elif blobs.dedup_enabled():
+            stored = _push_blobs(documents, uploads)
+            _create(documents, blob_uploads=stored)
+        else:
+            stored = _push_files(documents, uploads)
+            _create(documents)
+    except Exception:
+        _cleanup(stored)
+        for document in documents:
+            transfers.discard_spool(document)
+        raise
+
+    for document, uploaded in zip(documents, uploads):
+        derivatives.schedule_document(document, uploaded)
+    return documents
+
+
+def _storage():
+    return Document._meta.get_field('file').storage
+
+
+def _push(jobs):
+    """Run ``(name, content)`` storage saves concurrently; returns the stored names in order."""
+    storage = _storage()
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers(), len(jobs))) as pool:
+        futures = [pool.submit(storage.save, name, content) for name, content in jobs]
+    names, errors = [], []
+    for future in futures:
+        try:
+            names.append(future.result())
+        except Exception as e:
+            errors.append(e)
+    if errors:
+        _cleanup(names)
+        raise errors[0]
+    return names
+
+
+def _push_files(documents, uploads):
+    names = _push([
+        (document_upload_path(document, document.original_filename), uploaded)
+        for document, uploaded in zip(documents, uploads)
+    ])
+    for document, name in zip(documents, names):
+        document.file = name
+    return names
+
+
+def _push_blobs(documents, uploads):
+    """
+    Upload each distinct content hash that has no blob yet, once.
+    Returns {sha256: stored name} for the new uploads.
+    """
+    existing = set(
+        StoredBlob.objects.filter(sha256__in={d.sha256 for d in documents}).values_list('sha256', flat=True)
+    )
+    pending = {}
+    for document, uploaded in zip(documents, uploads):
+        if document.sha256 not in existing and document.sha256 not in pending:
+            pending[document.sha256] = (document, uploaded)
+    names = _push([
+        (blobs.blob_name(sha256, document.original_filename), uploaded)
+        for sha256, (document, uploaded) in pending.items()
+    ])
+    return dict(zip(pending, names))
+
+
+def _create(documents, blob_uploads=None):
+    with transaction.atomic():
+        if blob_uploads is not None:
+            _attach_blobs(documents, blob_uploads)
+        Document.objects.bulk_create(documents)
+        documents_bulk_created.send(sender=Document, documents=documents)
+
+
+def _attach_blobs(documents, blob_uploads):
+    by_sha = {
+        blob.sha256: blob
+        for blob in StoredBlob.objects.select_for_update().filter(sha256__in={d.sha256 for d in documents})
+    }
+    references = {}
+    for document in documents:
+        blob = by_sha.get(document.sha256)
+        if blob is None:
+            # Either we uploaded it just now, or the blob vanished since we looked
+            if document.sha256 not in blob_uploads:
+                raise RuntimeError(f'Blob {document.sha256} disappeared during the upload; please retry.')
+            blob = blobs.register_blob(
+                document.sha256, document.size_bytes, document.original_filename, blob_uploads[document.sha256]
+            )
+            by_sha[document.sha256] = blob
+        document.blob = blob
+        document.file = blob.name
+        references[blob.pk] = references.get(blob.pk, 0) + 1
+    for blob_id, count in references.items():
+        StoredBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') + count)
+
+    # Bytes another request stored while we were uploading: keep theirs, drop ours
+    duplicates = [
+        name for sha256, name in blob_uploads.items()
+        if by_sha[sha256].name != name
+    ]
+    if duplicates:
+        transaction.on_commit(lambda: _cleanup(duplicates))
+
+
+def _cleanup(names):
+    if isinstance(names, dict):
+        names = list(names.values())
+    storage = _storage()
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception as e:
+            logger.warning('Batch upload cleanup failed: name=%s error=%s', name, e)
@@ -0,0 +1,154 @@
+"""
+Content-addressed storage for document files.
+
+Identical bytes are stored once under documents/blobs/<aa>/<sha256><ext> and
+shared through StoredBlob rows with a reference count. Documents take a
+reference when they are saved and release it when they are deleted or their
+file is replaced; the stored file goes away with the last reference.
+"""
+import os
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+
+from .models import Document, StoredBlob
+
+
+def dedup_enabled():
+    return getattr(settings, 'DOCUMENT_DEDUPLICATION', True)
+
+
+def _storage():
+    return Document._meta.get_field('file').storage
+
+
+def blob_name(sha256, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return f'documents/blobs/{sha256[:2]}/{sha256}{ext}'
+
+
+def acquire_blob(sha256, size_bytes, filename, content):
+    """
+    Return the blob for ``sha256`` with one more reference, uploading ``content``
+    only if no blob with these bytes exists yet. Must run inside a transaction.
+    """
+    blob = StoredBlob.objects.select_for_update().filter(sha256=sha256).first()
+    if blob is None:
+        name = _storage().save(blob_name(sha256, filename), content)
+        blob = register_blob(sha256, size_bytes, filename, name)
+    StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    return blob
+
+
+def register_blob(sha256, size_bytes, filename, name):
+    """
+    Record bytes already uploaded under ``name`` as the blob for ``sha256``
+    (with no references yet). Must run inside a transaction.
+    """
+    try:
+        with transaction.atomic():
+            return StoredBlob.objects.create(sha256=sha256, name=name, size_bytes=size_bytes)
+    except IntegrityError:
+        # Another request stored the same bytes first: keep theirs, drop ours
+        if name != blob_name(sha256, filename):
+            _storage().delete(name)
+        return StoredBlob.objects.select_for_update().get(sha256=sha256)
+
+
+def adopt_stored_file(document, name):
+    """
+    Point a Document at the blob for its contents when the bytes were already
+    uploaded under ``name`` (direct uploads): ``name`` becomes the blob if these
+    bytes are new, otherwise it is queued for deletion. Must run inside a transaction.
+    """
+    from .tombstones import bury
+
+    blob = StoredBlob.objects.select_for_update().filter(sha256=document.sha256).first()
+    if blob is None:
+        # On a lost race register_blob drops ``name`` itself
+        blob = register_blob(document.sha256, document.size_bytes, document.original_filename, name)
+    elif blob.name != name:
+        bury(_storage(), [name])
+    StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    document.file = blob.name
+    document.blob = blob
+
+
+def attach_blob(document, content):
+    """
+    Point a Document at the shared blob for its contents instead of uploading a copy.
+    Returns True if the document already held that blob.
+    """
+    if document.blob_id and document.blob.sha256 == document.sha256:
+        # Same bytes re-uploaded for the same document: it already holds a reference
+        document.file = document.blob.name
+        return True
+    blob = acquire_blob(document.sha256, document.size_bytes, document.original_filename, content)
+    document.file = blob.name
+    document.blob = blob
+    return False
+
+
+def release_blob(blob_id, derived_files=()):
+    """
+    Drop one reference to a blob and queue the stored file for deletion once
+    nobody uses it, together with any ``derived_files`` (e.g. its shared thumbnail).
+    The tombstones are written in the same transaction, so a rollback keeps the file.
+    """
+    from .tombstones import bury, bury_files
+
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+        bury(_storage(), [blob.name])
+        bury_files(derived_files)
+        blob.delete()
+
+
+def release_blobs(references):
+    """
+    Bulk version of ``release_blob`` for {blob id: references dropped}: one
+    UPDATE for the blobs still used elsewhere, one DELETE for the rest.
+    Returns the ids of the deleted blobs; queuing their stored files (and
+    derived files) for deletion is up to the caller.
+    """
+    if not references:
+        return set()
+    with transaction.atomic():
+        counts = dict(
+            StoredBlob.objects.select_for_update().filter(pk__in=references).values_list('pk', 'ref_count')
+        )
+        released = {pk for pk, count in counts.items() if count <= references[pk]}
+        kept = {pk: references[pk] for pk in counts if pk not in released}
+        if kept:
+            StoredBlob.objects.filter(pk__in=kept).update(
+                ref_count=F('ref_count') - Case(*(When(pk=pk, then=Value(n)) for pk, n in kept.items()))
+            )
+        if released:
+            StoredBlob.objects.filter(pk__in=released).delete()
+    return released
+
+
+def dedup_stats():
+    """Logical vs physical bytes across all documents with a stored size."""
+    from django.db.models import Count, Sum
+
+    docs = Document.objects.exclude(size_bytes__isnull=True)
+    logical = docs.aggregate(total=Sum('size_bytes'), count=Count('id'))
+    unshared = docs.filter(blob__isnull=True).aggregate(total=Sum('size_bytes'))['total'] or 0
+    blobs = StoredBlob.objects.aggregate(total=Sum('size_bytes'), count=Count('id'), refs=Sum('ref_count'))
+    logical_bytes = logical['total'] or 0
+    physical_bytes = unshared + (blobs['total'] or 0)
+    return {
+        'documents': logical['count'],
+        'blobs': blobs['count'],
+        'blob_references': blobs['refs'] or 0,
+        'logical_bytes': logical_bytes,
+        'physical_bytes': physical_bytes,
+        'dedup_ratio': (logical_bytes / physical_bytes) if physical_bytes else 1.0,
+    }
@@ -0,0 +1,162 @@
+"""
+Resumable chunked uploads.
+
+Protocol (all JSON, see documents/views.py):
+    POST chunked/start/        -> {upload_id, chunk_size, offset}
+    GET  chunked/<upload_id>/  -> {offset, total_size, chunk_size, status}
+    POST chunked/<upload_id>/  raw chunk body with X-Chunk-Offset and X-Chunk-SHA256 headers
+
+Chunks have a fixed size (only the last one may be shorter) and must arrive in
+order at the current offset, so a client that lost its connection asks for the
+offset and resumes from there. When the last chunk lands, the spool file is
+handed to the regular upload form, which creates the Document in one
+transaction. Whatever the outcome, the session ends COMPLETE or FAILED and the
+spool file is removed.
+"""
+import hashlib
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+
+from .forms import AdminDocumentUploadForm, DocumentUploadForm
+from .models import Document, UploadSession
+from .upload_handlers import max_upload_size, size_error
+
+ALLOWED_EXTENSIONS = ['pdf', 'jpg', 'jpeg', 'png']
+DUPLICATE_TITLE = 'A document of this type with this title already exists.'
+
+
+class ChunkError(Exception):
+    """Raised when a chunk is rejected. ``offset`` tells the client where to resume."""
+
+    def __init__(self, message, offset=None, status=400):
+        super().__init__(message)
+        self.offset = offset
+        self.status = status
+
+
+def chunk_size():
+    return getattr(settings, 'DOCUMENT_UPLOAD_CHUNK_SIZE', 1024 * 1024)
+
+
+def spool_path(session):
+    spool_dir = getattr(settings, 'DOCUMENT_UPLOAD_SPOOL_DIR')
+    os.makedirs(spool_dir, exist_ok=True)
+    return os.path.join(spool_dir, f'{session.id}.part')
+
+
+def start_session(student, uploaded_by, document_type, title, filename, total_size):
+    """Validate the upload request and open a new session."""
+    if document_type not in dict(Document.DOCUMENT_TYPE_CHOICES):
+        raise ChunkError(f'Unknown document type: {document_type}')
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        raise ChunkError(f'Unsupported file extension: {ext}. Allowed: pdf, jpg, jpeg, png')
+    if total_size <= 0:
+        raise ChunkError('The submitted file is empty.')
+    if total_size > max_upload_size():
+        raise ChunkError(size_error())
+    if _duplicate(student, document_type, (title or '')[:255]):
+        raise ChunkError(DUPLICATE_TITLE)
+
+    session = UploadSession.objects.create(
+        student=student,
+        uploaded_by=uploaded_by,
+        document_type=document_type,
+        title=(title or '')[:255],
+        filename=os.path.basename(filename)[:255],
+        total_size=total_size,
+        chunk_size=chunk_size(),
+    )
+    # Create the spool up front so every chunk is a plain append
+    open(spool_path(session), 'wb').close()
+    return session
+
+
+def receive_chunk(session_id, offset, data, checksum, complete=True):
+    """
+    Append one chunk to the spool file. Returns the updated session.
+    The final chunk triggers Document creation via ``complete_session`` unless
+    ``complete`` is False.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status != UploadSession.STATUS_ACTIVE:
+            raise ChunkError('Upload is no longer active.', session.received_bytes, status=409)
+        if offset != session.received_bytes:
+            raise ChunkError('Unexpected offset.', session.received_bytes, status=409)
+
+        expected = min(session.chunk_size, session.total_size - session.received_bytes)
+        if len(data) != expected:
+            raise ChunkError(f'Chunk must be {expected} bytes.', session.received_bytes)
+        if hashlib.sha256(data).hexdigest() != (checksum or '').lower():
+            raise ChunkError('Chunk checksum mismatch.', session.received_bytes)
+
+        path = spool_path(session)
+        with open(path, 'r+b') as spool:
+            # Truncate any partial write left by an interrupted earlier attempt
+            spool.truncate(offset)
+            spool.seek(offset)
+            spool.write(data)
+
+        session.received_bytes = offset + len(data)
+        session.save(update_fields=['received_bytes', 'updated_at'])
+
+    if complete and session.received_bytes == session.total_size:
+        complete_session(session)
+    return session
+
+
+def _duplicate(student, document_type, title):
+    # The forms leave student out, so they cannot check unique_together themselves
+    return Document.objects.filter(student=student, document_type=document_type, title=title).exists()
+
+
+def complete_session(session):
+    """
+    Hand the assembled spool file to the regular upload form and create the
+    Document atomically. Returns the form so callers can report validation errors.
+    """
+    path = spool_path(session)
+    form_class = AdminDocumentUploadForm if session.uploaded_by.is_admin() else DocumentUploadForm
+    session.status = UploadSession.STATUS_FAILED
+    try:
+        with open(path, 'rb') as spool:
+            uploaded = UploadedFile(
+                file=spool,
+                name=session.filename,
+                content_type=mimetypes.guess_type(session.filename)[0] or 'application/octet-stream',
+                size=session.total_size,
+            )
+            form = form_class(
+                {'document_type': session.document_type, 'title': session.title},
+                {'file': uploaded},
+                student=session.student,
+                uploaded_by=session.uploaded_by,
+            )
+            try:
+                with transaction.atomic():
+                    if form.is_valid() and _duplicate(session.student, session.document_type, session.title):
+                        form.add_error('title', DUPLICATE_TITLE)
+                    if form.is_valid():
+                        session.document = form.save()
+                        session.status = UploadSession.STATUS_COMPLETE
+            except IntegrityError:
+                # Same type and title committed by another request since the check
+                session.document = None
+                form.add_error('title', DUPLICATE_TITLE)
+    finally:
+        session.save(update_fields=['document', 'status', 'updated_at'])
+        discard_spool(session)
+    session.form = form
+    return form
+
+
+def discard_spool(session):
+    try:
+        os.remove(spool_path(session))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,127 @@
+"""
+Conditional and partial delivery of locally stored documents.
+
+Responses carry an ETag built from the stored SHA-256 and a Last-Modified
+from the row, so a repeat view answers ``If-None-Match``/``If-Modified-Since``
+with 304 before the file is opened. Single ``Range`` requests (what PDF
+viewers use to fetch pages progressively) get a 206 with just those bytes;
+``If-Range`` falls back to the full file when the validator no longer
+matches. When a front-end server sends the file (X-Accel-Redirect /
+X-Sendfile) it handles ranges itself.
+"""
+import re
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import serve_local_file
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def document_etag(document):
+    if document.sha256:
+        return f'"{document.sha256}"'
+    return None
+
+
+def document_last_modified(document):
+    stamp = document.updated_at or document.uploaded_at
+    return int(stamp.timestamp()) if stamp else None
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single satisfiable byte range,
+    None to ignore the header, or False if it cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Malformed or multi-range: serve the whole file instead
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return etag is not None and if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and last_modified is not None and last_modified <= since
+
+
+def _stream(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_document(request, document, as_attachment=True):
+    """Respond with a locally stored document, honouring conditional and Range headers."""
+    etag = document_etag(document)
+    last_modified = document_last_modified(document)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _with_validators(not_modified, etag, last_modified)
+
+    filename = document.filename()
+    content_type = document.content_type or None
+    range_header = request.headers.get('Range')
+    sendfile = getattr(settings, 'DOCUMENT_SENDFILE_BACKEND', '')
+    if range_header and not sendfile and request.method == 'GET' and _if_range_matches(request, etag, last_modified):
+        path = document.file.path
+        size = document.file.size
+        byte_range = parse_range(range_header, size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return _with_validators(response, etag, last_modified)
+        if byte_range is not None:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _stream(path, start, end - start + 1),
+                status=206,
+                content_type=content_type or 'application/octet-stream',
+            )
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            return _with_validators(response, etag, last_modified)
+
+    response = serve_local_file(document.file, filename, as_attachment=as_attachment, content_type=content_type)
+    return _with_validators(response, etag, last_modified)
+
+
+def _with_validators(response, etag, last_modified):
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Browsers may keep the copy but must revalidate, which costs a 304
+    response['Cache-Control'] = 'private, no-cache'
+    return response
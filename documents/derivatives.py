@@ -0,0 +1,414 @@
+"""
+Preview derivatives for documents and student photos.
+
+Every new image upload gets a small WebP thumbnail and every PDF gets a raster
+of its first page, stored next to the original as ``<dir>/thumbs/<name>.webp``.
+Rendering is CPU-bound, so it runs in a process pool after the upload commits;
+the upload is copied to a local work file once the row has committed.
+
+PDF rendering uses pypdfium2 when it is installed; without it PDFs simply get
+no thumbnail.
+
+When DOCUMENT_PDF_OPTIMIZE is on and pikepdf is installed, uploaded PDFs are
+also rewritten in the same pool: embedded images larger than the quality
+budget are downscaled and re-encoded as JPEG, and the file is linearized for
+fast web view. The optimized file replaces the original (its size before is
+kept in ``original_size_bytes``) only if it is smaller, or barely larger but
+newly linearized. The thumbnail of such a PDF is rendered after that
+verdict, from whichever file is kept.
+"""
+import importlib.util
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, UnsupportedOperation
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+_pool = None
+
+
+def thumbnails_enabled():
+    return getattr(settings, 'DOCUMENT_THUMBNAILS', True)
+
+
+def pdf_optimization_enabled():
+    return (
+        getattr(settings, 'DOCUMENT_PDF_OPTIMIZE', False)
+        and importlib.util.find_spec('pikepdf') is not None
+    )
+
+
+def get_pool():
+    """Lazily start the shared process pool (None when DERIVATIVE_WORKERS is 0: render inline)."""
+    global _pool
+    workers = getattr(settings, 'DERIVATIVE_WORKERS', 2)
+    if workers <= 0:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def thumbnail_name(name):
+    """documents/a/PAN/scan.pdf -> documents/a/PAN/thumbs/scan.webp"""
+    directory, basename = os.path.split(name)
+    return f'{directory}/thumbs/{os.path.splitext(basename)[0]}.webp'
+
+
+def render_thumbnail(path, filename, size=THUMBNAIL_SIZE):
+    """
+    Render a WebP thumbnail for the file at ``path`` and return its bytes, or None
+    if the type is not supported. Runs in a worker process; touches no Django state.
+    """
+    from PIL import Image, ImageOps
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.pdf':
+        try:
+            import pypdfium2
+        except ImportError:
+            return None
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            page = pdf[0]
+            scale = size[0] / page.get_width()
+            image = page.render(scale=max(scale, 0.1)).to_pil()
+        finally:
+            pdf.close()
+    elif ext in IMAGE_EXTENSIONS:
+        image = Image.open(path)
+        image = ImageOps.exif_transpose(image)
+    else:
+        return None
+
+    image.thumbnail(size)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    out = BytesIO()
+    image.save(out, 'WEBP', quality=70, method=4)
+    return out.getvalue()
+
+
+def _render_from_work_file(path, filename):
+    try:
+        return render_thumbnail(path, filename)
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def work_dir():
+    return getattr(
+        settings, 'DOCUMENT_DERIVATIVE_WORK_DIR', os.path.join(tempfile.gettempdir(), 'mbbs_derivatives')
+    )
+
+
+def copy_to_work_file(uploaded):
+    """Copy an upload to a private temp file the render worker can read after the request."""
+    os.makedirs(work_dir(), exist_ok=True)
+    path = os.path.join(work_dir(), uuid.uuid4().hex)
+    if hasattr(uploaded, 'temporary_file_path') and os.path.exists(uploaded.temporary_file_path()):
+        shutil.copyfile(uploaded.temporary_file_path(), path)
+    else:
+        with open(path, 'wb') as work:
+            for chunk in uploaded.chunks():
+                work.write(chunk)
+        try:
+            uploaded.seek(0)
+        except UnsupportedOperation:
+            # Streamed remote files can only be read once
+            pass
+    return path
+
+
+def schedule_document(document, source=None):
+    """
+    Once the current transaction commits, queue the background stages for a
+    freshly stored document: PDF optimization (once per upload) and the thumbnail.
+
+    The work file is copied from ``source`` (the upload, if still open) or from
+    storage inside the commit callback, so a failed save or a rollback leaves
+    nothing behind in the work directory.
+    """
+    from django.core.files import File
+
+    from .models import Document
+
+    if document.storage_state != Document.STORAGE_READY or not document.file:
+        # Spooled uploads are handled once the transfer has stored the file
+        return
+    filename = document.original_filename or document.file.name
+    optimize = (
+        filename.lower().endswith('.pdf') and document.original_size_bytes is None and pdf_optimization_enabled()
+    )
+    # A document that kept its thumbnail (same bytes re-uploaded) needs no new one
+    thumbnail = thumbnails_enabled() and not document.thumbnail
+    if not (optimize or thumbnail):
+        return
+    name = document.file.name
+    storage = document.file.storage
+
+    def start():
+        try:
+            if source is not None and not source.closed:
+                work_path = copy_to_work_file(source)
+            else:
+                with storage.open(name, 'rb') as stored:
+                    work_path = copy_to_work_file(File(stored))
+        except Exception as e:
+            logger.warning('Derivatives skipped: document=%s error=%s', document.pk, e)
+            return
+        if not optimize:
+            schedule(Document, document.pk, 'file', 'thumbnail', work_path, filename, name)
+            return
+        render = None
+        if thumbnail:
+            # The preview waits for the optimizer's verdict so it shows the file that is kept
+            render = (work_path, filename, name)
+            work_path = work_path + '.pdf'
+            shutil.copyfile(render[0], work_path)
+        schedule_pdf_optimization(document.pk, document.sha256, work_path, render)
+
+    transaction.on_commit(start)
+
+
+def schedule(model, pk, source_field, target_field, work_path, filename, source_name=None):
+    """
+    After the current transaction commits, render the thumbnail in the process pool
+    and store it next to the original file of ``model`` row ``pk``. With
+    ``source_name``, the thumbnail is only kept if the row still has that file.
+    """
+    def submit():
+        pool = get_pool()
+        if pool is None:
+            try:
+                _store(model, pk, source_field, target_field, _render_from_work_file(work_path, filename), source_name)
+            except Exception as e:
+                logger.warning('Thumbnail failed: %s pk=%s error=%s', model.__name__, pk, e)
+            return
+        future = pool.submit(_render_from_work_file, work_path, filename)
+        future.add_done_callback(
+            lambda f: _store_from_future(model, pk, source_field, target_field, f, source_name)
+        )
+
+    transaction.on_commit(submit)
+
+
+def _store_from_future(model, pk, source_field, target_field, future, source_name=None):
+    # Runs in the pool's result thread: it needs its own database connection
+    close_old_connections()
+    try:
+        _store(model, pk, source_field, target_field, future.result(), source_name)
+    except Exception as e:
+        logger.warning('Thumbnail failed: %s pk=%s error=%s', model.__name__, pk, e)
+    finally:
+        close_old_connections()
+
+
+def _store(model, pk, source_field, target_field, data, source_name=None):
+    from django.db.models import Q
+
+    from .tombstones import bury
+
+    if not data:
+        return
+    row = model.objects.filter(pk=pk).values(source_field).first()
+    if not row or not row[source_field] or (source_name and row[source_field] != source_name):
+        # Deleted, or given another file while we were rendering
+        return
+    # Rows sharing a deduplicated file share its thumbnail too
+    name = (
+        model.objects.filter(**{source_field: row[source_field]})
+        .exclude(**{f'{target_field}__isnull': True})
+        .exclude(**{target_field: ''})
+        .values_list(target_field, flat=True)
+        .first()
+    )
+    storage = model._meta.get_field(target_field).storage
+    created = not name
+    if created:
+        name = storage.save(thumbnail_name(row[source_field]), ContentFile(data))
+    updated = (
+        model.objects.filter(pk=pk, **{source_field: row[source_field]})
+        .filter(Q(**{f'{target_field}__isnull': True}) | Q(**{target_field: ''}))
+        .update(**{target_field: name})
+    )
+    if created and not updated:
+        # The row changed after we looked: nobody will ever point at this copy
+        bury(storage, [name])
+
+
+def optimize_pdf(path, max_dimension, jpeg_quality):
+    """
+    Recompress oversized images in the PDF at ``path`` and linearize it.
+    Returns (optimized_path, original_size, optimized_size), or None when the
+    result is not worth keeping. Runs in a worker process; consumes ``path``.
+    """
+    import pikepdf
+
+    out_path = path + '.optimized'
+    try:
+        original_size = os.path.getsize(path)
+        with pikepdf.open(path) as pdf:
+            was_linearized = pdf.is_linearized
+            seen = set()
+            for page in pdf.pages:
+                for _, image in page.images.items():
+                    if image.objgen in seen:
+                        continue
+                    seen.add(image.objgen)
+                    _recompress_image(image, max_dimension, jpeg_quality)
+            pdf.save(
+                out_path,
+                linearize=True,
+                compress_streams=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                deterministic_id=True,
+            )
+    finally:
+        os.remove(path)
+
+    optimized_size = os.path.getsize(out_path)
+    if optimized_size < original_size or (not was_linearized and optimized_size <= original_size * 1.05):
+        return out_path, original_size, optimized_size
+    os.remove(out_path)
+    return None
+
+
+def _recompress_image(image, max_dimension, jpeg_quality):
+    import pikepdf
+    from PIL import Image
+
+    if '/SMask' in image or '/Mask' in image or image.get('/ImageMask', False):
+        # Transparency and stencil masks don't survive a JPEG round trip
+        return
+    try:
+        pil = pikepdf.PdfImage(image).as_pil_image()
+    except Exception:
+        return
+    raw_size = len(image.read_raw_bytes())
+    if max(pil.size) <= max_dimension and image.get('/Filter') == pikepdf.Name.DCTDecode:
+        return
+
+    if pil.mode not in ('RGB', 'L'):
+        pil = pil.convert('RGB')
+    pil.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    out = BytesIO()
+    pil.save(out, 'JPEG', quality=jpeg_quality, optimize=True, progressive=True)
+    data = out.getvalue()
+    if len(data) >= raw_size:
+        return
+    image.write(data, filter=pikepdf.Name.DCTDecode)
+    image.Width, image.Height = pil.size
+    image.ColorSpace = pikepdf.Name.DeviceGray if pil.mode == 'L' else pikepdf.Name.DeviceRGB
+    image.BitsPerComponent = 8
+    for key in ('/DecodeParms', '/Decode'):
+        if key in image:
+            del image[key]
+
+
+def schedule_pdf_optimization(document_id, sha256, work_path, render=None):
+    """
+    After the current transaction commits, optimize the PDF in the process pool.
+    ``render`` is an optional ``(work_path, filename, stored_name)`` for the
+    thumbnail: it is rendered from that copy if the original is kept; a
+    replaced file gets its thumbnail from the optimized save instead.
+    """
+    max_dimension = getattr(settings, 'DOCUMENT_PDF_MAX_IMAGE_DIMENSION', 2000)
+    jpeg_quality = getattr(settings, 'DOCUMENT_PDF_JPEG_QUALITY', 75)
+
+    def submit():
+        pool = get_pool()
+        if pool is None:
+            try:
+                result = optimize_pdf(work_path, max_dimension, jpeg_quality)
+            except Exception as e:
+                logger.warning('PDF optimization failed: document=%s error=%s', document_id, e)
+                result = None
+            _finish_optimization(document_id, sha256, result, render)
+            return
+        future = pool.submit(optimize_pdf, work_path, max_dimension, jpeg_quality)
+        future.add_done_callback(lambda f: _store_optimized_from_future(document_id, sha256, f, render))
+
+    transaction.on_commit(submit)
+
+
+def _store_optimized_from_future(document_id, sha256, future, render=None):
+    close_old_connections()
+    try:
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning('PDF optimization failed: document=%s error=%s', document_id, e)
+            result = None
+        _finish_optimization(document_id, sha256, result, render)
+    finally:
+        close_old_connections()
+
+
+def _finish_optimization(document_id, sha256, result, render):
+    from .models import Document
+
+    replaced = False
+    try:
+        replaced = _store_optimized_pdf(document_id, sha256, result)
+    except Exception as e:
+        logger.warning('PDF optimization failed: document=%s error=%s', document_id, e)
+    if render is None:
+        return
+    work_path, filename, stored_name = render
+    if replaced:
+        os.remove(work_path)
+    else:
+        schedule(Document, document_id, 'file', 'thumbnail', work_path, filename, stored_name)
+
+
+def _store_optimized_pdf(document_id, sha256, result):
+    """Replace the document's file with the optimized PDF; True if it did."""
+    from django.core.files import File
+
+    from .models import Document
+
+    if result is None:
+        return False
+    out_path, original_size, optimized_size = result
+    try:
+        document = Document.objects.filter(pk=document_id, sha256=sha256).first()
+        if document is None:
+            # Deleted or replaced while we were working
+            return False
+        with open(out_path, 'rb') as f:
+            document.file = File(f, name=document.original_filename)
+            document.original_size_bytes = original_size
+            document._pdf_optimized = True
+            document.save()
+        logger.info('PDF optimized: document=%s %s -> %s bytes', document_id, original_size, optimized_size)
+        return True
+    finally:
+        try:
+            os.remove(out_path)
+        except FileNotFoundError:
+            pass
+
+
+def generate_now(instance, source_field, target_field):
+    """Render and store a thumbnail synchronously from storage (used by the backfill command)."""
+    source = getattr(instance, source_field)
+    with source.open('rb'):
+        work_path = copy_to_work_file(source)
+    data = _render_from_work_file(work_path, source.name)
+    _store(type(instance), instance.pk, source_field, target_field, data)
+    return bool(data)
@@ -0,0 +1,294 @@
+"""
+Two-phase direct-to-storage uploads.
+
+1. The app issues a short-lived signed ticket bound to the student, the uploader,
+   the document type, a storage key, the allowed formats and the size limit
+   (``issue_ticket``).
+2. The browser sends the bytes straight to storage using the signed fields in the
+   ticket: Cloudinary's upload API in production, or the local stand-in endpoint
+   (``documents:direct_upload_local``) when Cloudinary is not configured.
+3. The browser posts the storage result to the commit endpoint, which verifies it
+   (``verify_upload``), reads the stored object back once to check its signature
+   and size and hash it (``inspect_upload``), and creates the Document row through
+   the same deduplication and thumbnail steps as the other upload paths.
+
+A ticket is good for one upload and one commit: its storage key is unique, the
+local endpoint refuses a key that already exists, and the commit refuses a key
+that a Document, a blob or a pending deletion already refers to.
+"""
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+
+from . import blobs, derivatives, resilience
+from .models import Document, StorageTombstone, StoredBlob, document_upload_path
+from .storage import backend as storage_backend
+from .tombstones import bury
+from .upload_handlers import content_matches, max_upload_size, read_head, size_error
+from .utils import compute_file_metadata
+
+TICKET_SALT = 'documents.direct_upload.ticket'
+LOCAL_RESULT_SALT = 'documents.direct_upload.local_result'
+ALLOWED_EXTENSIONS = ['pdf', 'jpg', 'jpeg', 'png']
+
+
+class DirectUploadError(Exception):
+    """Raised when a ticket or an upload result cannot be trusted."""
+
+
+def get_backend():
+    """Return 'cloudinary' or 'local' depending on settings (follows MEDIA_STORAGE_BACKEND by default)."""
+    return getattr(settings, 'DOCUMENT_DIRECT_UPLOAD_BACKEND', '') or storage_backend()
+
+
+def ticket_max_age():
+    return getattr(settings, 'DOCUMENT_DIRECT_UPLOAD_TICKET_MAX_AGE', 300)
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+def _allowed_formats(ext):
+    """Formats storage may accept for a file named with ``ext`` (jpg and jpeg are the same)."""
+    return ['jpg', 'jpeg'] if ext in ('jpg', 'jpeg') else [ext]
+
+
+def _storage():
+    return Document._meta.get_field('file').storage
+
+
+def _delivery_type():
+    # Cloudinary delivery type of document files ('authenticated': no public address)
+    return getattr(_storage(), 'DELIVERY_TYPE', 'upload')
+
+
+def build_storage_name(student, document_type, filename):
+    """Build a unique storage key for the upload (mirrors document_upload_path)."""
+    stem, ext = os.path.splitext(os.path.basename(filename))
+    probe = Document(student=student, document_type=document_type)
+    name = document_upload_path(probe, f'{stem[:80]}_{uuid.uuid4().hex[:8]}{ext.lower()}')
+    storage = _storage()
+    # Cloudinary storages store names with the MEDIA prefix as the public id
+    if hasattr(storage, '_prepend_prefix'):
+        name = storage._prepend_prefix(name)
+    return name
+
+
+def issue_ticket(student, uploaded_by, document_type, title, filename):
+    """
+    Validate the requested upload and return the ticket plus everything the browser
+    needs to send the file straight to storage.
+    """
+    valid_types = dict(Document.DOCUMENT_TYPE_CHOICES)
+    if document_type not in valid_types:
+        raise DirectUploadError(f'Unknown document type: {document_type}')
+    ext = _extension(filename)
+    if ext not in ALLOWED_EXTENSIONS:
+        raise DirectUploadError(f'Unsupported file extension: {ext}. Allowed: pdf, jpg, jpeg, png')
+    title = (title or '')[:255]
+    if Document.objects.filter(student=student, document_type=document_type, title=title).exists():
+        raise DirectUploadError('A document with this type and title already exists.')
+
+    name = build_storage_name(student, document_type, filename)
+    payload = {
+        'student': student.pk,
+        'uploaded_by': uploaded_by.pk,
+        'document_type': document_type,
+        'title': title,
+        'name': name,
+        'filename': os.path.basename(filename)[:255],
+        'allowed_formats': _allowed_formats(ext),
+        'max_size': max_upload_size(),
+    }
+    ticket = signing.dumps(payload, salt=TICKET_SALT)
+
+    if get_backend() == 'cloudinary':
+        import cloudinary
+        import cloudinary.utils
+        from cloudinary_storage import app_settings
+
+        params = {
+            'public_id': name,
+            'timestamp': int(time.time()),
+            'tags': app_settings.MEDIA_TAG,
+            'allowed_formats': ','.join(payload['allowed_formats']),
+            'type': _delivery_type(),
+        }
+        fields = cloudinary.utils.sign_request(params, {})
+        upload_url = cloudinary.utils.cloudinary_api_url('upload', resource_type='raw')
+    else:
+        fields = {'ticket': ticket}
+        upload_url = reverse('documents:direct_upload_local')
+
+    return {
+        'ticket': ticket,
+        'upload_url': upload_url,
+        'fields': fields,
+        'max_size': payload['max_size'],
+        'expires_in': ticket_max_age(),
+    }
+
+
+def read_ticket(ticket):
+    """Return the ticket payload or raise DirectUploadError if forged or expired."""
+    try:
+        return signing.loads(ticket, salt=TICKET_SALT, max_age=ticket_max_age())
+    except signing.SignatureExpired:
+        raise DirectUploadError('Upload ticket has expired.')
+    except signing.BadSignature:
+        raise DirectUploadError('Invalid upload ticket.')
+
+
+def sign_local_result(name, version):
+    return signing.Signer(salt=LOCAL_RESULT_SALT).signature(f'{name}:{version}')
+
+
+def _check_size(size, payload):
+    if size > payload['max_size']:
+        raise DirectUploadError(size_error())
+
+
+def _check_content(head, payload):
+    ext = _extension(payload['filename'])
+    if ext not in payload['allowed_formats'] or not content_matches(ext, head):
+        raise DirectUploadError('File content does not match its extension.')
+
+
+def store_local_upload(ticket, uploaded_file):
+    """
+    Local stand-in for the storage provider's upload API.
+    Saves the bytes under the ticket's storage key and returns a Cloudinary-shaped result.
+    """
+    payload = read_ticket(ticket)
+    if getattr(uploaded_file, 'upload_error', None):
+        raise DirectUploadError(uploaded_file.upload_error)
+    _check_size(uploaded_file.size, payload)
+    _check_content(read_head(uploaded_file), payload)
+    storage = _storage()
+    if storage.exists(payload['name']):
+        raise DirectUploadError('This upload ticket has already been used.')
+    name = storage.save(payload['name'], uploaded_file)
+    if name != payload['name']:
+        # A concurrent post with the same ticket stored first; don't keep a suffixed copy
+        storage.delete(name)
+        raise DirectUploadError('This upload ticket has already been used.')
+    version = int(time.time())
+    return {
+        'public_id': name,
+        'version': version,
+        'signature': sign_local_result(name, version),
+        'bytes': uploaded_file.size,
+    }
+
+
+def verify_upload(payload, result):
+    """
+    Check that the storage result belongs to the ticket and that the object exists.
+    Returns the stored file size in bytes.
+    """
+    name = result.get('public_id', '')
+    version = str(result.get('version', ''))
+    signature = result.get('signature', '')
+    if name != payload['name']:
+        raise DirectUploadError('Upload does not match the ticket.')
+
+    if get_backend() == 'cloudinary':
+        import cloudinary.api
+        import cloudinary.utils
+
+        if not cloudinary.utils.verify_api_response_signature(name, version, signature):
+            raise DirectUploadError('Invalid storage signature.')
+        try:
+            resource = resilience.guarded(
+                'resource', cloudinary.api.resource, name,
+                resource_type='raw', type=_delivery_type(), timeout=resilience.timeout(),
+            )
+        except resilience.StorageUnavailable:
+            raise DirectUploadError('Storage is temporarily unavailable. Please try again shortly.')
+        except Exception:
+            raise DirectUploadError('Uploaded file was not found in storage.')
+        size = int(resource.get('bytes') or 0)
+    else:
+        if not constant_time_compare(signature, sign_local_result(name, version)):
+            raise DirectUploadError('Invalid storage signature.')
+        storage = _storage()
+        if not storage.exists(name):
+            raise DirectUploadError('Uploaded file was not found in storage.')
+        size = storage.size(name)
+
+    if size > payload['max_size']:
+        _storage().delete(name)
+        raise DirectUploadError(size_error())
+    return size
+
+
+def ticket_used(name):
+    """True once a commit has consumed (or rejected) the upload stored under ``name``."""
+    return (
+        Document.objects.filter(file=name).exists()
+        or StoredBlob.objects.filter(name=name).exists()
+        or StorageTombstone.objects.filter(name=name).exists()
+    )
+
+
+def inspect_upload(payload):
+    """
+    Copy the stored object to a local work file and check it against the ticket.
+    Returns its metadata; a rejected object is queued for deletion.
+    """
+    name = payload['name']
+    try:
+        with _storage().open(name, 'rb') as stored:
+            work_path = derivatives.copy_to_work_file(File(stored))
+    except resilience.StorageUnavailable:
+        raise DirectUploadError('Storage is temporarily unavailable. Please try again shortly.')
+    try:
+        with open(work_path, 'rb') as f:
+            head = read_head(f)
+            metadata = compute_file_metadata(File(f, name=payload['filename']))
+        _check_size(metadata['size_bytes'], payload)
+        _check_content(head, payload)
+    except DirectUploadError:
+        bury(_storage(), [name])
+        raise
+    finally:
+        os.remove(work_path)
+    return metadata
+
+
+def commit_upload(payload, result):
+    """Create the Document row for a verified direct upload."""
+    verify_upload(payload, result)
+    if ticket_used(payload['name']):
+        raise DirectUploadError('This upload ticket has already been used.')
+    metadata = inspect_upload(payload)
+    document = Document(
+        student_id=payload['student'],
+        uploaded_by_id=payload['uploaded_by'],
+        document_type=payload['document_type'],
+        title=payload['title'],
+        **metadata,
+    )
+    # Assigning the stored name marks the file as committed, so save() does not re-upload it
+    document.file = payload['name']
+    try:
+        with transaction.atomic():
+            if blobs.dedup_enabled():
+                blobs.adopt_stored_file(document, payload['name'])
+            document.save()
+    except IntegrityError:
+        # Same type and title committed meanwhile: drop the upload unless that
+        # commit was this ticket's own and uses it
+        if not ticket_used(payload['name']):
+            bury(_storage(), [payload['name']])
+        raise
+    derivatives.schedule_document(document)
+    return document
@@ -2,9 +2,33 @@
 Forms for Document Upload
 """
 from django import forms
+from django.conf import settings
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit, HTML
 from .models import Document
+from .upload_handlers import DOCUMENT_EXTENSIONS, content_matches, max_upload_size, read_head, size_error
+
+
+def validate_document_file(file):
+    """Shared checks for uploaded document files"""
+    if file:
+        # Rejected while streaming by StreamingValidationUploadHandler
+        if getattr(file, 'upload_error', None):
+            raise forms.ValidationError(file.upload_error)
+
+        # Check extension
+        ext = file.name.split('.')[-1].lower()
+        if ext not in DOCUMENT_EXTENSIONS:
+            raise forms.ValidationError(f'Unsupported file extension: {ext}. Allowed: {", ".join(DOCUMENT_EXTENSIONS)}')
+
+        # Check size (DOCUMENT_UPLOAD_MAX_SIZE)
+        if file.size > max_upload_size():
+            raise forms.ValidationError(size_error())
+
+        # Check the content: chunked and batch uploads never went through the streaming handler
+        if not content_matches(ext, read_head(file)):
+            raise forms.ValidationError('File content does not match its extension.')
+    return file
 
 
 class DocumentUploadForm(forms.ModelForm):
@@ -33,17 +57,7 @@ class DocumentUploadForm(forms.ModelForm):
         )
 
     def clean_file(self):
-        file = self.cleaned_data.get('file')
-        if file:
-            # Check extension
-            ext = file.name.split('.')[-1].lower()
-            if ext not in ['pdf', 'jpg', 'jpeg', 'png']:
-                raise forms.ValidationError(f'Unsupported file extension: {ext}. Allowed: pdf, jpg, jpeg, png')
-            
-            # Check size (10MB)
-            if file.size > 10 * 1024 * 1024:
-                raise forms.ValidationError('File size too large. Max 10MB.')
-        return file
+        return validate_document_file(self.cleaned_data.get('file'))
     
     def save(self, commit=True):
         instance = super().save(commit=False)
@@ -83,17 +97,7 @@ class AdminDocumentUploadForm(forms.ModelForm):
         )
 
     def clean_file(self):
-        file = self.cleaned_data.get('file')
-        if file:
-            # Check extension
-            ext = file.name.split('.')[-1].lower()
-            if ext not in ['pdf', 'jpg', 'jpeg', 'png']:
-                raise forms.ValidationError(f'Unsupported file extension: {ext}. Allowed: pdf, jpg, jpeg, png')
-            
-            # Check size (10MB)
-            if file.size > 10 * 1024 * 1024:
-                raise forms.ValidationError('File size too large. Max 10MB.')
-        return file
+        return validate_document_file(self.cleaned_data.get('file'))
     
     def save(self, commit=True):
         instance = super().save(commit=False)
@@ -104,3 +108,83 @@ class AdminDocumentUploadForm(forms.ModelForm):
         if commit:
             instance.save()
         return instance
+
+
+class BatchDocumentForm(forms.Form):
+    """
+    One row of a batch upload: a file with its own type and title.
+    Rows left without a file are skipped.
+    """
+    document_type = forms.ChoiceField(
+        choices=Document.DOCUMENT_TYPE_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-select form-control'})
+    )
+    file = forms.FileField(
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.pdf,.jpg,.jpeg,.png'})
+    )
+    title = forms.CharField(
+        max_length=255,
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Optional: Document title'})
+    )
+
+    def clean_file(self):
+        return validate_document_file(self.cleaned_data.get('file'))
+
+
+class BaseBatchUploadFormSet(forms.BaseFormSet):
+    """
+    Validates a batch as a whole: at least one file, and no two documents
+    (in the batch or already stored) with the same type and title.
+    One row is offered per document type.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.student = kwargs.pop('student')
+        super().__init__(*args, **kwargs)
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        choices = Document.DOCUMENT_TYPE_CHOICES
+        kwargs['initial'] = {'document_type': choices[index % len(choices)][0]}
+        return kwargs
+
+    def filled_forms(self):
+        return [form for form in self.forms if form.has_changed() and form.cleaned_data.get('file')]
+
+    def clean(self):
+        if any(self.errors):
+            return
+        filled = self.filled_forms()
+        if not filled:
+            raise forms.ValidationError('Choose at least one file to upload.')
+
+        keys = [(form.cleaned_data['document_type'], form.cleaned_data['title']) for form in filled]
+        if len(set(keys)) != len(keys):
+            raise forms.ValidationError('Each file needs a different document type or title.')
+        existing = set(
+            Document.objects.filter(
+                student=self.student,
+                document_type__in={document_type for document_type, _ in keys},
+            ).values_list('document_type', 'title')
+        )
+        for form, key in zip(filled, keys):
+            if key in existing:
+                form.add_error('title', 'A document of this type with this title already exists.')
+
+    def items(self):
+        """``(document_type, title, file)`` for every filled row"""
+        return [
+            (form.cleaned_data['document_type'], form.cleaned_data['title'], form.cleaned_data['file'])
+            for form in self.filled_forms()
+        ]
+
+
+BatchUploadFormSet = forms.formset_factory(
+    BatchDocumentForm,
+    formset=BaseBatchUploadFormSet,
+    extra=len(Document.DOCUMENT_TYPE_CHOICES),
+    max_num=getattr(settings, 'DOCUMENT_BATCH_UPLOAD_MAX_FILES', 10),
+    validate_max=True,
+    absolute_max=getattr(settings, 'DOCUMENT_BATCH_UPLOAD_MAX_FILES', 10),
+)
@@ -0,0 +1,60 @@
+"""
+Backfill size, content type, checksum and original filename for existing Documents.
+
+Usage:
+    python manage.py backfill_document_metadata --batch-size 200
+"""
+from django.core.management.base import BaseCommand
+
+from documents.models import Document
+from documents.utils import compute_file_metadata
+
+METADATA_FIELDS = ['size_bytes', 'content_type', 'sha256', 'original_filename']
+
+
+class Command(BaseCommand):
+    help = 'Populate stored file metadata for Documents uploaded before it was captured.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute metadata even for rows that already have a checksum.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Document.objects.exclude(file='').exclude(file__isnull=True)
+        if not options['force']:
+            queryset = queryset.filter(sha256='')
+
+        last_pk = 0
+        updated = failed = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            changed = []
+            for document in batch:
+                try:
+                    with document.file.open('rb'):
+                        metadata = compute_file_metadata(document.file)
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'Document {document.pk}: could not read {document.file.name} ({e})')
+                    continue
+                # The storage name is the best we have for legacy rows
+                if document.original_filename:
+                    metadata.pop('original_filename')
+                for field, value in metadata.items():
+                    setattr(document, field, value)
+                changed.append(document)
+
+            Document.objects.bulk_update(changed, METADATA_FIELDS)
+            updated += len(changed)
+            self.stdout.write(f'Processed up to id {last_pk}: {updated} updated, {failed} failed')
+
+        self.stdout.write(self.style.SUCCESS(f'Done. {updated} documents updated, {failed} failed.'))
@@ -0,0 +1,101 @@
+"""
+Benchmark resumable chunked uploads against whole-file POSTs over a flaky link.
+
+The link drops the connection after an exponentially distributed number of bytes
+(mean --mean-bytes-between-drops). A whole-file POST restarts from zero after
+every drop; a chunked upload only resends the chunk that was in flight.
+Chunked uploads run through the real session/chunk code inside a transaction
+that is rolled back. The final hand-off to storage is skipped, so nothing is
+uploaded and no data is left behind.
+
+Usage:
+    python manage.py bench_chunked_upload --uploads 20 --size 9437184
+"""
+import hashlib
+import os
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from documents import chunked_upload
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Simulate interrupted transfers and compare retransmitted bytes for chunked vs whole-file uploads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=10)
+        parser.add_argument('--size', type=int, default=9 * 1024 * 1024, help='File size in bytes')
+        parser.add_argument('--mean-bytes-between-drops', type=int, default=4 * 1024 * 1024)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        size = options['size']
+        mean_gap = options['mean_bytes_between_drops']
+
+        def bytes_until_drop():
+            return int(rng.expovariate(1 / mean_gap))
+
+        # Whole-file POST: every drop restarts the transfer
+        whole_sent = 0
+        for _ in range(options['uploads']):
+            while True:
+                gap = bytes_until_drop()
+                if gap >= size:
+                    whole_sent += size
+                    break
+                whole_sent += gap
+
+        chunk_sent = 0
+        server_seconds = 0.0
+        chunk_requests = 0
+        try:
+            with transaction.atomic():
+                user = get_user_model().objects.create_user(
+                    username=f'bench-{os.getpid()}', password=None, role='STUDENT'
+                )
+                for i in range(options['uploads']):
+                    payload = os.urandom(size)
+                    session = chunked_upload.start_session(
+                        user, user, 'ADDITIONAL', f'bench-{i}', 'scan.pdf', size
+                    )
+                    remaining_link = bytes_until_drop()
+                    offset = 0
+                    while offset < size:
+                        data = payload[offset:offset + session.chunk_size]
+                        if remaining_link < len(data):
+                            # Connection dropped mid-chunk: the partial chunk is wasted
+                            chunk_sent += remaining_link
+                            remaining_link = bytes_until_drop()
+                            continue
+                        remaining_link -= len(data)
+                        chunk_sent += len(data)
+                        chunk_requests += 1
+                        started = time.perf_counter()
+                        session = chunked_upload.receive_chunk(
+                            session.id, offset, data, hashlib.sha256(data).hexdigest(), complete=False
+                        )
+                        server_seconds += time.perf_counter() - started
+                        offset = session.received_bytes
+                    chunked_upload.discard_spool(session)
+                raise Rollback
+        except Rollback:
+            pass
+
+        total = size * options['uploads']
+        self.stdout.write(f'Uploads: {options["uploads"]} x {size} bytes, mean bytes between drops: {mean_gap}')
+        self.stdout.write(
+            f'Whole-file POST: {whole_sent} bytes sent ({(whole_sent - total) / total:.1%} retransmitted)'
+        )
+        self.stdout.write(
+            f'Chunked upload:  {chunk_sent} bytes sent ({(chunk_sent - total) / total:.1%} retransmitted), '
+            f'{chunk_requests} chunk requests, {server_seconds:.2f}s server time'
+        )
@@ -0,0 +1,125 @@
+"""
+Load-test the student upload view with and without background storage transfers.
+
+Storage is replaced by a local directory that sleeps --storage-latency-ms per
+save, standing in for the WAN hop to Cloudinary, so nothing leaves the machine.
+Every upload carries fresh random bytes and deduplication is off for the run,
+so each synchronous upload really pays the storage latency.
+The run happens in a throwaway database: a test database is created and
+migrated first and destroyed afterwards, so transfer rows, tombstones and
+the temporary student never touch the configured database. SQLite serialises
+writers, so there the uploads run one at a time (concurrent posts would only
+measure lock waits).
+
+Usage:
+    python manage.py bench_upload_latency --uploads 200 --concurrency 8 --storage-latency-ms 400
+"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from documents import transfers
+from documents.models import Document
+
+
+class SlowStorage(FileSystemStorage):
+    def __init__(self, latency, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    def _save(self, name, content):
+        time.sleep(self.latency)
+        return super()._save(name, content)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Measure p50/p95 upload latency for synchronous vs spooled (background) storage transfers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--size', type=int, default=512 * 1024, help='File size in bytes')
+        parser.add_argument('--storage-latency-ms', type=int, default=400)
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if connection.vendor == 'sqlite' and concurrency > 1:
+            self.stderr.write('SQLite allows one writer at a time: running with --concurrency 1.')
+            concurrency = 1
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options, concurrency)
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+
+    def run(self, options, concurrency):
+        workdir = tempfile.mkdtemp(prefix='bench_upload_latency_')
+        field = Document._meta.get_field('file')
+        original_storage = field.storage
+        field.storage = SlowStorage(options['storage_latency_ms'] / 1000, location=os.path.join(workdir, 'storage'))
+        user = get_user_model().objects.create_user(username=f'bench-{uuid.uuid4().hex[:8]}', password=None, role='STUDENT')
+
+        def upload(i):
+            client = Client()
+            client.force_login(user)
+            # Unique bytes per upload: identical ones would be deduplicated and never reach storage
+            payload = b'%PDF-1.4\n' + os.urandom(options['size'])
+            started = time.perf_counter()
+            response = client.post(reverse('documents:upload'), {
+                'document_type': 'ADDITIONAL',
+                'title': f'bench-{i}-{uuid.uuid4().hex[:6]}',
+                'file': SimpleUploadedFile('scan.pdf', payload, content_type='application/pdf'),
+            })
+            elapsed = time.perf_counter() - started
+            if connection.vendor != 'sqlite':
+                # Worker threads each opened a connection; the shared in-memory test db must stay open
+                connection.close()
+            if response.status_code != 302:
+                raise RuntimeError(f'Upload failed with status {response.status_code}')
+            return elapsed
+
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=['testserver'],
+                DOCUMENT_TRANSFER_SPOOL_DIR=os.path.join(workdir, 'spool'),
+                DOCUMENT_DEDUPLICATION=False,
+                # Previews would go to the real preview storage, and are not what is measured
+                DOCUMENT_THUMBNAILS=False,
+            ):
+                for label, async_mode in (('synchronous', False), ('background', True)):
+                    with override_settings(DOCUMENT_ASYNC_STORAGE_TRANSFER=async_mode):
+                        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                            latencies = list(pool.map(upload, range(options['uploads'])))
+                    self.stdout.write(
+                        f'{label:>11}: p50 {statistics.median(latencies) * 1000:.0f} ms, '
+                        f'p95 {percentile(latencies, 95) * 1000:.0f} ms over {len(latencies)} uploads'
+                    )
+                started = time.perf_counter()
+                drained = 0
+                while True:
+                    counts = transfers.process_pending(limit=500)
+                    if not any(counts.values()):
+                        break
+                    drained += counts['ready']
+                self.stdout.write(f'Worker drained {drained} spooled uploads in {time.perf_counter() - started:.1f}s')
+        finally:
+            field.storage = original_storage
+            shutil.rmtree(workdir, ignore_errors=True)
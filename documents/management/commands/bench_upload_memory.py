@@ -0,0 +1,105 @@
+"""
+Measure worker memory for concurrent multipart uploads.
+
+Runs --parallel uploads at once through Django's MultiPartParser, each fed by a
+generated request body so the benchmark itself holds no payload in memory, and
+reports the peak Python heap (tracemalloc) for the streaming handler against
+Django's default in-memory handler.
+
+Usage:
+    python manage.py bench_upload_memory --parallel 50 --size 9437184
+"""
+import threading
+import tracemalloc
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.core.management.base import BaseCommand
+from django.http.multipartparser import MultiPartParser
+from django.test import override_settings
+
+from documents.upload_handlers import StreamingValidationUploadHandler
+
+BOUNDARY = 'benchboundary'
+
+
+class GeneratedBody:
+    """File-like multipart body that produces a PDF payload of ``size`` bytes on demand."""
+
+    def __init__(self, size):
+        header = (
+            f'--{BOUNDARY}\r\n'
+            'Content-Disposition: form-data; name="file"; filename="scan.pdf"\r\n'
+            'Content-Type: application/pdf\r\n\r\n%PDF-1.4\n'
+        ).encode()
+        footer = f'\r\n--{BOUNDARY}--\r\n'.encode()
+        self.parts = [(header, len(header)), (None, size - 9), (footer, len(footer))]
+        self.length = len(header) + size - 9 + len(footer)
+
+    def read(self, size=-1):
+        out = bytearray()
+        while self.parts and (size < 0 or len(out) < size):
+            data, remaining = self.parts[0]
+            want = remaining if size < 0 else min(remaining, size - len(out))
+            out += data[:want] if data is not None else b'x' * want
+            if data is not None:
+                data = data[want:]
+            remaining -= want
+            if remaining:
+                self.parts[0] = (data, remaining)
+            else:
+                self.parts.pop(0)
+        return bytes(out)
+
+
+class Command(BaseCommand):
+    help = 'Compare peak memory of concurrent uploads for the streaming and in-memory upload handlers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parallel', type=int, default=50)
+        parser.add_argument('--size', type=int, default=9 * 1024 * 1024, help='File size in bytes')
+
+    def run(self, handler_factories, parallel, size):
+        barrier = threading.Barrier(parallel)
+        results = []
+
+        def upload():
+            body = GeneratedBody(size)
+            meta = {
+                'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+                'CONTENT_LENGTH': str(body.length),
+            }
+            handlers = [factory(None) for factory in handler_factories]
+            barrier.wait()
+            post, files = MultiPartParser(meta, body, handlers).parse()
+            results.append(files['file'])
+
+        tracemalloc.start()
+        threads = [threading.Thread(target=upload) for _ in range(parallel)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        for uploaded in results:
+            uploaded.close()
+        return peak
+
+    def handle(self, *args, **options):
+        parallel, size = options['parallel'], options['size']
+        mib = 1024 * 1024
+        self.stdout.write(f'{parallel} parallel uploads of {size / mib:.1f} MiB')
+
+        streaming = self.run([StreamingValidationUploadHandler], parallel, size)
+        self.stdout.write(
+            f'Streaming handler: peak {streaming / mib:.1f} MiB total, '
+            f'{streaming / parallel / 1024:.0f} KiB per upload'
+        )
+
+        # Django's defaults with the previous FILE_UPLOAD_MAX_MEMORY_SIZE of 10MB
+        with override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=10 * mib):
+            in_memory = self.run([MemoryFileUploadHandler, TemporaryFileUploadHandler], parallel, size)
+        self.stdout.write(
+            f'In-memory handler: peak {in_memory / mib:.1f} MiB total, '
+            f'{in_memory / parallel / 1024:.0f} KiB per upload'
+        )
@@ -0,0 +1,22 @@
+"""
+Report how much storage content-addressed deduplication saves.
+
+Usage:
+    python manage.py document_dedup_report
+"""
+from django.core.management.base import BaseCommand
+
+from documents.blobs import dedup_stats
+
+
+class Command(BaseCommand):
+    help = 'Show logical vs stored bytes and the deduplication ratio for documents.'
+
+    def handle(self, *args, **options):
+        stats = dedup_stats()
+        mib = 1024 * 1024
+        self.stdout.write(f"Documents:        {stats['documents']}")
+        self.stdout.write(f"Stored blobs:     {stats['blobs']} ({stats['blob_references']} references)")
+        self.stdout.write(f"Logical size:     {stats['logical_bytes'] / mib:.2f} MiB")
+        self.stdout.write(f"Stored size:      {stats['physical_bytes'] / mib:.2f} MiB")
+        self.stdout.write(f"Dedup ratio:      {stats['dedup_ratio']:.2f}x")
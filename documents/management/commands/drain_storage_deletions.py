@@ -0,0 +1,32 @@
+"""
+Delete files queued as StorageTombstones, in bulk.
+
+Usage:
+    python manage.py drain_storage_deletions            # one pass
+    python manage.py drain_storage_deletions --loop     # keep polling (worker process)
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents import tombstones
+
+
+class Command(BaseCommand):
+    help = 'Delete orphaned stored files, up to 100 per storage API call, retrying failures.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Tombstones claimed per pass')
+        parser.add_argument('--batch-size', type=int, default=tombstones.DELETE_BATCH_LIMIT)
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new tombstones')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            counts = tombstones.drain(limit=options['limit'], batch_size=options['batch_size'])
+            if any(counts.values()):
+                self.stdout.write(f"deleted={counts['deleted']} retry={counts['retry']} failed={counts['failed']}")
+            if not options['loop']:
+                break
+            if not any(counts.values()):
+                time.sleep(options['interval'])
@@ -0,0 +1,51 @@
+"""
+Render preview thumbnails for documents that don't have one yet.
+(Student photo avatars: see ``normalize_student_photos``.)
+
+Usage:
+    python manage.py generate_thumbnails --batch-size 100
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from documents.derivatives import generate_now
+from documents.models import Document
+
+TARGETS = [
+    (Document, 'file', 'thumbnail'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Backfill WebP thumbnails for existing documents.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, source_field, target_field in TARGETS:
+            queryset = (
+                model.objects.exclude(**{source_field: ''})
+                .exclude(**{f'{source_field}__isnull': True})
+                .filter(Q(**{f'{target_field}__isnull': True}) | Q(**{target_field: ''}))
+            )
+            last_pk = 0
+            created = skipped = failed = 0
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                for instance in batch:
+                    try:
+                        if generate_now(instance, source_field, target_field):
+                            created += 1
+                        else:
+                            skipped += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'{model.__name__} {instance.pk}: {e}')
+            self.stdout.write(self.style.SUCCESS(
+                f'{model.__name__}: {created} thumbnails created, {skipped} unsupported, {failed} failed.'
+            ))
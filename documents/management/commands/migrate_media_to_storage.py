@@ -0,0 +1,84 @@
+"""
+Upload legacy files from MEDIA_ROOT to the configured storages and repoint
+their Document/StudentProfile rows, in parallel and resumably.
+
+Usage:
+    python manage.py migrate_media_to_storage                        # documents/ and student_photos/
+    python manage.py migrate_media_to_storage --workers 8 --batch-size 500
+    python manage.py migrate_media_to_storage --restart              # ignore the checkpoint
+    python manage.py migrate_media_to_storage --delete-local         # remove local copies once repointed
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from documents import media_migration
+
+
+class Command(BaseCommand):
+    help = 'Migrate local media files into remote storage with a thread pool, checkpointing progress.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=None, help='Media tree to read (default: MEDIA_ROOT)')
+        parser.add_argument('--prefix', action='append', help='Subdirectory to migrate (repeatable)')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent uploads')
+        parser.add_argument('--batch-size', type=int, default=500, help='Files per batch / checkpoint')
+        parser.add_argument('--checkpoint', default=None, help='Checkpoint file (default: MEDIA_ROOT/.media_migration.json)')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+        parser.add_argument('--delete-local', action='store_true', help='Delete local files once their rows are repointed')
+
+    def handle(self, *args, **options):
+        source = str(options['source'] or settings.MEDIA_ROOT)
+        prefixes = options['prefix'] or ['documents', 'student_photos']
+        checkpoint = options['checkpoint'] or media_migration.default_checkpoint_path()
+
+        cols, in_place = media_migration.split_columns(source, media_migration.columns())
+        for column in in_place:
+            self.stdout.write(f'Skipping {column.model.__name__}.{column.field}: its storage is {source} already')
+        if not cols:
+            raise CommandError('Nothing to migrate: every file column is stored in the source tree.')
+
+        # More threads than the storage bulkhead allows would only be rejected
+        workers = max(1, min(options['workers'], getattr(settings, 'STORAGE_MAX_CONCURRENCY', options['workers'])))
+        if workers < options['workers']:
+            self.stdout.write(f'Using {workers} workers (STORAGE_MAX_CONCURRENCY)')
+
+        after = '' if options['restart'] else media_migration.load_checkpoint(checkpoint)
+        if after:
+            self.stdout.write(f'Resuming after {after}')
+
+        started = time.monotonic()
+        totals = {'migrated': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+        stalled = False
+        names = media_migration.walk(source, prefixes, after)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for batch in media_migration.batches(names, options['batch_size']):
+                result = media_migration.migrate_batch(
+                    batch, source, cols, pool, delete_local=options['delete_local']
+                )
+                for name, error in result.failed.items():
+                    self.stderr.write(f'Failed: {name} ({error})')
+                totals['migrated'] += result.migrated
+                totals['skipped'] += result.skipped
+                totals['failed'] += len(result.failed)
+                totals['bytes'] += result.bytes
+
+                # The checkpoint never moves past a failed file, so a re-run retries it
+                if not stalled:
+                    done = media_migration.checkpoint_after(batch, result.failed)
+                    if done:
+                        media_migration.save_checkpoint(checkpoint, done)
+                    stalled = bool(result.failed)
+                self.stdout.write(self._progress(totals, started, batch[-1]))
+
+        self.stdout.write(self.style.SUCCESS('Done. ' + self._progress(totals, started)))
+
+    def _progress(self, totals, started, last=None):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        line = (
+            f"{totals['migrated']} migrated, {totals['skipped']} unreferenced, {totals['failed']} failed; "
+            f"{totals['migrated'] / elapsed:.1f} files/s, {totals['bytes'] / elapsed / 1024 / 1024:.2f} MiB/s"
+        )
+        return f'{line} (at {last})' if last else line
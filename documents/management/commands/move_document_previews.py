@@ -0,0 +1,55 @@
+"""
+Move document thumbnails written to MEDIA_ROOT into DOCUMENT_PRIVATE_ROOT.
+
+Local-mode thumbnails used to be stored in the public media tree, where they
+were reachable at guessable /media/ URLs. New thumbnails go to private
+storage; this moves the existing ones and removes the public copies.
+
+Usage:
+    python manage.py move_document_previews --batch-size 200
+"""
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.models import Document
+from documents.storage import PrivateFileSystemStorage, is_local
+
+
+class Command(BaseCommand):
+    help = 'Move local document thumbnails from MEDIA_ROOT into private storage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if not is_local():
+            raise CommandError('Only needed when MEDIA_STORAGE_BACKEND is "local".')
+        public = FileSystemStorage()
+        private = PrivateFileSystemStorage()
+        queryset = Document.objects.exclude(thumbnail='').exclude(thumbnail__isnull=True)
+        last_pk = 0
+        moved = missing = 0
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'thumbnail')[:options['batch_size']]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            for pk, name in rows:
+                if private.exists(name):
+                    continue
+                if not public.exists(name):
+                    missing += 1
+                    continue
+                with public.open(name, 'rb') as f:
+                    new_name = private.save(name, File(f))
+                if new_name != name:
+                    Document.objects.filter(pk=pk).update(thumbnail=new_name)
+                public.delete(name)
+                moved += 1
+            self.stdout.write(f'Processed up to id {last_pk}: {moved} moved')
+
+        self.stdout.write(self.style.SUCCESS(f'Done. {moved} thumbnails moved, {missing} not found.'))
@@ -0,0 +1,34 @@
+"""
+Push spooled uploads to document storage.
+
+Usage:
+    python manage.py process_storage_transfers            # one pass
+    python manage.py process_storage_transfers --loop     # keep polling (worker process)
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents import transfers
+
+
+class Command(BaseCommand):
+    help = 'Transfer PENDING documents from the local spool to storage with bounded concurrency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent transfers (default: DOCUMENT_TRANSFER_MAX_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new uploads')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            counts = transfers.process_pending(max_workers=options['workers'], limit=options['batch_size'])
+            if any(counts.values()):
+                self.stdout.write(
+                    f"ready={counts['ready']} retry={counts['retry']} failed={counts['failed']} skipped={counts['skipped']}"
+                )
+            if not options['loop']:
+                break
+            if not any(counts.values()):
+                time.sleep(options['interval'])
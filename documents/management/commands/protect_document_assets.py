@@ -0,0 +1,69 @@
+"""
+Move document files and previews on Cloudinary from the public ``upload``
+delivery type to ``authenticated``.
+
+Documents used to be stored with the default type, so their /raw/upload/
+addresses kept working for anyone who had one, whatever the signed links
+said. New uploads are stored as ``authenticated`` (see documents.storage);
+this renames the existing assets in place (same public id, new type). Run it
+right after deploying: until an asset is moved, the app looks for it under
+the new type and cannot read it.
+
+Assets Cloudinary does not find under ``upload`` (already moved, or shared
+with a document processed earlier) are counted as skipped, so the command
+can be re-run after an interruption.
+
+Usage:
+    python manage.py protect_document_assets --batch-size 200
+"""
+import cloudinary.exceptions
+import cloudinary.uploader
+from django.core.management.base import BaseCommand, CommandError
+
+from documents import resilience
+from documents.models import Document
+from documents.signed_urls import cloudinary_asset
+from documents.storage import ResilientRawMediaCloudinaryStorage, is_local
+
+
+class Command(BaseCommand):
+    help = 'Make existing Cloudinary document files and previews private (authenticated delivery).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if is_local():
+            raise CommandError('Only needed when MEDIA_STORAGE_BACKEND is "cloudinary".')
+        storage = ResilientRawMediaCloudinaryStorage()
+        to_type = storage.DELIVERY_TYPE
+        queryset = Document.objects.exclude(file='').only('pk', 'file', 'thumbnail', 'original_filename')
+        last_pk = 0
+        moved = skipped = failed = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            assets = set()
+            for document in batch:
+                for field_file in (document.file, document.thumbnail):
+                    if field_file:
+                        public_id, _, resource_type = cloudinary_asset(storage, field_file.name)
+                        assets.add((public_id, resource_type))
+            for public_id, resource_type in sorted(assets):
+                try:
+                    resilience.guarded(
+                        'rename', cloudinary.uploader.rename, public_id, public_id,
+                        resource_type=resource_type, type='upload', to_type=to_type,
+                        invalidate=True, timeout=resilience.timeout(),
+                    )
+                    moved += 1
+                except cloudinary.exceptions.NotFound:
+                    skipped += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{public_id}: {e}')
+            self.stdout.write(f'Processed up to id {last_pk}: {moved} moved, {skipped} skipped, {failed} failed')
+
+        self.stdout.write(self.style.SUCCESS(f'Done. {moved} assets moved, {skipped} skipped, {failed} failed.'))
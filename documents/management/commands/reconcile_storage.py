@@ -0,0 +1,59 @@
+"""
+Find (and optionally repair) stored files no row references and rows whose
+file is missing from storage. Only the directories the app uploads into are
+compared; other files in MEDIA_ROOT or the Cloudinary account are left alone.
+
+Usage:
+    python manage.py reconcile_storage                                # report only
+    python manage.py reconcile_storage --repair --storage private     # queue orphans for deletion, detach missing files
+    python manage.py reconcile_storage --prefix documents/ --storage cloudinary_raw -v 2
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents import reconcile
+from documents.models import StorageTombstone
+
+
+class Command(BaseCommand):
+    help = 'Diff storage listings against database references with a paged merge join.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Queue orphans as tombstones and detach missing files')
+        parser.add_argument('--min-age-hours', type=float, default=24, help='Ignore orphans newer than this (uploads in flight)')
+        parser.add_argument('--prefix', default='', help='Only compare names starting with this prefix')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows/listing entries fetched per page')
+        parser.add_argument(
+            '--storage', action='append', choices=[key for key, _ in StorageTombstone.STORAGE_CHOICES],
+            help='Limit to one storage (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        if options['repair'] and not (options['storage'] or options['prefix']):
+            raise CommandError('--repair deletes files: name the scope with --storage and/or --prefix.')
+        verbose = options['verbosity'] >= 2
+
+        def report(kind, key, name, detail):
+            if verbose:
+                what = ', '.join(sorted(detail)) if kind == 'missing' else f'modified {detail:%Y-%m-%d %H:%M}'
+                self.stdout.write(f'{kind:8} {key}:{name} ({what})')
+
+        try:
+            results = reconcile.reconcile(
+                repair=options['repair'],
+                min_age=timedelta(hours=options['min_age_hours']),
+                prefix=options['prefix'],
+                batch_size=options['batch_size'],
+                keys=options['storage'],
+                report=report,
+            )
+        except reconcile.OrderingError as e:
+            raise CommandError(str(e))
+
+        action = 'queued for deletion' if options['repair'] else 'found'
+        for key, counts in results.items():
+            self.stdout.write(
+                f"{key}: {counts['orphans']} orphans {action}, {counts['missing']} missing files"
+                f"{' detached' if options['repair'] else ''}, {counts['young']} recent files skipped"
+            )
@@ -0,0 +1,180 @@
+"""
+Bulk migration of legacy files under MEDIA_ROOT into the configured storages.
+
+The media tree is walked in name order and handled in batches. For each batch
+the rows that still reference a local name are looked up, in one query per
+referencing column. The referenced files are uploaded concurrently to the
+storage of the field that points at them, and every column is rewritten
+with one ``UPDATE ... CASE`` statement. Files no row references are skipped.
+
+After each batch the last fully migrated name is written to a JSON
+checkpoint, so an interrupted run resumes where it stopped. Rows already
+pointing at a migrated name no longer match, so re-running without a
+checkpoint is safe too. It only costs the walk.
+"""
+import json
+import os
+import time
+from collections import namedtuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from .models import Document, StoredBlob
+from .reconcile import walk_sorted
+from .tombstones import storage_key
+
+Column = namedtuple('Column', 'model field storage')
+BatchResult = namedtuple('BatchResult', 'migrated skipped failed bytes')
+
+
+def columns():
+    """Every column that stores a file name, with the storage its files belong in."""
+    StudentProfile = apps.get_model('students', 'StudentProfile')
+    file_storage = Document._meta.get_field('file').storage
+    result = [
+        Column(Document, 'file', file_storage),
+        Column(StoredBlob, 'name', file_storage),
+        Column(Document, 'thumbnail', Document._meta.get_field('thumbnail').storage),
+    ]
+    for field in ('photo', 'photo_thumbnail', 'photo_avatar'):
+        result.append(Column(StudentProfile, field, StudentProfile._meta.get_field(field).storage))
+    return result
+
+
+def split_columns(source_root, cols):
+    """
+    (movable, in_place): columns whose storage is the source tree itself have
+    nothing to migrate to (e.g. photos while MEDIA_STORAGE_BACKEND is 'local').
+    """
+    source_root = os.path.realpath(source_root)
+    movable, in_place = [], []
+    for column in cols:
+        storage = column.storage
+        local = isinstance(storage, FileSystemStorage) and os.path.realpath(storage.location) == source_root
+        (in_place if local else movable).append(column)
+    return movable, in_place
+
+
+def walk(source_root, prefixes, after=''):
+    """Yield local names under ``prefixes`` in name order, starting after ``after``."""
+    for prefix in sorted(prefixes):
+        for name, _ in walk_sorted(source_root, prefix.strip('/')):
+            if name > after:
+                yield name
+
+
+def batches(names, size):
+    batch = []
+    for name in names:
+        batch.append(name)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def referencing(cols, names):
+    """{storage key: (storage, {name: [Column, ...]})} for names some row still references."""
+    targets = {}
+    for column in cols:
+        found = (
+            column.model._default_manager.filter(**{f'{column.field}__in': names})
+            .values_list(column.field, flat=True).distinct()
+        )
+        key = storage_key(column.storage)
+        for name in found:
+            targets.setdefault(key, (column.storage, {}))[1].setdefault(name, []).append(column)
+    return targets
+
+
+def _upload(storage, source_root, name):
+    path = os.path.join(source_root, name)
+    with open(path, 'rb') as f:
+        new_name = storage.save(name, File(f, name=os.path.basename(name)))
+    return new_name, os.path.getsize(path)
+
+
+def _rewrite(renames):
+    """Point every column at the new names: one UPDATE per column."""
+    by_column = {}
+    for column, old, new in renames:
+        by_column.setdefault(column, {})[old] = new
+    with transaction.atomic():
+        for column, mapping in by_column.items():
+            field = column.field
+            output_field = column.model._meta.get_field(field)
+            column.model._default_manager.filter(**{f'{field}__in': list(mapping)}).update(**{
+                field: Case(
+                    *[When(**{field: old}, then=Value(new)) for old, new in mapping.items()],
+                    default=F(field),
+                    output_field=output_field,
+                )
+            })
+
+
+def migrate_batch(names, source_root, cols, pool, delete_local=False):
+    """
+    Upload the referenced files among ``names`` and rewrite their rows.
+    Returns a BatchResult; ``failed`` is {name: error}.
+    """
+    targets = referencing(cols, names)
+    jobs = {}
+    for storage, referenced in targets.values():
+        for name, name_columns in referenced.items():
+            jobs[pool.submit(_upload, storage, source_root, name)] = (name, name_columns)
+
+    renames, failed, uploaded, total_bytes = [], {}, set(), 0
+    for future, (name, name_columns) in jobs.items():
+        try:
+            new_name, size = future.result()
+        except Exception as e:
+            failed[name] = str(e)
+            continue
+        total_bytes += size
+        uploaded.add(name)
+        renames.extend((column, name, new_name) for column in name_columns)
+    if renames:
+        _rewrite(renames)
+
+    if delete_local:
+        for name in uploaded - set(failed):
+            try:
+                os.remove(os.path.join(source_root, name))
+            except OSError:
+                pass
+    skipped = len(set(names) - uploaded - set(failed))
+    return BatchResult(len(uploaded), skipped, failed, total_bytes)
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f).get('after', '')
+    except FileNotFoundError:
+        return ''
+
+
+def save_checkpoint(path, after):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'after': after, 'saved_at': time.time()}, f)
+    os.replace(tmp, path)
+
+
+def checkpoint_after(batch, failed):
+    """The last name of ``batch`` before its first failure ('' keeps the old checkpoint)."""
+    if not failed:
+        return batch[-1]
+    first_failed = min(failed)
+    done = [name for name in batch if name < first_failed]
+    return done[-1] if done else ''
+
+
+def default_checkpoint_path():
+    return os.path.join(str(settings.MEDIA_ROOT), '.media_migration.json')
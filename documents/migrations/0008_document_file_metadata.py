@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_alter_document_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_type',
+            field=models.CharField(blank=True, db_index=True, help_text='MIME type of the uploaded file', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='original_filename',
+            field=models.CharField(blank=True, help_text='Filename as uploaded by the user', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 checksum of the file contents', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='size_bytes',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, help_text='File size in bytes, captured at upload time', null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='next_transfer_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='spool_path',
+            field=models.CharField(blank=True, help_text='Local spool file awaiting transfer to storage', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='storage_state',
+            field=models.CharField(choices=[('READY', 'Ready'), ('PENDING', 'Pending transfer'), ('TRANSFERRING', 'Transferring'), ('FAILED', 'Transfer failed')], db_index=True, default='READY', help_text='Whether the file has reached remote storage yet', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='transfer_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='transfer_error',
+            field=models.TextField(blank=True),
+        ),
+    ]
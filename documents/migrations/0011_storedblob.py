@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_document_storage_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(help_text='Storage name of the blob', max_length=500)),
+                ('size_bytes', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Stored blob',
+                'verbose_name_plural': 'Stored blobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='blob',
+            field=models.ForeignKey(blank=True, help_text='Shared content-addressed copy of the file, if deduplicated', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='documents', to='documents.storedblob'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:07
+
+import cloudinary_storage.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_storedblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='thumbnail',
+            field=models.FileField(blank=True, editable=False, help_text='Small WebP preview (image thumbnail or first PDF page)', null=True, storage=cloudinary_storage.storage.RawMediaCloudinaryStorage(), upload_to=''),
+        ),
+    ]
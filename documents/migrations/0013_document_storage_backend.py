@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:16
+
+import django.core.validators
+import documents.models
+import documents.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_document_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=models.FileField(blank=True, help_text='Upload document file (PDF, JPG, PNG)', null=True, storage=documents.storage.document_storage, upload_to=documents.models.document_upload_path, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['pdf', 'jpg', 'jpeg', 'png'])]),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='thumbnail',
+            field=models.FileField(blank=True, editable=False, help_text='Small WebP preview (image thumbnail or first PDF page)', null=True, storage=documents.storage.document_preview_storage, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_document_storage_backend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='original_size_bytes',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Size as uploaded, if the stored file was optimized afterwards', null=True),
+        ),
+    ]
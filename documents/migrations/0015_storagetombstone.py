@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_document_original_size_bytes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('storage', models.CharField(choices=[('private', 'Local private files'), ('public', 'Local media files'), ('cloudinary_raw', 'Cloudinary (raw)'), ('cloudinary_image', 'Cloudinary (image)')], max_length=20)),
+                ('name', models.CharField(help_text='Storage name of the file to delete', max_length=500)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('claim', models.UUIDField(blank=True, help_text='Worker currently deleting this file', null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Storage tombstone',
+                'verbose_name_plural': 'Storage tombstones',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['next_attempt_at'], name='documents_s_next_at_8041bb_idx')],
+            },
+        ),
+    ]
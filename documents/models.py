@@ -1,22 +1,48 @@
 """
 Document Model for file uploads
 """
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 import os
-from cloudinary_storage.storage import RawMediaCloudinaryStorage
+import uuid
 from django.core.validators import FileExtensionValidator
 from cloudinary.models import CloudinaryField 
+from .storage import document_preview_storage, document_storage
+from .utils import LoadedFilesMixin, compute_file_metadata
+
+# Every document file (and its blob and thumbnail) is stored under this directory
+DOCUMENT_UPLOAD_ROOT = 'documents'
+
 
 def     document_upload_path(instance, filename):
     """
     Generate upload path for documents
     Format: documents/{student_username}/{document_type}/{filename}
     """
-    return f'documents/{instance.student.username}/{instance.document_type}/{filename}'
+    return f'{DOCUMENT_UPLOAD_ROOT}/{instance.student.username}/{instance.document_type}/{filename}'
+
+
+class StoredBlob(models.Model):
+    """
+    One stored copy of a file's bytes, keyed by SHA-256.
+    Documents with identical contents share a blob; ref_count tracks how many
+    Documents point at it so the stored file is deleted with the last one.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=500, help_text='Storage name of the blob')
+    size_bytes = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Stored blob'
+        verbose_name_plural = 'Stored blobs'
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
 
 
-class Document(models.Model):
+class Document(LoadedFilesMixin, models.Model):
     """
     Document Model
     Stores uploaded documents for students
@@ -28,6 +54,20 @@ class Document(models.Model):
         ('PAN', 'PAN Card'),
         ('ADDITIONAL', 'Additional Document'),
     ]
+
+    STORAGE_READY = 'READY'
+    STORAGE_PENDING = 'PENDING'
+    STORAGE_TRANSFERRING = 'TRANSFERRING'
+    STORAGE_FAILED = 'FAILED'
+    STORAGE_STATE_CHOICES = [
+        (STORAGE_READY, 'Ready'),
+        (STORAGE_PENDING, 'Pending transfer'),
+        (STORAGE_TRANSFERRING, 'Transferring'),
+        (STORAGE_FAILED, 'Transfer failed'),
+    ]
+    # Snapshotted on load so the signals can detect a replaced file, or a document
+    # moved to another student or type (for the profile counters), without a query
+    loaded_file_fields = ('file', 'thumbnail', 'blob', 'student', 'document_type')
     
     student = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -41,12 +81,70 @@ class Document(models.Model):
     )
     file = models.FileField(
         upload_to=document_upload_path,
-        storage=RawMediaCloudinaryStorage(),
+        storage=document_storage,
         blank=True,
         null=True,
         validators=[FileExtensionValidator(allowed_extensions=['pdf', 'jpg', 'jpeg', 'png'])],
         help_text='Upload document file (PDF, JPG, PNG)'
     )
+    size_bytes = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='File size in bytes, captured at upload time'
+    )
+    content_type = models.CharField(
+        max_length=100,
+        blank=True,
+        db_index=True,
+        help_text='MIME type of the uploaded file'
+    )
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text='SHA-256 checksum of the file contents'
+    )
+    original_filename = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text='Filename as uploaded by the user'
+    )
+    original_size_bytes = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        help_text='Size as uploaded, if the stored file was optimized afterwards'
+    )
+    thumbnail = models.FileField(
+        storage=document_preview_storage,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text='Small WebP preview (image thumbnail or first PDF page)'
+    )
+    blob = models.ForeignKey(
+        StoredBlob,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='documents',
+        help_text='Shared content-addressed copy of the file, if deduplicated'
+    )
+    storage_state = models.CharField(
+        max_length=12,
+        choices=STORAGE_STATE_CHOICES,
+        default=STORAGE_READY,
+        db_index=True,
+        help_text='Whether the file has reached remote storage yet'
+    )
+    spool_path = models.CharField(
+        max_length=500,
+        blank=True,
+        help_text='Local spool file awaiting transfer to storage'
+    )
+    transfer_attempts = models.PositiveSmallIntegerField(default=0)
+    next_transfer_at = models.DateTimeField(null=True, blank=True)
+    transfer_error = models.TextField(blank=True)
     title = models.CharField(
         max_length=255,
         blank=True,
@@ -71,20 +169,147 @@ class Document(models.Model):
     def __str__(self):
         return f"{self.student.username} - {self.get_document_type_display()}"
     
+    def save(self, *args, **kwargs):
+        """
+        Capture file metadata once, while a fresh upload is still local, then
+        either spool it for background transfer or store it deduplicated.
+        Thumbnails and PDF optimization run in the background once the row is committed.
+        """
+        if not (self.file and not self.file._committed):
+            return super().save(*args, **kwargs)
+
+        for field, value in compute_file_metadata(self.file.file).items():
+            setattr(self, field, value)
+        previous_thumbnail = self.thumbnail.name or None
+        self.thumbnail = None
+        if not getattr(self, '_pdf_optimized', False):
+            self.original_size_bytes = None
+        from . import blobs, derivatives, transfers
+        upload = self.file.file
+
+        if transfers.async_enabled():
+            # The spool file only outlives a failed insert if nothing removes it here
+            try:
+                with transaction.atomic():
+                    transfers.spool_document_file(self)
+                    super().save(*args, **kwargs)
+            except Exception:
+                transfers.discard_spool(self)
+                raise
+        elif blobs.dedup_enabled():
+            # Take the blob reference in the same transaction as the row itself
+            with transaction.atomic():
+                if blobs.attach_blob(self, self.file.file):
+                    # Same bytes as before, so the blob's thumbnail still fits
+                    self.thumbnail = previous_thumbnail
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+
+        derivatives.schedule_document(self, upload)
+    
     def filename(self):
         """Get filename from file path"""
+        if self.original_filename:
+            return self.original_filename
         if not self.file or not self.file.name:
             return ''
         return os.path.basename(self.file.name)
     
     def file_size(self):
-        """Get file size in KB"""
-        try:
-            size = self.file.size
-            return round(size / 1024, 2)  # Convert to KB
-        except:
+        """Get file size in KB from the stored size (never calls storage)"""
+        if self.size_bytes is None:
             return 0
+        return round(self.size_bytes / 1024, 2)  # Convert to KB
+    
+    def is_processing(self):
+        """True while the file is still on its way to remote storage"""
+        return self.storage_state in (self.STORAGE_PENDING, self.STORAGE_TRANSFERRING)
     
     def is_uploaded_by_admin(self):
         """Check if document was uploaded by admin"""
         return self.uploaded_by and self.uploaded_by.is_admin()
+
+
+class UploadSession(models.Model):
+    """
+    Resumable chunked upload in progress.
+    Chunks are appended to a spool file until received_bytes reaches total_size.
+    """
+    STATUS_ACTIVE = 'ACTIVE'
+    STATUS_COMPLETE = 'COMPLETE'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    student = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='started_upload_sessions'
+    )
+    document_type = models.CharField(max_length=20, choices=Document.DOCUMENT_TYPE_CHOICES)
+    title = models.CharField(max_length=255, blank=True)
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='upload_session'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.received_bytes}/{self.total_size} bytes)"
+
+
+class StorageTombstone(models.Model):
+    """
+    A stored file waiting to be deleted by ``drain_storage_deletions``.
+    Rows are written in the same transaction as the delete or replacement that
+    orphaned the file, so they only become visible once it commits.
+    """
+    STORAGE_PRIVATE = 'private'
+    STORAGE_PUBLIC = 'public'
+    STORAGE_CLOUDINARY_RAW = 'cloudinary_raw'
+    STORAGE_CLOUDINARY_IMAGE = 'cloudinary_image'
+    STORAGE_CHOICES = [
+        (STORAGE_PRIVATE, 'Local private files'),
+        (STORAGE_PUBLIC, 'Local media files'),
+        (STORAGE_CLOUDINARY_RAW, 'Cloudinary (raw)'),
+        (STORAGE_CLOUDINARY_IMAGE, 'Cloudinary (image)'),
+    ]
+
+    storage = models.CharField(max_length=20, choices=STORAGE_CHOICES)
+    name = models.CharField(max_length=500, help_text='Storage name of the file to delete')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    claim = models.UUIDField(null=True, blank=True, help_text='Worker currently deleting this file')
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['next_attempt_at'])]
+        verbose_name = 'Storage tombstone'
+        verbose_name_plural = 'Storage tombstones'
+
+    def __str__(self):
+        return f"{self.storage}:{self.name}"
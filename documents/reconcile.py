@@ -0,0 +1,315 @@
+"""
+Storage/database reconciliation.
+
+Every storage is listed in name order and compared against the names the
+database references in that storage, also read in name order, with a merge
+join. Both sides are paged (storage cursors, keyset pagination on the name),
+so memory stays bounded by the batch size however many files there are.
+
+Differences are:
+
+    orphan   a stored file no row references (and no tombstone has queued yet)
+    missing  a row referencing a file the storage does not have
+
+Only the directories the app writes to are compared: the ``upload_to`` root
+of each referencing field (DOCUMENT_UPLOAD_ROOT, STUDENT_PHOTO_ROOT), behind
+the storage's own prefix on Cloudinary. Anything else in MEDIA_ROOT or the
+Cloudinary account (legacy media, manual uploads, test files) is not ours
+to judge and never shows up as an orphan.
+
+``reconcile(repair=True)`` queues orphans older than ``min_age`` as
+StorageTombstones and detaches missing files from their rows with queryset
+updates (no signals, so nothing is queued for deletion). Repair needs an
+explicit scope (storages or a prefix).
+"""
+import heapq
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import cloudinary.search
+from cloudinary_storage.storage import MediaCloudinaryStorage
+from django.apps import apps
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Collate
+from django.utils import timezone
+
+from . import resilience
+from .models import DOCUMENT_UPLOAD_ROOT, Document, StorageTombstone, StoredBlob
+from .tombstones import bury, storage_key
+
+# Byte-order collations, so database order matches Python string order
+BINARY_COLLATIONS = {'postgresql': 'C', 'sqlite': 'BINARY', 'mysql': 'utf8mb4_bin'}
+
+# A model field whose values name files in one storage, all under ``root``
+Reference = namedtuple('Reference', 'label model field filters root')
+
+
+class OrderingError(Exception):
+    """A listing came back out of name order, so the merge join would be wrong."""
+
+
+def references():
+    from students.models import STUDENT_PHOTO_ROOT
+
+    StudentProfile = apps.get_model('students', 'StudentProfile')
+    return [
+        # Deduplicated documents point at StoredBlob.name instead
+        Reference(
+            'document', Document, 'file', {'blob__isnull': True, 'storage_state': Document.STORAGE_READY},
+            DOCUMENT_UPLOAD_ROOT,
+        ),
+        Reference('blob', StoredBlob, 'name', {}, DOCUMENT_UPLOAD_ROOT),
+        Reference('thumbnail', Document, 'thumbnail', {}, DOCUMENT_UPLOAD_ROOT),
+        Reference('photo', StudentProfile, 'photo', {}, STUDENT_PHOTO_ROOT),
+        Reference('photo_thumbnail', StudentProfile, 'photo_thumbnail', {}, STUDENT_PHOTO_ROOT),
+        Reference('photo_avatar', StudentProfile, 'photo_avatar', {}, STUDENT_PHOTO_ROOT),
+    ]
+
+
+def _field_storage(reference):
+    if reference.model is StoredBlob:
+        return Document._meta.get_field('file').storage
+    return reference.model._meta.get_field(reference.field).storage
+
+
+def storage_groups():
+    """{storage key: (storage, [Reference, ...])} for every storage in use."""
+    groups = {}
+    for reference in references():
+        storage = _field_storage(reference)
+        key = storage_key(storage)
+        groups.setdefault(key, (storage, []))[1].append(reference)
+    return groups
+
+
+def owned_prefixes(storage, refs):
+    """The directories of ``storage`` the app writes to, as stored name prefixes."""
+    prefixes = set()
+    for reference in refs:
+        root = f'{reference.root}/'
+        if isinstance(storage, MediaCloudinaryStorage):
+            root = storage._prepend_prefix(root)
+        prefixes.add(root)
+    return sorted(prefixes)
+
+
+def scopes(owned, prefix=''):
+    """
+    The prefixes to compare: the owned ones, narrowed to ``prefix`` if given.
+    A prefix outside every owned directory yields nothing.
+    """
+    result = []
+    for root in owned:
+        if root.startswith(prefix):
+            result.append(root)
+        elif prefix.startswith(root):
+            result.append(prefix)
+    return result
+
+
+def _sort_key(field):
+    collation = BINARY_COLLATIONS.get(connection.vendor)
+    return Collate(F(field), collation) if collation else F(field)
+
+
+def _keyset(queryset, field, batch_size):
+    """Yield distinct non-empty values of ``field`` in byte order, one page at a time."""
+    queryset = (
+        queryset.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+        .annotate(sort_name=_sort_key(field))
+        .order_by('sort_name')
+        .values_list('sort_name', flat=True)
+        .distinct()
+    )
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(sort_name__gt=last)
+        names = list(page[:batch_size])
+        if not names:
+            return
+        yield from names
+        last = names[-1]
+
+
+def referenced_names(reference, prefix, batch_size):
+    queryset = reference.model._default_manager.filter(**reference.filters)
+    if prefix:
+        queryset = queryset.filter(**{f'{reference.field}__startswith': prefix})
+    for name in _keyset(queryset, reference.field, batch_size):
+        yield name, reference.label
+
+
+def tombstoned_names(key, prefix, batch_size):
+    queryset = StorageTombstone.objects.filter(storage=key)
+    if prefix:
+        queryset = queryset.filter(name__startswith=prefix)
+    for name in _keyset(queryset, 'name', batch_size):
+        yield name, None
+
+
+def walk_sorted(root, relative=''):
+    """
+    Yield (name, modified) for files under ``root`` in byte order of their
+    '/'-joined names. Directories sort as 'name/' so 'a/b' comes after 'a-c'.
+    """
+    try:
+        entries = list(os.scandir(os.path.join(root, relative)))
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda entry: entry.name + ('/' if entry.is_dir() else ''))
+    for entry in entries:
+        name = f'{relative}/{entry.name}' if relative else entry.name
+        if entry.is_dir():
+            yield from walk_sorted(root, name)
+        else:
+            yield name, datetime.fromtimestamp(entry.stat().st_mtime, tz=dt_timezone.utc)
+
+
+def _local_listing(storage, prefix):
+    directory = os.path.dirname(prefix) if prefix else ''
+    for name, modified in walk_sorted(storage.location, directory):
+        if name.startswith(prefix):
+            yield name, modified
+
+
+def _cloudinary_listing(storage, prefix, batch_size):
+    expression = f'resource_type:{storage.RESOURCE_TYPE} AND type:{getattr(storage, "DELIVERY_TYPE", "upload")}'
+    if prefix:
+        expression += f' AND public_id:{prefix}*'
+    cursor = None
+    while True:
+        search = (
+            cloudinary.search.Search().expression(expression)
+            .sort_by('public_id', 'asc').max_results(min(batch_size, 500))
+        )
+        if cursor:
+            search = search.next_cursor(cursor)
+        result = resilience.guarded('search', search.execute, timeout=resilience.timeout())
+        for resource in result.get('resources', []):
+            created = datetime.fromisoformat(resource['created_at'].replace('Z', '+00:00'))
+            yield resource['public_id'], created
+        cursor = result.get('next_cursor')
+        if not cursor:
+            return
+
+
+def stored_names(storage, prefix='', batch_size=500):
+    """Yield (name, modified) for every file in ``storage``, in name order."""
+    if isinstance(storage, MediaCloudinaryStorage):
+        return _cloudinary_listing(storage, prefix, batch_size)
+    return _local_listing(storage, prefix)
+
+
+def _ordered(pairs, what):
+    last = None
+    for pair in pairs:
+        if last is not None and pair[0] < last:
+            raise OrderingError(f'{what} listing is not in name order: {pair[0]!r} after {last!r}')
+        last = pair[0]
+        yield pair
+
+
+def _grouped(pairs):
+    """Collapse consecutive (name, label) pairs into (name, {labels})."""
+    current, labels = None, set()
+    for name, label in pairs:
+        if name != current and current is not None:
+            yield current, labels
+            labels = set()
+        current = name
+        labels.add(label)
+    if current is not None:
+        yield current, labels
+
+
+def diff(stored, referenced):
+    """
+    Merge-join two name-ordered streams: ``stored`` of (name, modified) and
+    ``referenced`` of (name, {labels}), where a label of None marks a queued
+    tombstone. Yields ('orphan', name, modified) and ('missing', name, labels).
+    """
+    stored, referenced = iter(stored), iter(referenced)
+    file = next(stored, None)
+    ref = next(referenced, None)
+    while file is not None or ref is not None:
+        if ref is None or (file is not None and file[0] < ref[0]):
+            yield 'orphan', file[0], file[1]
+            file = next(stored, None)
+        elif file is None or ref[0] < file[0]:
+            labels = ref[1] - {None}
+            if labels:
+                yield 'missing', ref[0], labels
+            ref = next(referenced, None)
+        else:
+            file = next(stored, None)
+            ref = next(referenced, None)
+
+
+def _repair_missing(name, labels):
+    StudentProfile = apps.get_model('students', 'StudentProfile')
+    error = 'File missing from storage (found by reconcile_storage)'
+    if 'document' in labels:
+        Document.objects.filter(file=name, blob__isnull=True).update(
+            storage_state=Document.STORAGE_FAILED, transfer_error=error
+        )
+    if 'blob' in labels:
+        Document.objects.filter(blob__name=name).update(storage_state=Document.STORAGE_FAILED, transfer_error=error)
+    if 'thumbnail' in labels:
+        Document.objects.filter(thumbnail=name).update(thumbnail='')
+    if 'photo' in labels:
+        StudentProfile.objects.filter(photo=name).update(photo='', photo_width=None, photo_height=None)
+    for field in ('photo_thumbnail', 'photo_avatar'):
+        if field in labels:
+            StudentProfile.objects.filter(**{field: name}).update(**{field: ''})
+
+
+def reconcile(repair=False, min_age=timedelta(hours=24), prefix='', batch_size=1000, keys=None, report=None):
+    """
+    Compare every storage with the database, within the directories the app
+    owns (see ``owned_prefixes``). Returns
+    {storage key: {'orphans': n, 'missing': n, 'young': n}}; ``report(kind, key, name, detail)``
+    is called for each difference. Orphans newer than ``min_age`` may belong to
+    an upload whose row is not committed yet, so they are only counted.
+    ``repair`` requires ``keys`` or ``prefix``, so a bare call never deletes.
+    """
+    if repair and not (keys or prefix):
+        raise ValueError('Repair needs an explicit scope: storage keys or a prefix.')
+    cutoff = timezone.now() - min_age
+    results = {}
+    for key, (storage, refs) in storage_groups().items():
+        if keys and key not in keys:
+            continue
+        counts = results[key] = {'orphans': 0, 'missing': 0, 'young': 0}
+        for scope in scopes(owned_prefixes(storage, refs), prefix):
+            _reconcile_scope(key, storage, refs, scope, cutoff, counts, repair, batch_size, report)
+    return results
+
+
+def _reconcile_scope(key, storage, refs, prefix, cutoff, counts, repair, batch_size, report):
+    referenced = heapq.merge(
+        *(referenced_names(reference, prefix, batch_size) for reference in refs),
+        tombstoned_names(key, prefix, batch_size),
+        key=lambda pair: pair[0],
+    )
+    stored = _ordered(stored_names(storage, prefix, batch_size), key)
+    orphans = []
+    for kind, name, detail in diff(stored, _grouped(_ordered(referenced, 'database'))):
+        if kind == 'orphan' and detail > cutoff:
+            counts['young'] += 1
+            continue
+        counts['orphans' if kind == 'orphan' else 'missing'] += 1
+        if report:
+            report(kind, key, name, detail)
+        if not repair:
+            continue
+        if kind == 'missing':
+            _repair_missing(name, detail)
+        else:
+            orphans.append(name)
+            if len(orphans) >= batch_size:
+                bury(storage, orphans)
+                orphans = []
+    if repair and orphans:
+        bury(storage, orphans)
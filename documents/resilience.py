@@ -0,0 +1,312 @@
+"""
+Timeouts, retries, a circuit breaker and a bulkhead for remote storage calls.
+
+Every call to the storage provider goes through ``guarded``:
+
+* a per-operation timeout (STORAGE_TIMEOUT_SECONDS, or
+  STORAGE_UPLOAD_TIMEOUT_SECONDS for uploads) is passed to the HTTP client;
+* idempotent operations are retried on transient errors (connection
+  failures, timeouts, 5xx and rate limiting; see ``is_transient``) with
+  jittered exponential backoff (STORAGE_RETRY_ATTEMPTS, STORAGE_RETRY_BASE_DELAY);
+* after STORAGE_BREAKER_FAILURE_THRESHOLD consecutive transient failures the
+  circuit opens and calls fail immediately with StorageUnavailable for
+  STORAGE_BREAKER_RESET_SECONDS, after which one probe call is let through;
+* at most STORAGE_MAX_CONCURRENCY calls are in flight per process; callers
+  wait up to STORAGE_BULKHEAD_WAIT_SECONDS for a slot, then fail fast.
+
+So a slow provider costs a request a bounded wait instead of tying up every
+worker, and pages that never touch storage (login included) keep working.
+State and metrics are per process.
+"""
+import logging
+import random
+import re
+import threading
+import time
+
+import cloudinary.exceptions
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Provider answers that say the request was wrong, not that the provider is unhealthy
+_PERMANENT_ERRORS = (
+    FileNotFoundError,
+    cloudinary.exceptions.NotFound,
+    cloudinary.exceptions.BadRequest,
+    cloudinary.exceptions.AuthorizationRequired,
+    cloudinary.exceptions.NotAllowed,
+    cloudinary.exceptions.AlreadyExists,
+)
+
+# The Cloudinary client folds the HTTP status into the message, when it keeps it at all
+_CLOUDINARY_STATUS = re.compile(r'^Error (\d{3}) - |server response \((\d{3})\)|status code - (\d{3})')
+# ...and reports connection failures as a bare Error/GeneralError
+_CLOUDINARY_UNREACHABLE = re.compile(r'^(Socket error|Unexpected error)', re.IGNORECASE)
+
+
+class StorageUnavailable(OSError):
+    """The storage call was refused without contacting the provider."""
+
+
+def timeout():
+    return getattr(settings, 'STORAGE_TIMEOUT_SECONDS', 10)
+
+
+def upload_timeout():
+    return getattr(settings, 'STORAGE_UPLOAD_TIMEOUT_SECONDS', 60)
+
+
+def _transient_status(status):
+    return status >= 500 or status == 429
+
+
+def is_transient(error):
+    """
+    Whether ``error`` says the provider is struggling: a connection failure or
+    timeout, a 5xx, or rate limiting. Only these are retried and count
+    against the circuit breaker.
+    """
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and _transient_status(error.response.status_code)
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)):
+        return True
+    if isinstance(error, cloudinary.exceptions.RateLimited):
+        return True
+    if isinstance(error, cloudinary.exceptions.Error) and not isinstance(error, _PERMANENT_ERRORS):
+        match = _CLOUDINARY_STATUS.search(str(error))
+        if match:
+            return _transient_status(int(next(group for group in match.groups() if group)))
+        # Without a status, GeneralError means a 500/503 or no connection
+        return (
+            isinstance(error, cloudinary.exceptions.GeneralError)
+            or bool(_CLOUDINARY_UNREACHABLE.match(str(error)))
+        )
+    return False
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.opened_count = 0
+        self._probing = False
+        self._probe_owner = None
+
+    def _threshold(self):
+        return getattr(settings, 'STORAGE_BREAKER_FAILURE_THRESHOLD', 5)
+
+    def _reset_seconds(self):
+        return getattr(settings, 'STORAGE_BREAKER_RESET_SECONDS', 30)
+
+    def allow(self):
+        """True if a call may go ahead; in the half-open state only one probe at a time."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self._reset_seconds():
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+                logger.info('Storage circuit %s half-open: probing', self.name)
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+                self._probe_owner = threading.get_ident()
+            return True
+
+    def release_probe(self):
+        """
+        Give back a half-open probe that ended without a verdict (neither
+        success nor failure recorded), so the next call can probe instead.
+        Only the thread that took the probe can release it.
+        """
+        with self._lock:
+            if self._probing and self._probe_owner == threading.get_ident():
+                self._probing = False
+                self._probe_owner = None
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info('Storage circuit %s closed', self.name)
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self._threshold()):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.opened_count += 1
+                self._probing = False
+                logger.warning('Storage circuit %s open after %s failures', self.name, self.failures)
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self._reset_seconds() - (time.monotonic() - self.opened_at))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.opened_count,
+                'retry_in_seconds': retry_in,
+            }
+
+
+class Bulkhead:
+    """Caps concurrent storage calls in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.limit = getattr(settings, 'STORAGE_MAX_CONCURRENCY', 8)
+        self._slots = threading.BoundedSemaphore(self.limit)
+        self.in_flight = 0
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=getattr(settings, 'STORAGE_BULKHEAD_WAIT_SECONDS', 2)):
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def snapshot(self):
+        return {'limit': self.limit, 'in_flight': self.in_flight}
+
+
+class Metrics:
+    """Per-operation call counts and latency histogram."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.operations = {}
+
+    def _op(self, operation):
+        return self.operations.setdefault(operation, {
+            'calls': 0, 'errors': 0, 'retries': 0, 'rejected': 0,
+            'total_seconds': 0.0, 'max_seconds': 0.0,
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        })
+
+    def observe(self, operation, seconds, error=False):
+        with self._lock:
+            op = self._op(operation)
+            op['calls'] += 1
+            op['errors'] += int(error)
+            op['total_seconds'] += seconds
+            op['max_seconds'] = max(op['max_seconds'], seconds)
+            index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+            op['buckets'][index] += 1
+
+    def count(self, operation, field):
+        with self._lock:
+            self._op(operation)[field] += 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for operation, op in self.operations.items():
+                labels = [f'le_{bound}' for bound in LATENCY_BUCKETS] + ['le_inf']
+                result[operation] = {
+                    **{k: v for k, v in op.items() if k != 'buckets'},
+                    'mean_seconds': op['total_seconds'] / op['calls'] if op['calls'] else None,
+                    'latency_histogram': dict(zip(labels, op['buckets'])),
+                }
+            return result
+
+
+breaker = CircuitBreaker('cloudinary')
+bulkhead = Bulkhead()
+metrics = Metrics()
+
+
+def reset():
+    """Forget breaker state and metrics and re-read the limits (used by tests)."""
+    breaker.reset()
+    bulkhead.reset()
+    metrics.reset()
+
+
+def backoff_seconds(attempt):
+    base = getattr(settings, 'STORAGE_RETRY_BASE_DELAY', 0.2)
+    delay = base * (2 ** (attempt - 1))
+    return random.uniform(0, delay)
+
+
+def guarded(operation, func, *args, idempotent=True, **kwargs):
+    """
+    Call ``func(*args, **kwargs)`` under the breaker and bulkhead, retrying
+    transient failures when ``idempotent``. Raises StorageUnavailable when the
+    call is refused, otherwise whatever the last attempt raised.
+    """
+    # The bulkhead slot is taken first: a half-open probe must not be claimed
+    # by a call that is then refused for want of a slot
+    if not bulkhead.acquire():
+        metrics.count(operation, 'rejected')
+        raise StorageUnavailable(f'Too many storage calls in flight; {operation} not attempted.')
+    if not breaker.allow():
+        bulkhead.release()
+        metrics.count(operation, 'rejected')
+        raise StorageUnavailable(f'Storage is unavailable (circuit open); {operation} not attempted.')
+    try:
+        attempts = max(1, getattr(settings, 'STORAGE_RETRY_ATTEMPTS', 3)) if idempotent else 1
+        for attempt in range(1, attempts + 1):
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                metrics.observe(operation, time.monotonic() - started, error=True)
+                if not is_transient(e):
+                    if isinstance(e, _PERMANENT_ERRORS):
+                        # The provider answered; it is healthy even if the request was wrong
+                        breaker.record_success()
+                    # Anything else says nothing about the provider either way
+                    raise
+                breaker.record_failure()
+                if attempt == attempts or breaker.state == CircuitBreaker.OPEN:
+                    raise
+                metrics.count(operation, 'retries')
+                logger.info('Retrying storage %s after error: %s', operation, e)
+                time.sleep(backoff_seconds(attempt))
+                continue
+            metrics.observe(operation, time.monotonic() - started)
+            breaker.record_success()
+            return result
+    finally:
+        breaker.release_probe()
+        bulkhead.release()
+
+
+def snapshot():
+    return {
+        'circuit_breaker': breaker.snapshot(),
+        'bulkhead': bulkhead.snapshot(),
+        'operations': metrics.snapshot(),
+    }
@@ -1,37 +1,126 @@
-from django.db.models.signals import post_delete, pre_save
-from django.dispatch import receiver
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, pre_delete, pre_save
+from django.dispatch import Signal, receiver
 
 from .models import Document
+from .tombstones import bury_files
+from .transfers import discard_spool
+
+# Sent after Document rows are written with bulk_create, which skips post_save.
+# Arguments: documents (the created instances).
+documents_bulk_created = Signal()
+
+# {user id: ({document id: document}, atomic block)} for students being deleted in this
+# thread, whose documents' cascade is cleaned up in bulk instead of row by row
+_cascade = threading.local()
+
+
+def _deleting_students():
+    if not hasattr(_cascade, 'students'):
+        _cascade.students = {}
+    return _cascade.students
+
+
+def deleted_with_student(document):
+    """True while ``document`` goes away in a cascade from deleting its student."""
+    entry = _deleting_students().get(document.student_id)
+    if entry is None or document.pk not in entry[0]:
+        return False
+    if entry[1] not in transaction.get_connection(document._state.db).atomic_blocks:
+        # That delete failed before its post_delete could clear the entry
+        del _deleting_students()[document.student_id]
+        return False
+    return True
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def collect_student_documents_on_delete(sender, instance, using, **kwargs):
+    """
+    Deleting a user cascades to all their documents. Note their files now, so
+    the per-row post_delete handlers can stand aside and the whole cascade is
+    queued in a few queries once the rows are gone.
+    """
+    documents = list(
+        Document.objects.using(using).filter(student=instance).only('blob', 'file', 'thumbnail', 'spool_path')
+    )
+    if documents:
+        # The deletion's own atomic block, to recognise an entry left by a failed delete
+        block = transaction.get_connection(using).atomic_blocks[-1]
+        _deleting_students()[instance.pk] = ({document.pk: document for document in documents}, block)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def delete_student_documents_files_on_delete(sender, instance, **kwargs):
+    """
+    Bulk counterpart of ``delete_document_file_on_delete`` for the documents
+    noted in ``collect_student_documents_on_delete``: one UPDATE for the blobs
+    that stay in use and one INSERT of tombstones for everything else.
+    """
+    entry = _deleting_students().pop(instance.pk, None)
+    if entry is None:
+        return
+    documents = entry[0].values()
+    from .blobs import release_blobs
+
+    released = release_blobs(Counter(document.blob_id for document in documents if document.blob_id))
+    files = {}
+    for document in documents:
+        if document.blob_id and document.blob_id not in released:
+            continue
+        # A released blob's name is the file name of every document that used it
+        for field_file in (document.file, document.thumbnail):
+            if field_file:
+                files.setdefault((field_file.storage, field_file.name), field_file)
+    bury_files(files.values())
+    for document in documents:
+        discard_spool(document)
 
 
 @receiver(post_delete, sender=Document)
 def delete_document_file_on_delete(sender, instance: Document, **kwargs):
     """
-    Delete the underlying file when a Document row is deleted.
-    This also covers cascade deletes (e.g., when a student user is deleted).
+    Queue the underlying file for deletion when a Document row is deleted.
+    Cascade deletes from deleting a student are handled in bulk instead
+    (``delete_student_documents_files_on_delete``).
+    Deduplicated files are only deleted when their last Document goes away.
+    Storage calls happen later in ``drain_storage_deletions``.
     """
-    if instance.file:
-        try:
-            instance.file.delete(save=False)
-        except Exception:
-            # Don't break the request if storage cleanup fails.
-            pass
+    if deleted_with_student(instance):
+        return
+    if instance.blob_id:
+        from .blobs import release_blob
+        release_blob(instance.blob_id, [instance.thumbnail])
+    else:
+        bury_files([instance.file, instance.thumbnail])
+    discard_spool(instance)
 
 
 @receiver(pre_save, sender=Document)
 def delete_document_file_on_change(sender, instance: Document, **kwargs):
     """
-    If a Document is updated with a new file, remove the old file from storage.
+    If a Document is updated with a new file, queue the old file for deletion.
+    The old file comes from the snapshot taken when the row was loaded, so
+    saves cost no extra query; saves whose update_fields leave the file alone
+    skip the check entirely.
     """
     if not instance.pk:
         return
-    try:
-        old = Document.objects.get(pk=instance.pk)
-    except Document.DoesNotExist:
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not {'file', 'blob'} & set(update_fields):
         return
-    if old.file and old.file.name and old.file.name != getattr(instance.file, 'name', None):
-        try:
-            old.file.delete(save=False)
-        except Exception:
-            pass
-
+    old = instance if instance.has_loaded_files() else Document.objects.filter(pk=instance.pk).first()
+    if old is None:
+        return
+    old_blob_id = old.loaded_value('blob')
+    if old_blob_id:
+        if old_blob_id != instance.blob_id:
+            from .blobs import release_blob
+            release_blob(old_blob_id, [old.loaded_file('thumbnail')])
+        return
+    old_name = old.loaded_value('file')
+    if old_name and old_name != getattr(instance.file, 'name', None):
+        bury_files([old.loaded_file('file'), old.loaded_file('thumbnail')])
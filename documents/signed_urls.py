@@ -0,0 +1,121 @@
+"""
+Signed, expiring delivery URLs for documents.
+
+With Cloudinary, URLs come from ``cloudinary.utils.private_download_url``,
+which signs an expiry into the URL so links stop working after
+DOCUMENT_SIGNED_URL_TTL seconds. Document files are stored with the
+``authenticated`` delivery type (see documents.storage), so there is no
+permanent public address to fall back on; files uploaded before that must be
+moved with ``protect_document_assets``.
+Without Cloudinary, the URL points at ``documents:signed_download`` with a
+Django-signed token carrying the same expiry.
+
+URLs are generated for a whole page of documents at once and cached until
+shortly before they expire, so rendering a dashboard costs one cache
+round-trip and no signing work on a warm cache.
+"""
+import hashlib
+import time
+
+import cloudinary
+import cloudinary.utils
+from cloudinary_storage.storage import MediaCloudinaryStorage
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.urls import reverse
+
+from .models import Document
+
+TOKEN_SALT = 'documents.signed_download'
+# Stop handing out a cached URL this many seconds before it expires
+REFRESH_MARGIN = 60
+
+
+def url_ttl():
+    return getattr(settings, 'DOCUMENT_SIGNED_URL_TTL', 900)
+
+
+def _cloudinary_enabled(storage):
+    config = cloudinary.config()
+    return isinstance(storage, MediaCloudinaryStorage) and bool(config.cloud_name and config.api_secret)
+
+
+def _cache_key(document, attachment):
+    # The stored name is part of the key so a replaced file never gets a stale URL
+    name_hash = hashlib.sha1(document.file.name.encode()).hexdigest()[:16]
+    return f'documents:signed-url:{document.pk}:{name_hash}:{int(attachment)}'
+
+
+def cloudinary_asset(storage, name):
+    """
+    (public_id, format, resource_type) of ``name`` in a Cloudinary storage, derived
+    the way the storage's own url() does: the full name (extension included)
+    and the storage's resource type. Documents are raw assets, images included.
+    """
+    name = storage._prepend_prefix(name)
+    return name, '', storage._get_resource_type(name)
+
+
+def _sign(document, expires_at, attachment):
+    storage = document.file.storage
+    if _cloudinary_enabled(storage):
+        public_id, fmt, resource_type = cloudinary_asset(storage, document.file.name)
+        return cloudinary.utils.private_download_url(
+            public_id, fmt, resource_type=resource_type, type=getattr(storage, 'DELIVERY_TYPE', 'upload'),
+            expires_at=expires_at, attachment=attachment,
+        )
+    token = signing.dumps(
+        {'d': document.pk, 'n': document.file.name, 'a': attachment, 'e': expires_at},
+        salt=TOKEN_SALT,
+        compress=True,
+    )
+    return reverse('documents:signed_download', kwargs={'token': token})
+
+
+def signed_urls(documents, attachment=True):
+    """
+    Return {document.pk: url} for every document with a stored file,
+    reusing cached URLs that still have more than REFRESH_MARGIN seconds left.
+    """
+    documents = [
+        d for d in documents
+        if d.file and d.file.name and d.storage_state == Document.STORAGE_READY
+    ]
+    keys = {d.pk: _cache_key(d, attachment) for d in documents}
+    cached = cache.get_many(list(keys.values()))
+
+    ttl = url_ttl()
+    expires_at = int(time.time()) + ttl
+    urls, fresh = {}, {}
+    for document in documents:
+        key = keys[document.pk]
+        url = cached.get(key)
+        if url is None:
+            url = _sign(document, expires_at, attachment)
+            fresh[key] = url
+        urls[document.pk] = url
+    if fresh and ttl > REFRESH_MARGIN:
+        cache.set_many(fresh, timeout=ttl - REFRESH_MARGIN)
+    return urls
+
+
+def signed_url(document, attachment=True):
+    return signed_urls([document], attachment).get(document.pk)
+
+
+def attach_download_urls(documents):
+    """Evaluate ``documents`` and set ``download_url`` on each one (None while processing)."""
+    documents = list(documents)
+    urls = signed_urls(documents)
+    for document in documents:
+        document.download_url = urls.get(document.pk)
+    return documents
+
+
+def read_token(token):
+    """Decode a local download token; raises signing.BadSignature if invalid or expired."""
+    payload = signing.loads(token, salt=TOKEN_SALT)
+    if payload['e'] < time.time():
+        raise signing.SignatureExpired('Download link has expired.')
+    return payload
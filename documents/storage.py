@@ -0,0 +1,239 @@
+"""
+Settings-selected storage backends and local file serving.
+
+MEDIA_STORAGE_BACKEND picks where files live:
+
+    'cloudinary'  documents in RawMediaCloudinaryStorage, images in MediaCloudinaryStorage
+    'local'       documents and their previews in DOCUMENT_PRIVATE_ROOT (never
+                  served directly), photos in MEDIA_ROOT under MEDIA_URL
+
+Model fields reference the callables below, so switching backends needs no
+migration. Local documents are handed to the web server with X-Accel-Redirect
+(nginx) or X-Sendfile (Apache/lighttpd) when DOCUMENT_SENDFILE_BACKEND is set;
+otherwise FileResponse streams the open file, which WSGI servers with a
+file_wrapper (gunicorn, uWSGI) send with os.sendfile.
+
+Cloudinary storages route every provider call through documents.resilience
+(timeouts, retries, circuit breaker, concurrency cap). Opening a Cloudinary
+file returns a ``RemoteFile`` over the streamed response, so readers such as
+the ZIP export pull the bytes chunk by chunk instead of loading the whole file.
+
+On Cloudinary, documents and their previews are stored with the
+``authenticated`` delivery type: the plain /raw/upload/ address does not
+serve them, the app reads them through signed delivery URLs, and ``url()``
+returns an expiring private download link (DOCUMENT_SIGNED_URL_TTL).
+Student photos and avatars use the public ``upload`` type: their URLs are
+unguessable but not secret, and anyone holding one can load the image.
+"""
+import mimetypes
+import os
+import time
+from urllib.parse import quote
+
+import cloudinary
+import cloudinary.uploader
+import cloudinary.utils
+import requests
+from cloudinary_storage.storage import MediaCloudinaryStorage, RawMediaCloudinaryStorage
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, HttpResponse
+from django.utils.functional import cached_property
+from django.utils.http import content_disposition_header
+
+from . import resilience
+
+
+def backend():
+    return getattr(settings, 'MEDIA_STORAGE_BACKEND', 'cloudinary')
+
+
+def is_local():
+    return backend() == 'local'
+
+
+class PrivateFileSystemStorage(FileSystemStorage):
+    """
+    FileSystemStorage rooted at DOCUMENT_PRIVATE_ROOT (read lazily, like MEDIA_ROOT,
+    so override_settings works). Files have no public URL; they are only
+    reachable through the document views.
+    """
+
+    def __init__(self):
+        super().__init__(base_url='/documents/private/')
+
+    @cached_property
+    def base_location(self):
+        return settings.DOCUMENT_PRIVATE_ROOT
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'DOCUMENT_PRIVATE_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+
+class RemoteFile(File):
+    """Read-only, unseekable file over a streamed HTTP response; bytes arrive as they are read."""
+
+    def __init__(self, response, name, mode='rb'):
+        # Undo any Content-Encoding so readers get the stored bytes
+        response.raw.decode_content = True
+        super().__init__(response.raw, name)
+        self.mode = mode
+        self._response = response
+        length = response.headers.get('content-length')
+        if length is not None and not response.headers.get('content-encoding'):
+            self.size = int(length)
+
+    def close(self):
+        # Returns the connection to the pool (or drops it if the body was not read)
+        self._response.close()
+
+
+class ResilientCloudinaryMixin:
+    """
+    Same behaviour as django-cloudinary-storage, but every HTTP call has a
+    timeout and goes through resilience.guarded. Uploads are not retried:
+    with unique filenames a retry after a lost response would store a copy.
+    Files are stored with DELIVERY_TYPE ('upload' is public).
+    """
+    DELIVERY_TYPE = 'upload'
+
+    def is_private(self):
+        return self.DELIVERY_TYPE != 'upload'
+
+    def _upload(self, name, content):
+        options = {
+            'use_filename': True, 'resource_type': self._get_resource_type(name), 'tags': self.TAG,
+            'type': self.DELIVERY_TYPE,
+        }
+        folder = os.path.dirname(name)
+        if folder:
+            options['folder'] = folder
+        return resilience.guarded(
+            'upload', cloudinary.uploader.upload, content,
+            idempotent=False, timeout=resilience.upload_timeout(), **options
+        )
+
+    def delete(self, name):
+        response = resilience.guarded(
+            'delete', cloudinary.uploader.destroy, name,
+            invalidate=True, resource_type=self._get_resource_type(name), type=self.DELIVERY_TYPE,
+            timeout=resilience.timeout(),
+        )
+        return response['result'] == 'ok'
+
+    def _get_url(self, name):
+        # Server-side reads: signed delivery URLs work for every delivery type
+        name = self._prepend_prefix(name)
+        url, _ = cloudinary.utils.cloudinary_url(
+            name, resource_type=self._get_resource_type(name), type=self.DELIVERY_TYPE,
+            sign_url=self.is_private(),
+        )
+        return url
+
+    def url(self, name):
+        if not self.is_private():
+            return self._get_url(name)
+        # Links handed to browsers expire; the signed delivery URL above would not
+        ttl = getattr(settings, 'DOCUMENT_SIGNED_URL_TTL', 900)
+        return cloudinary.utils.private_download_url(
+            self._prepend_prefix(name), '', resource_type=self._get_resource_type(name),
+            type=self.DELIVERY_TYPE, expires_at=int(time.time()) + ttl,
+        )
+
+    def _http(self, method, name, stream=False):
+        def call():
+            response = requests.request(method, self._get_url(name), timeout=resilience.timeout(), stream=stream)
+            if response.status_code >= 500 or response.status_code == 429:
+                response.close()
+                response.raise_for_status()
+            return response
+        return resilience.guarded(method.lower(), call)
+
+    def _open(self, name, mode='rb'):
+        # Only the status line and headers are read here; the body is read by the caller
+        response = self._http('GET', name, stream=True)
+        if response.status_code == 404:
+            response.close()
+            raise FileNotFoundError(name)
+        if response.status_code >= 400:
+            response.close()
+            response.raise_for_status()
+        return RemoteFile(response, name, mode)
+
+    def exists(self, name):
+        response = self._http('HEAD', name)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def size(self, name):
+        response = self._http('HEAD', name)
+        if response.status_code == 200:
+            return int(response.headers['content-length'])
+        return None
+
+
+class ResilientMediaCloudinaryStorage(ResilientCloudinaryMixin, MediaCloudinaryStorage):
+    pass
+
+
+class ResilientRawMediaCloudinaryStorage(ResilientCloudinaryMixin, RawMediaCloudinaryStorage):
+    # Documents and their previews: never reachable through a public address
+    DELIVERY_TYPE = 'authenticated'
+
+
+def _private_storage():
+    return PrivateFileSystemStorage()
+
+
+def _public_storage():
+    # No explicit location: follows MEDIA_ROOT/MEDIA_URL
+    return FileSystemStorage()
+
+
+def document_storage():
+    """Storage for Document.file"""
+    return _private_storage() if is_local() else ResilientRawMediaCloudinaryStorage()
+
+
+def document_preview_storage():
+    """Storage for Document.thumbnail (private like the document: it shows its first page)"""
+    return _private_storage() if is_local() else ResilientRawMediaCloudinaryStorage()
+
+
+def image_storage():
+    """Storage for StudentProfile.photo and its thumbnail"""
+    return _public_storage() if is_local() else ResilientMediaCloudinaryStorage()
+
+
+def is_local_file(field_file):
+    return isinstance(field_file.storage, FileSystemStorage)
+
+
+def serve_local_file(field_file, filename, as_attachment=True, content_type=None):
+    """
+    Respond with a file from local storage, letting the front-end server send
+    the bytes when DOCUMENT_SENDFILE_BACKEND is configured.
+    """
+    storage = field_file.storage
+    name = field_file.name
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    mode = getattr(settings, 'DOCUMENT_SENDFILE_BACKEND', '')
+
+    if mode == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'DOCUMENT_SENDFILE_URL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+    elif mode == 'xsendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = storage.path(name)
+    else:
+        # A real file object lets the WSGI server's file_wrapper use sendfile
+        response = FileResponse(open(storage.path(name), 'rb'), content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
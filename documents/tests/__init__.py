@@ -0,0 +1,36 @@
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+
+class TempStorageMixin:
+    """
+    Give the test case its own MEDIA_ROOT and DOCUMENT_PRIVATE_ROOT, created
+    in setUpClass and removed with everything in them in tearDownClass.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='mbbs_test_media_')
+        cls.private_root = tempfile.mkdtemp(prefix='mbbs_test_private_')
+        cls._storage_override = override_settings(MEDIA_ROOT=cls.media_root, DOCUMENT_PRIVATE_ROOT=cls.private_root)
+        cls._storage_override.enable()
+        try:
+            super().setUpClass()
+        except Exception:
+            cls._remove_storage()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls._remove_storage()
+
+    @classmethod
+    def _remove_storage(cls):
+        cls._storage_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        shutil.rmtree(cls.private_root, ignore_errors=True)
@@ -0,0 +1,935 @@
+"""Tests for documents app models and management commands."""
+import hashlib
+import importlib.util
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.contrib.auth import get_user_model
+from documents.models import Document, StorageTombstone, StoredBlob
+from documents.tests import TempStorageMixin
+
+User = get_user_model()
+
+
+def make_student(username='student1'):
+    return User.objects.create_user(username=username, email='s@x.com', password='testpass123', role='STUDENT')
+
+
+class DocumentMetadataTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+
+    def test_metadata_captured_on_upload(self):
+        content = b'%PDF-1.4 metadata test'
+        doc = Document.objects.create(
+            student=self.student,
+            document_type='PAN',
+            title='PAN',
+            file=SimpleUploadedFile('pan card.pdf', content, content_type='application/pdf'),
+        )
+        doc.refresh_from_db()
+        self.assertEqual(doc.size_bytes, len(content))
+        self.assertEqual(doc.content_type, 'application/pdf')
+        self.assertEqual(doc.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(doc.original_filename, 'pan card.pdf')
+        self.assertEqual(doc.filename(), 'pan card.pdf')
+
+    def test_file_size_does_not_touch_storage(self):
+        doc = Document.objects.create(
+            student=self.student,
+            document_type='PAN',
+            file=SimpleUploadedFile('pan.pdf', b'x' * 2048),
+        )
+        doc = Document.objects.get(pk=doc.pk)
+        storage = Document._meta.get_field('file').storage
+        with mock.patch.object(type(storage), 'size', side_effect=AssertionError('storage called')):
+            self.assertEqual(doc.file_size(), 2.0)
+
+    @override_settings(DOCUMENT_DEDUPLICATION=False)
+    def test_backfill_populates_legacy_rows(self):
+        content = b'legacy content'
+        doc = Document.objects.create(
+            student=self.student,
+            document_type='AADHAAR',
+            file=SimpleUploadedFile('aadhaar.pdf', content),
+        )
+        Document.objects.filter(pk=doc.pk).update(size_bytes=None, content_type='', sha256='', original_filename='')
+
+        call_command('backfill_document_metadata', batch_size=1, stdout=StringIO())
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.size_bytes, len(content))
+        self.assertEqual(doc.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(doc.content_type, 'application/pdf')
+        self.assertTrue(doc.original_filename.startswith('aadhaar'))
+
+
+@override_settings(
+    DOCUMENT_ASYNC_STORAGE_TRANSFER=True,
+)
+class StorageTransferTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.spool_dir = spool.name
+        override = override_settings(DOCUMENT_TRANSFER_SPOOL_DIR=self.spool_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def make_pending(self, content=b'%PDF-1.4 spooled'):
+        return Document.objects.create(
+            student=self.student,
+            document_type='PAN',
+            file=SimpleUploadedFile('pan.pdf', content),
+        )
+
+    def test_upload_is_spooled_not_stored(self):
+        doc = self.make_pending()
+        self.assertEqual(doc.storage_state, Document.STORAGE_PENDING)
+        self.assertFalse(doc.file)
+        self.assertTrue(os.path.exists(doc.spool_path))
+        self.assertEqual(doc.size_bytes, len(b'%PDF-1.4 spooled'))
+        self.assertTrue(doc.is_processing())
+
+    def test_transfer_moves_file_to_storage(self):
+        from documents import transfers
+        doc = self.make_pending()
+        spool_path = doc.spool_path
+
+        self.assertEqual(transfers.transfer_document(doc.pk), 'ready')
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.storage_state, Document.STORAGE_READY)
+        self.assertEqual(doc.file.name, doc.blob.name)
+        self.assertEqual(doc.spool_path, '')
+        self.assertFalse(os.path.exists(spool_path))
+        with doc.file.open('rb') as f:
+            self.assertEqual(f.read(), b'%PDF-1.4 spooled')
+
+    def test_failed_transfer_is_retried_with_backoff(self):
+        from documents import transfers
+        doc = self.make_pending()
+        storage = Document._meta.get_field('file').storage
+        with mock.patch.object(type(storage), 'save', side_effect=OSError('storage down')):
+            self.assertEqual(transfers.transfer_document(doc.pk), 'retry')
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.storage_state, Document.STORAGE_PENDING)
+        self.assertEqual(doc.transfer_attempts, 1)
+        self.assertIsNotNone(doc.next_transfer_at)
+        self.assertIn('storage down', doc.transfer_error)
+        # Not due yet, so a second worker pass leaves it alone
+        self.assertEqual(transfers.due_document_ids(10), [])
+
+    def test_failed_insert_removes_spool(self):
+        doc = self.make_pending()
+        with self.assertRaises(IntegrityError):
+            self.make_pending(b'%PDF-1.4 same type and title')
+        self.assertEqual(os.listdir(self.spool_dir), [os.path.basename(doc.spool_path)])
+
+    def test_failed_batch_removes_spool(self):
+        from documents import batch_upload
+        items = [
+            ('PAN', 'pan', SimpleUploadedFile('pan.pdf', b'%PDF-1.4 one')),
+            ('PAN', 'pan', SimpleUploadedFile('pan2.pdf', b'%PDF-1.4 two')),
+        ]
+        with self.assertRaises(IntegrityError):
+            batch_upload.save_batch(items, self.student, self.student)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_deleting_pending_document_removes_spool(self):
+        doc = self.make_pending()
+        spool_path = doc.spool_path
+        doc.delete()
+        self.assertFalse(os.path.exists(spool_path))
+
+
+@override_settings(DOCUMENT_DEDUPLICATION=True, DERIVATIVE_WORKERS=0)
+class DeduplicationTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+
+    def upload(self, title, content=b'%PDF-1.4 same scan', student=None):
+        return Document.objects.create(
+            student=student or self.student,
+            document_type='AADHAAR',
+            title=title,
+            file=SimpleUploadedFile('aadhaar.pdf', content),
+        )
+
+    def test_identical_uploads_share_one_blob(self):
+        storage = Document._meta.get_field('file').storage
+        first = self.upload('front')
+        with mock.patch.object(type(storage), 'save', side_effect=AssertionError('uploaded twice')):
+            second = self.upload('copy', student=make_student('student2'))
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+
+    def test_blob_deleted_only_with_last_reference(self):
+        first = self.upload('front')
+        second = self.upload('copy')
+        name = first.file.name
+        storage = Document._meta.get_field('file').storage
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(StoredBlob.objects.get().ref_count, 1)
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertTrue(storage.exists(name))
+        call_command('drain_storage_deletions', stdout=StringIO())
+        self.assertFalse(storage.exists(name))
+
+    def test_deleting_student_releases_their_blob_references_in_bulk(self):
+        shared = self.upload('front')
+        self.upload('copy')
+        own = self.upload('own', content=b'%PDF-1.4 only mine')
+        other = self.upload('front', student=make_student('student2'))
+
+        self.student.delete()
+        self.assertEqual(list(StoredBlob.objects.values_list('pk', 'ref_count')), [(shared.blob_id, 1)])
+        self.assertEqual(list(StorageTombstone.objects.values_list('name', flat=True)), [own.file.name])
+
+        other.student.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertEqual(
+            sorted(StorageTombstone.objects.values_list('name', flat=True)), sorted([own.file.name, shared.file.name])
+        )
+
+    def test_replacing_file_releases_old_blob(self):
+        doc = self.upload('front')
+        doc.file = SimpleUploadedFile('aadhaar.pdf', b'%PDF-1.4 new scan')
+        with self.captureOnCommitCallbacks(execute=True):
+            doc.save()
+        self.assertEqual(StoredBlob.objects.count(), 1)
+        self.assertEqual(StoredBlob.objects.get().pk, doc.blob_id)
+
+    def test_dedup_report(self):
+        self.upload('front')
+        self.upload('copy')
+        out = StringIO()
+        call_command('document_dedup_report', stdout=out)
+        self.assertIn('2.00x', out.getvalue())
+
+
+def png_bytes(size=(800, 600)):
+    from PIL import Image
+
+    out = BytesIO()
+    Image.new('RGB', size, 'navy').save(out, 'PNG')
+    return out.getvalue()
+
+
+@override_settings(DOCUMENT_DEDUPLICATION=False, DOCUMENT_THUMBNAILS=False)
+class StorageDeletionQueueTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+
+    def upload(self, title):
+        return Document.objects.create(
+            student=self.student,
+            document_type='AADHAAR',
+            title=title,
+            file=SimpleUploadedFile(f'{title}.pdf', f'%PDF-1.4 {title}'.encode()),
+        )
+
+    def test_deleting_student_makes_no_storage_calls(self):
+        from django.core.files.storage import FileSystemStorage
+
+        names = [self.upload(f'doc{i}').file.name for i in range(5)]
+        with mock.patch.object(FileSystemStorage, 'delete', side_effect=AssertionError('deleted in request')):
+            self.student.delete()
+        self.assertEqual(sorted(StorageTombstone.objects.values_list('name', flat=True)), sorted(names))
+
+        storage = Document._meta.get_field('file').storage
+        self.assertTrue(all(storage.exists(name) for name in names))
+        call_command('drain_storage_deletions', stdout=StringIO())
+        self.assertFalse(StorageTombstone.objects.exists())
+        self.assertFalse(any(storage.exists(name) for name in names))
+
+    def test_deleting_student_costs_the_same_queries_for_any_number_of_documents(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def delete_student_with(count, username):
+            student = make_student(username)
+            for i in range(count):
+                Document.objects.create(
+                    student=student, document_type='PAN', title=f'doc{i}',
+                    file=SimpleUploadedFile(f'doc{i}.pdf', b'%PDF-1.4 doc'),
+                )
+            with CaptureQueriesContext(connection) as queries:
+                student.delete()
+            return len(queries)
+
+        self.assertEqual(delete_student_with(2, 'few'), delete_student_with(8, 'many'))
+        self.assertEqual(StorageTombstone.objects.count(), 10)
+
+    def test_failed_student_delete_leaves_single_deletes_working(self):
+        from django.db.models.signals import post_delete
+        from students.models import StudentProfile
+
+        doc = self.upload('front')
+        StudentProfile.objects.create(user=self.student)
+
+        def fail(**kwargs):
+            raise RuntimeError('delete failed')
+
+        post_delete.connect(fail, sender=StudentProfile)
+        self.addCleanup(post_delete.disconnect, fail, sender=StudentProfile)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.student.delete()
+        post_delete.disconnect(fail, sender=StudentProfile)
+
+        Document.objects.get(pk=doc.pk).delete()
+        self.assertEqual(list(StorageTombstone.objects.values_list('name', flat=True)), [doc.file.name])
+
+    def test_saves_detect_replaced_file_without_selecting_old_row(self):
+        doc = Document.objects.get(pk=self.upload('front').pk)
+        old_name = doc.file.name
+        with self.assertNumQueries(1):
+            doc.save(update_fields=['title'])
+        with self.assertNumQueries(1):
+            doc.save()
+        self.assertFalse(StorageTombstone.objects.exists())
+
+        doc.file = SimpleUploadedFile('back.pdf', b'%PDF-1.4 back')
+        doc.save()
+        self.assertEqual(list(StorageTombstone.objects.values_list('name', flat=True)), [old_name])
+        # The snapshot follows the save, so the next replacement queues the new name
+        self.assertEqual(doc.loaded_value('file'), doc.file.name)
+
+    def test_cloudinary_deletes_in_batches_of_100_and_retries_failures(self):
+        from documents import tombstones
+
+        names = [f'documents/s/AADHAAR/{i}.pdf' for i in range(250)]
+        StorageTombstone.objects.bulk_create(
+            StorageTombstone(storage=StorageTombstone.STORAGE_CLOUDINARY_RAW, name=name) for name in names
+        )
+
+        def delete_resources(public_ids, **options):
+            self.assertEqual(options['resource_type'], 'raw')
+            self.assertEqual(options['type'], 'authenticated')
+            return {'deleted': {pid: ('error' if pid == names[0] else 'deleted') for pid in public_ids}}
+
+        with mock.patch('cloudinary.api.delete_resources', side_effect=delete_resources) as api:
+            counts = tombstones.drain()
+
+        self.assertEqual([len(c.args[0]) for c in api.call_args_list], [100, 100, 50])
+        self.assertEqual(counts, {'deleted': 249, 'retry': 1, 'failed': 0})
+        left = StorageTombstone.objects.get()
+        self.assertEqual((left.name, left.attempts, left.claim), (names[0], 1, None))
+        self.assertIsNotNone(left.next_attempt_at)
+        # Not due again until its backoff has passed
+        self.assertEqual(tombstones.claim_due(10), [])
+
+
+@override_settings(DOCUMENT_DEDUPLICATION=False, DOCUMENT_THUMBNAILS=False)
+class ReconciliationTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(
+            DOCUMENT_PRIVATE_ROOT=os.path.join(root, 'private'), MEDIA_ROOT=os.path.join(root, 'media')
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.storage = Document._meta.get_field('file').storage
+        self.student = make_student()
+
+    def upload(self, title):
+        return Document.objects.create(
+            student=self.student,
+            document_type='AADHAAR',
+            title=title,
+            file=SimpleUploadedFile(f'{title}.pdf', f'%PDF-1.4 {title}'.encode()),
+        )
+
+    def stray_file(self, name, age_hours=48):
+        from django.core.files.base import ContentFile
+        import time
+
+        name = self.storage.save(name, ContentFile(b'stray'))
+        stamp = time.time() - age_hours * 3600
+        os.utime(self.storage.path(name), (stamp, stamp))
+        return name
+
+    def test_reports_and_repairs_orphans_and_missing_files(self):
+        from documents import reconcile
+
+        kept = self.upload('kept')
+        lost = self.upload('lost')
+        self.storage.delete(lost.file.name)
+        orphan = self.stray_file('documents/student1/AADHAAR/old-orphan.pdf')
+        self.stray_file('documents/student1/AADHAAR/in-flight.pdf', age_hours=0)
+        found = []
+
+        results = reconcile.reconcile(report=lambda kind, key, name, detail: found.append((kind, name)))
+        self.assertEqual(results['private'], {'orphans': 1, 'missing': 1, 'young': 1})
+        self.assertEqual(sorted(found), [('missing', lost.file.name), ('orphan', orphan)])
+        self.assertFalse(StorageTombstone.objects.exists())
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_storage', '--repair', stdout=StringIO())
+        call_command('reconcile_storage', '--repair', '--storage', 'private', stdout=StringIO())
+        self.assertEqual(list(StorageTombstone.objects.values_list('name', flat=True)), [orphan])
+        lost.refresh_from_db()
+        self.assertEqual(lost.storage_state, Document.STORAGE_FAILED)
+        kept.refresh_from_db()
+        self.assertEqual(kept.storage_state, Document.STORAGE_READY)
+
+        # Queued orphans and detached rows are not reported again
+        results = reconcile.reconcile()
+        self.assertEqual(results['private'], {'orphans': 0, 'missing': 0, 'young': 1})
+
+    def test_files_outside_the_upload_directories_are_not_orphans(self):
+        from documents import reconcile
+
+        self.upload('kept')
+        for name in ('test_upload.txt', 'manual_uploads/scan.pdf', 'media/documents/legacy/old.pdf'):
+            self.stray_file(name)
+        orphan = self.stray_file('documents/student1/AADHAAR/stray.pdf')
+        found = []
+        results = reconcile.reconcile(report=lambda kind, key, name, detail: found.append(name))
+        self.assertEqual(found, [orphan])
+        self.assertEqual(results['private']['orphans'], 1)
+        self.assertEqual(reconcile.reconcile(prefix='manual_uploads/')['private']['orphans'], 0)
+
+    def test_local_listing_is_in_byte_order(self):
+        from documents import reconcile
+
+        for name in ('a/b.pdf', 'a-c.pdf', 'a/a/z.pdf', 'B.pdf'):
+            self.stray_file(name)
+        names = [name for name, _ in reconcile.stored_names(self.storage)]
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(names), 4)
+
+
+@override_settings(
+    STORAGE_RETRY_ATTEMPTS=3,
+    STORAGE_RETRY_BASE_DELAY=0,
+    STORAGE_BREAKER_FAILURE_THRESHOLD=2,
+    STORAGE_BREAKER_RESET_SECONDS=60,
+    STORAGE_MAX_CONCURRENCY=1,
+    STORAGE_BULKHEAD_WAIT_SECONDS=0,
+)
+class ResilientStorageTests(TestCase):
+    def setUp(self):
+        from documents import resilience
+
+        self.resilience = resilience
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+
+    def test_transient_errors_are_retried(self):
+        import requests
+
+        func = mock.Mock(side_effect=[requests.ConnectionError('reset'), 'ok'])
+        self.assertEqual(self.resilience.guarded('exists', func), 'ok')
+        self.assertEqual(func.call_count, 2)
+        stats = self.resilience.snapshot()['operations']['exists']
+        self.assertEqual((stats['calls'], stats['errors'], stats['retries']), (2, 1, 1))
+
+    def test_permanent_errors_are_not_retried_and_keep_circuit_closed(self):
+        import cloudinary.exceptions
+
+        func = mock.Mock(side_effect=cloudinary.exceptions.NotFound('gone'))
+        for _ in range(3):
+            with self.assertRaises(cloudinary.exceptions.NotFound):
+                self.resilience.guarded('resource', func)
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(self.resilience.breaker.state, 'closed')
+
+    def test_only_provider_trouble_is_transient(self):
+        import cloudinary.exceptions
+        import requests
+
+        def http_error(status):
+            return requests.HTTPError(response=mock.Mock(status_code=status))
+
+        for error in (
+            requests.ConnectionError('reset'), requests.Timeout('slow'), TimeoutError('slow'),
+            http_error(503), http_error(429), cloudinary.exceptions.RateLimited('slow down'),
+            cloudinary.exceptions.GeneralError('Error 502 - bad gateway'),
+            cloudinary.exceptions.GeneralError('Socket Error: reset'),
+            cloudinary.exceptions.Error('Socket error: reset'),
+        ):
+            self.assertTrue(self.resilience.is_transient(error), error)
+        for error in (
+            ValueError('bug'), KeyError('bug'), http_error(403), http_error(400),
+            cloudinary.exceptions.GeneralError('Server returned unexpected status code - 404 - gone'),
+            cloudinary.exceptions.Error('Invalid image file'), cloudinary.exceptions.NotFound('gone'),
+        ):
+            self.assertFalse(self.resilience.is_transient(error), error)
+
+    def test_unexpected_errors_are_not_retried_or_counted(self):
+        func = mock.Mock(side_effect=ValueError('bug'))
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                self.resilience.guarded('open', func)
+        self.assertEqual(func.call_count, 3)
+        snapshot = self.resilience.snapshot()
+        self.assertEqual(snapshot['circuit_breaker']['consecutive_failures'], 0)
+        self.assertEqual(snapshot['operations']['open']['retries'], 0)
+
+    def test_circuit_opens_then_fails_fast_until_probe_succeeds(self):
+        func = mock.Mock(side_effect=TimeoutError('slow'))
+        with self.assertRaises(TimeoutError):
+            self.resilience.guarded('open', func)
+        # The second failure opened the circuit, so the third attempt never ran
+        self.assertEqual(func.call_count, 2)
+        with self.assertRaises(self.resilience.StorageUnavailable):
+            self.resilience.guarded('open', func)
+        self.assertEqual(func.call_count, 2)
+        snapshot = self.resilience.snapshot()
+        self.assertEqual(snapshot['circuit_breaker']['state'], 'open')
+        self.assertEqual(snapshot['operations']['open']['rejected'], 1)
+
+        with override_settings(STORAGE_BREAKER_RESET_SECONDS=0):
+            self.assertEqual(self.resilience.guarded('open', mock.Mock(return_value='probe')), 'probe')
+        self.assertEqual(self.resilience.breaker.state, 'closed')
+
+    def test_bulkhead_rejects_when_all_slots_are_busy(self):
+        self.assertTrue(self.resilience.bulkhead.acquire())
+        try:
+            func = mock.Mock()
+            with self.assertRaises(self.resilience.StorageUnavailable):
+                self.resilience.guarded('open', func)
+            func.assert_not_called()
+        finally:
+            self.resilience.bulkhead.release()
+
+    def test_half_open_probe_refused_by_the_bulkhead_is_given_back(self):
+        for _ in range(5):
+            self.resilience.breaker.record_failure()
+        self.assertEqual(self.resilience.breaker.state, 'open')
+        with override_settings(STORAGE_BREAKER_RESET_SECONDS=0, STORAGE_BULKHEAD_WAIT_SECONDS=0):
+            slots = [self.resilience.bulkhead.acquire() for _ in range(self.resilience.bulkhead.limit)]
+            self.assertTrue(all(slots))
+            func = mock.Mock(return_value='ok')
+            try:
+                with self.assertRaises(self.resilience.StorageUnavailable):
+                    self.resilience.guarded('probe', func)
+            finally:
+                for _ in slots:
+                    self.resilience.bulkhead.release()
+            func.assert_not_called()
+            # The refused call never took the probe, so the next one can
+            self.assertEqual(self.resilience.guarded('probe', func), 'ok')
+        self.assertEqual(self.resilience.breaker.state, 'closed')
+
+    def test_probe_ending_without_a_verdict_is_released(self):
+        for _ in range(5):
+            self.resilience.breaker.record_failure()
+        with override_settings(STORAGE_BREAKER_RESET_SECONDS=0):
+            with self.assertRaises(KeyboardInterrupt):
+                self.resilience.guarded('probe', mock.Mock(side_effect=KeyboardInterrupt))
+            self.assertEqual(self.resilience.guarded('probe', mock.Mock(return_value='ok')), 'ok')
+        self.assertEqual(self.resilience.breaker.state, 'closed')
+
+    def test_cloudinary_storage_calls_have_timeouts(self):
+        from documents.storage import ResilientRawMediaCloudinaryStorage
+
+        storage = ResilientRawMediaCloudinaryStorage()
+        response = mock.Mock(status_code=404)
+        with mock.patch.object(storage, '_get_url', return_value='https://example.invalid/x.pdf'), \
+                mock.patch('requests.request', return_value=response) as request:
+            self.assertFalse(storage.exists('x.pdf'))
+            with self.assertRaises(FileNotFoundError):
+                storage.open('x.pdf')
+        self.assertEqual([c.kwargs['timeout'] for c in request.call_args_list], [10, 10])
+
+    def test_cloudinary_open_streams_the_response(self):
+        from documents.storage import ResilientRawMediaCloudinaryStorage
+
+        storage = ResilientRawMediaCloudinaryStorage()
+        body = b'%PDF-1.4 ' + b'x' * 200
+        response = mock.Mock(status_code=200, raw=BytesIO(body), headers={'content-length': str(len(body))})
+        # The body must come from the raw stream, never be loaded through .content
+        type(response).content = mock.PropertyMock(side_effect=AssertionError('body loaded into memory'))
+        with mock.patch.object(storage, '_get_url', return_value='https://example.invalid/x.pdf'), \
+                mock.patch('requests.request', return_value=response) as request:
+            with storage.open('x.pdf') as f:
+                self.assertEqual(f.size, len(body))
+                self.assertEqual(b''.join(f.chunks(chunk_size=64)), body)
+        self.assertTrue(request.call_args.kwargs['stream'])
+        response.close.assert_called_once()
+
+
+def use_cloudinary_credentials(test):
+    import cloudinary
+    config = cloudinary.config()
+    old = {'cloud_name': config.cloud_name, 'api_key': config.api_key, 'api_secret': config.api_secret}
+    test.addCleanup(cloudinary.config, **old)
+    cloudinary.config(cloud_name='demo', api_key='key', api_secret='secret')
+
+
+class PrivateDeliveryTests(TestCase):
+    def test_documents_are_stored_and_linked_as_authenticated(self):
+        from django.core.files.base import ContentFile
+        from documents.storage import ResilientMediaCloudinaryStorage, ResilientRawMediaCloudinaryStorage
+
+        use_cloudinary_credentials(self)
+        storage = ResilientRawMediaCloudinaryStorage()
+        with mock.patch('cloudinary.uploader.upload', return_value={'public_id': 'media/documents/a.pdf'}) as upload:
+            storage.save('documents/a.pdf', ContentFile(b'%PDF-1.4'))
+        self.assertEqual(upload.call_args.kwargs['type'], 'authenticated')
+        # Reads use a signed delivery URL; links handed out expire
+        self.assertIn('/raw/authenticated/s--', storage._get_url('documents/a.pdf'))
+        url = storage.url('documents/a.pdf')
+        self.assertIn('/raw/download?', url)
+        self.assertIn('type=authenticated', url)
+        self.assertIn('expires_at=', url)
+        # Photos keep public delivery
+        self.assertIn('/image/upload/', ResilientMediaCloudinaryStorage().url('student_photos/a.jpg'))
+
+    @override_settings(MEDIA_STORAGE_BACKEND='cloudinary')
+    def test_protect_command_renames_files_and_previews(self):
+        import cloudinary.exceptions
+
+        student = make_student()
+        Document.objects.create(
+            student=student, document_type='PAN', title='a',
+            file='media/documents/student1/PAN/a.pdf', thumbnail='media/documents/student1/PAN/thumbs/a.webp',
+        )
+        Document.objects.create(
+            student=student, document_type='PAN', title='b', file='media/documents/student1/PAN/b.pdf'
+        )
+        Document.objects.create(
+            student=student, document_type='AADHAAR', title='c', file='media/documents/student1/AADHAAR/c.jpg'
+        )
+
+        def rename(from_id, to_id, **options):
+            if from_id.endswith('b.pdf'):
+                raise cloudinary.exceptions.NotFound('already moved')
+            return {'public_id': to_id}
+
+        out = StringIO()
+        with mock.patch('cloudinary.uploader.rename', side_effect=rename) as api:
+            call_command('protect_document_assets', stdout=out)
+        # Image documents are raw assets too, named with their extension
+        self.assertEqual(
+            sorted(c.args[0] for c in api.call_args_list),
+            [
+                'media/documents/student1/AADHAAR/c.jpg', 'media/documents/student1/PAN/a.pdf',
+                'media/documents/student1/PAN/b.pdf', 'media/documents/student1/PAN/thumbs/a.webp',
+            ],
+        )
+        for c in api.call_args_list:
+            self.assertEqual(
+                (c.kwargs['resource_type'], c.kwargs['type'], c.kwargs['to_type']), ('raw', 'upload', 'authenticated')
+            )
+        self.assertIn('3 assets moved, 1 skipped, 0 failed', out.getvalue())
+
+    def test_signed_link_for_image_document_names_the_raw_asset(self):
+        from types import SimpleNamespace
+        from documents import signed_urls
+        from documents.storage import ResilientRawMediaCloudinaryStorage
+
+        use_cloudinary_credentials(self)
+        document = SimpleNamespace(
+            pk=1, file=SimpleNamespace(storage=ResilientRawMediaCloudinaryStorage(), name='media/documents/s/AADHAAR/scan.jpg')
+        )
+        url = signed_urls._sign(document, 2000000000, attachment=True)
+        self.assertIn('/raw/download?', url)
+        self.assertIn('public_id=media%2Fdocuments%2Fs%2FAADHAAR%2Fscan.jpg', url)
+        self.assertIn('type=authenticated', url)
+        self.assertNotIn('format=jpg', url)
+
+
+@override_settings(DOCUMENT_DEDUPLICATION=False, DOCUMENT_THUMBNAILS=False)
+class MediaMigrationTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.media = os.path.join(root, 'media')
+        override = override_settings(MEDIA_ROOT=self.media, DOCUMENT_PRIVATE_ROOT=os.path.join(root, 'private'))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.checkpoint = os.path.join(root, 'checkpoint.json')
+        self.student = make_student()
+
+    def legacy_document(self, title):
+        """A row pointing at a file that only exists in the old MEDIA_ROOT tree."""
+        name = f'documents/student1/AADHAAR/{title}.pdf'
+        os.makedirs(os.path.dirname(os.path.join(self.media, name)), exist_ok=True)
+        with open(os.path.join(self.media, name), 'wb') as f:
+            f.write(f'%PDF-1.4 {title}'.encode())
+        doc = Document.objects.create(
+            student=self.student, document_type='AADHAAR', title=title,
+            file=SimpleUploadedFile(f'{title}.pdf', b'%PDF-1.4 placeholder'),
+        )
+        Document.objects.filter(pk=doc.pk).update(file=name)
+        return doc.pk, name
+
+    def migrate(self, *args):
+        out = StringIO()
+        call_command(
+            'migrate_media_to_storage', '--batch-size', '2', '--checkpoint', self.checkpoint, *args,
+            stdout=out, stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def test_migrates_referenced_files_and_checkpoints(self):
+        from documents import media_migration
+
+        docs = [self.legacy_document(f'scan{i}') for i in range(3)]
+        stray = os.path.join(self.media, 'documents/student1/AADHAAR/unreferenced.pdf')
+        with open(stray, 'wb') as f:
+            f.write(b'stray')
+
+        output = self.migrate()
+        self.assertIn('3 migrated, 1 unreferenced, 0 failed', output)
+        self.assertIn('Skipping StudentProfile.photo', output)
+        storage = Document._meta.get_field('file').storage
+        for pk, name in docs:
+            doc = Document.objects.get(pk=pk)
+            self.assertTrue(storage.exists(doc.file.name))
+            with doc.file.open('rb') as f:
+                self.assertTrue(f.read().startswith(b'%PDF-1.4 scan'))
+        self.assertEqual(media_migration.load_checkpoint(self.checkpoint), 'documents/student1/AADHAAR/unreferenced.pdf')
+
+        # Resuming past the end migrates nothing
+        self.assertIn('0 migrated, 0 unreferenced', self.migrate())
+
+    def test_checkpoint_stops_at_first_failure(self):
+        from django.core.files.storage import FileSystemStorage
+        from documents import media_migration
+
+        docs = [self.legacy_document(f'scan{i}') for i in range(4)]
+        real_save = FileSystemStorage.save
+
+        def flaky_save(storage, name, *args, **kwargs):
+            if name.endswith('scan1.pdf'):
+                raise OSError('network down')
+            return real_save(storage, name, *args, **kwargs)
+
+        with mock.patch.object(FileSystemStorage, 'save', flaky_save):
+            self.assertIn('3 migrated, 0 unreferenced, 1 failed', self.migrate())
+        self.assertEqual(media_migration.load_checkpoint(self.checkpoint), docs[0][1])
+        self.assertEqual(Document.objects.get(pk=docs[1][0]).file.name, docs[1][1])
+
+        self.assertIn('1 migrated', self.migrate())
+        self.assertNotEqual(Document.objects.get(pk=docs[1][0]).file.name, docs[1][1])
+
+
+@override_settings(DOCUMENT_THUMBNAILS=True, DERIVATIVE_WORKERS=0)
+class ThumbnailTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        self.work_dir = work_dir.name
+        override = override_settings(DOCUMENT_DERIVATIVE_WORK_DIR=self.work_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_image_upload_gets_thumbnail_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            doc = Document.objects.create(
+                student=self.student,
+                document_type='ADDITIONAL',
+                title='Photo',
+                file=SimpleUploadedFile('photo.png', png_bytes(), content_type='image/png'),
+            )
+        doc.refresh_from_db()
+        self.assertTrue(doc.thumbnail.name.endswith('.webp'))
+        self.assertIn('/thumbs/', doc.thumbnail.name)
+
+        from PIL import Image
+        with doc.thumbnail.open('rb') as f:
+            image = Image.open(f)
+            self.assertLessEqual(max(image.size), 320)
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+    def test_failed_or_rolled_back_upload_leaves_no_work_file(self):
+        Document.objects.create(
+            student=self.student, document_type='ADDITIONAL', title='Photo',
+            file=SimpleUploadedFile('photo.png', png_bytes()),
+        )
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                Document.objects.create(
+                    student=self.student, document_type='ADDITIONAL', title='Photo',
+                    file=SimpleUploadedFile('again.png', png_bytes()),
+                )
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Document.objects.create(
+                    student=self.student, document_type='ADDITIONAL', title='Other',
+                    file=SimpleUploadedFile('other.png', png_bytes()),
+                )
+                raise RuntimeError('rolled back')
+        self.assertEqual(callbacks, [])
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+    @override_settings(DOCUMENT_DEDUPLICATION=True)
+    def test_reuploading_the_same_bytes_keeps_the_thumbnail(self):
+        from documents import derivatives
+        content = png_bytes()
+        with self.captureOnCommitCallbacks(execute=True):
+            doc = Document.objects.create(
+                student=self.student, document_type='ADDITIONAL', title='Photo',
+                file=SimpleUploadedFile('photo.png', content),
+            )
+        doc.refresh_from_db()
+        thumbnail = doc.thumbnail.name
+
+        doc.file = SimpleUploadedFile('photo.png', content)
+        with mock.patch.object(derivatives, 'render_thumbnail') as render, \
+                self.captureOnCommitCallbacks(execute=True):
+            doc.save()
+        render.assert_not_called()
+        doc.refresh_from_db()
+        self.assertEqual(doc.thumbnail.name, thumbnail)
+        self.assertFalse(StorageTombstone.objects.exists())
+
+    def test_thumbnail_for_a_replaced_file_is_dropped(self):
+        from documents import derivatives
+        doc = Document.objects.create(
+            student=self.student, document_type='ADDITIONAL', title='Photo',
+            file=SimpleUploadedFile('photo.png', png_bytes()),
+        )
+        storage = Document._meta.get_field('thumbnail').storage
+        with mock.patch.object(type(storage), 'save') as save:
+            derivatives._store(Document, doc.pk, 'file', 'thumbnail', b'webp', source_name='documents/older.png')
+        save.assert_not_called()
+        doc.refresh_from_db()
+        self.assertFalse(doc.thumbnail)
+
+    def test_unsupported_file_gets_no_thumbnail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            doc = Document.objects.create(
+                student=self.student,
+                document_type='PAN',
+                title='PAN',
+                file=SimpleUploadedFile('pan.pdf', b'not really a pdf'),
+            )
+        doc.refresh_from_db()
+        self.assertFalse(doc.thumbnail)
+
+    def test_backfill_command(self):
+        with override_settings(DOCUMENT_THUMBNAILS=False):
+            doc = Document.objects.create(
+                student=self.student,
+                document_type='ADDITIONAL',
+                title='Photo',
+                file=SimpleUploadedFile('photo.png', png_bytes()),
+            )
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        doc.refresh_from_db()
+        self.assertTrue(doc.thumbnail)
+        self.assertIn('Document: 1 thumbnails created', out.getvalue())
+
+
+def scanned_pdf_bytes(size=(2400, 1800)):
+    from PIL import Image
+
+    noise = Image.frombytes('L', size, os.urandom(size[0] * size[1])).convert('RGB')
+    out = BytesIO()
+    noise.save(out, 'PDF', resolution=300)
+    return out.getvalue()
+
+
+@skipUnless(importlib.util.find_spec('pikepdf'), 'pikepdf is not installed')
+@override_settings(
+    DOCUMENT_PDF_OPTIMIZE=True,
+    DOCUMENT_PDF_MAX_IMAGE_DIMENSION=1000,
+    DOCUMENT_THUMBNAILS=False,
+    DERIVATIVE_WORKERS=0,
+)
+class PdfOptimizationTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+
+    def test_pdf_is_linearized_and_shrunk_after_commit(self):
+        import pikepdf
+        content = scanned_pdf_bytes()
+        with self.captureOnCommitCallbacks(execute=True):
+            doc = Document.objects.create(
+                student=self.student,
+                document_type='10TH_MARKSHEET',
+                title='scan',
+                file=SimpleUploadedFile('scan.pdf', content, content_type='application/pdf'),
+            )
+        doc.refresh_from_db()
+        self.assertEqual(doc.original_size_bytes, len(content))
+        self.assertLess(doc.size_bytes, len(content))
+        self.assertEqual(doc.original_filename, 'scan.pdf')
+        self.assertNotEqual(doc.sha256, hashlib.sha256(content).hexdigest())
+        with doc.file.open('rb') as f, pikepdf.open(f) as pdf:
+            self.assertTrue(pdf.is_linearized)
+            self.assertEqual(len(pdf.pages), 1)
+
+    @override_settings(DOCUMENT_THUMBNAILS=True)
+    def test_thumbnail_is_rendered_once_from_the_optimized_file(self):
+        from documents import derivatives
+        render = mock.Mock(wraps=derivatives.render_thumbnail)
+        with mock.patch.object(derivatives, 'render_thumbnail', render), \
+                self.captureOnCommitCallbacks(execute=True):
+            doc = Document.objects.create(
+                student=self.student,
+                document_type='10TH_MARKSHEET',
+                title='scan',
+                file=SimpleUploadedFile('scan.pdf', scanned_pdf_bytes(), content_type='application/pdf'),
+            )
+        doc.refresh_from_db()
+        self.assertIsNotNone(doc.original_size_bytes)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(doc.thumbnail.name, derivatives.thumbnail_name(doc.file.name))
+        self.assertFalse(StorageTombstone.objects.filter(name__contains='/thumbs/').exists())
+
+    @override_settings(DOCUMENT_THUMBNAILS=True)
+    def test_kept_original_still_gets_a_thumbnail(self):
+        from documents import derivatives
+        with mock.patch.object(derivatives, 'optimize_pdf', side_effect=lambda path, *args: os.remove(path)), \
+                self.captureOnCommitCallbacks(execute=True):
+            doc = Document.objects.create(
+                student=self.student,
+                document_type='PAN',
+                title='scan',
+                file=SimpleUploadedFile('scan.pdf', scanned_pdf_bytes((400, 300))),
+            )
+        doc.refresh_from_db()
+        self.assertIsNone(doc.original_size_bytes)
+        self.assertTrue(doc.thumbnail)
+
+    @override_settings(DOCUMENT_PDF_OPTIMIZE=False)
+    def test_disabled_by_default_setting(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            doc = Document.objects.create(
+                student=self.student,
+                document_type='PAN',
+                title='scan',
+                file=SimpleUploadedFile('scan.pdf', scanned_pdf_bytes((400, 300))),
+            )
+        doc.refresh_from_db()
+        self.assertIsNone(doc.original_size_bytes)
+
+
+class UploadSignatureTests(TestCase):
+    def test_webp_signature_skips_the_riff_size(self):
+        from PIL import Image
+        from documents.upload_handlers import content_matches, read_head
+        out = BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(out, 'WEBP')
+        self.assertTrue(content_matches('webp', read_head(out)))
+        self.assertFalse(content_matches('webp', b'RIFF\x24\x00\x00\x00WAVEfmt '))
+        self.assertFalse(content_matches('png', read_head(out)))
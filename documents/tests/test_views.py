@@ -1,22 +1,43 @@
 """Tests for documents app views."""
 import io
+import os
+import tempfile
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from students.models import StudentProfile
 from documents.models import Document
+from documents.tests import TempStorageMixin
 from accounts.models import Notification
 
 User = get_user_model()
 
 
+def png_bytes(size=(800, 600)):
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new('RGB', size, 'navy').save(out, 'PNG')
+    return out.getvalue()
+
+
 def make_student(username='student1', **kwargs):
     defaults = {'email': 's@x.com', 'password': 'testpass123', 'role': 'STUDENT'}
     defaults.update(kwargs)
     return User.objects.create_user(username=username, **defaults)
 
 
+def use_temp_dir(test, setting):
+    """Point ``setting`` at a fresh directory for the duration of ``test``."""
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    override = override_settings(**{setting: directory.name})
+    override.enable()
+    test.addCleanup(override.disable)
+    return directory.name
+
+
 def make_admin(username='admin1'):
     u = User.objects.create_user(
         username=username,
@@ -29,8 +50,7 @@ def make_admin(username='admin1'):
     return u
 
 
-@override_settings(MEDIA_ROOT='/tmp/mbbs_test_media')
-class DocumentUploadTests(TestCase):
+class DocumentUploadTests(TempStorageMixin, TestCase):
     def setUp(self):
         self.student = make_student()
         self.profile = StudentProfile.objects.create(user=self.student, passport_number='', address='')
@@ -45,6 +65,84 @@ class DocumentUploadTests(TestCase):
         response = c.get(reverse('documents:upload'))
         self.assertEqual(response.status_code, 200)
 
+    def test_upload_spools_and_hashes_while_streaming(self):
+        import hashlib
+        content = b'%PDF-1.4 streamed upload'
+        c = Client()
+        c.login(username='student1', password='testpass123')
+        response = c.post(reverse('documents:upload'), {
+            'document_type': 'PAN',
+            'title': 'PAN',
+            'file': SimpleUploadedFile('pan.pdf', content, content_type='application/pdf'),
+        })
+        self.assertRedirects(response, reverse('students:dashboard'), fetch_redirect_response=False)
+        document = Document.objects.get(student=self.student)
+        self.assertEqual(document.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(document.size_bytes, len(content))
+
+    def test_upload_with_mismatched_magic_bytes_is_rejected(self):
+        c = Client()
+        c.login(username='student1', password='testpass123')
+        response = c.post(reverse('documents:upload'), {
+            'document_type': 'PAN',
+            'file': SimpleUploadedFile('pan.pdf', b'MZ not really a pdf'),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('does not match its extension', response.context['form'].errors['file'][0])
+        self.assertFalse(Document.objects.exists())
+
+    def test_webp_is_not_offered_for_documents(self):
+        c = Client()
+        c.login(username='student1', password='testpass123')
+        response = c.post(reverse('documents:upload'), {
+            'document_type': 'PAN',
+            'file': SimpleUploadedFile('pan.webp', b'RIFF\x24\x00\x00\x00WEBPVP8 '),
+        })
+        self.assertEqual(
+            response.context['form'].errors['file'][0], 'Unsupported file extension: webp. Allowed: pdf, jpg, jpeg, png'
+        )
+
+    def test_upload_view_still_checks_csrf(self):
+        c = Client(enforce_csrf_checks=True)
+        c.login(username='student1', password='testpass123')
+        response = c.post(reverse('documents:upload'), {
+            'document_type': 'PAN',
+            'title': 'PAN',
+            'file': SimpleUploadedFile('pan.pdf', b'%PDF-1.4 forged'),
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Document.objects.exists())
+
+    def test_other_views_keep_the_default_upload_handlers(self):
+        from django.core.files.uploadhandler import MemoryFileUploadHandler
+        from django.test import RequestFactory
+        from documents.upload_handlers import StreamingValidationUploadHandler
+        request = RequestFactory().post('/admin/', {'file': SimpleUploadedFile('a.txt', b'plain text')})
+        self.assertIsInstance(request.upload_handlers[0], MemoryFileUploadHandler)
+        self.assertFalse(any(isinstance(h, StreamingValidationUploadHandler) for h in request.upload_handlers))
+        self.assertEqual(request.FILES['file'].read(), b'plain text')
+
+    @override_settings(DOCUMENT_UPLOAD_MAX_SIZE=16)
+    def test_oversize_upload_is_rejected_while_streaming(self):
+        c = Client()
+        c.login(username='student1', password='testpass123')
+        response = c.post(reverse('documents:upload'), {
+            'document_type': 'PAN',
+            'file': SimpleUploadedFile('pan.pdf', b'%PDF-1.4' + b'x' * 64),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].errors['file'][0], 'File size too large. Max 16 bytes.')
+        self.assertFalse(Document.objects.exists())
+
+    @override_settings(DOCUMENT_UPLOAD_MAX_SIZE=5 * 1024 * 1024)
+    def test_size_limit_in_message_follows_setting(self):
+        self.client.login(username='student1', password='testpass123')
+        session = self.client.post(reverse('documents:chunked_upload_start'), {
+            'document_type': 'PAN', 'title': 'PAN', 'filename': 'pan.pdf', 'total_size': 6 * 1024 * 1024,
+        })
+        self.assertEqual(session.status_code, 400)
+        self.assertIn('Max 5MB.', session.json()['error'])
+
     def test_admin_deleting_document_creates_notification(self):
         admin = make_admin()
         doc = Document.objects.create(
@@ -62,7 +160,7 @@ class DocumentUploadTests(TestCase):
         self.assertFalse(Document.objects.filter(id=doc.id).exists())
 
 
-class DocumentDeleteTests(TestCase):
+class DocumentDeleteTests(TempStorageMixin, TestCase):
     def setUp(self):
         self.student = make_student()
         self.profile = StudentProfile.objects.create(user=self.student, passport_number='', address='')
@@ -92,7 +190,7 @@ class DocumentDeleteTests(TestCase):
         self.assertEqual(response.status_code, 302)
 
 
-class DocumentDownloadTests(TestCase):
+class DocumentDownloadTests(TempStorageMixin, TestCase):
     def setUp(self):
         self.student = make_student()
         self.profile = StudentProfile.objects.create(user=self.student, passport_number='', address='')
@@ -120,6 +218,163 @@ class DocumentDownloadTests(TestCase):
         self.assertRedirects(response, reverse('students:dashboard'), fetch_redirect_response=False)
 
 
+@override_settings(DOCUMENT_DIRECT_UPLOAD_BACKEND='local')
+class DirectUploadTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+        self.profile = StudentProfile.objects.create(user=self.student, passport_number='', address='')
+        self.client = Client()
+        self.client.login(username='student1', password='testpass123')
+        self.work_dir = use_temp_dir(self, 'DOCUMENT_DERIVATIVE_WORK_DIR')
+
+    def get_ticket(self, **overrides):
+        data = {'document_type': 'AADHAAR', 'title': 'Aadhaar', 'filename': 'aadhaar.pdf'}
+        data.update(overrides)
+        return self.client.post(reverse('documents:direct_upload_ticket'), data)
+
+    def upload(self, ticket, content, name='aadhaar.pdf'):
+        return Client().post(ticket['upload_url'], {
+            **ticket['fields'],
+            'file': SimpleUploadedFile(name, content),
+        })
+
+    def commit(self, ticket, result):
+        return self.client.post(reverse('documents:direct_upload_commit'), {
+            'ticket': ticket['ticket'],
+            'public_id': result['public_id'],
+            'version': result['version'],
+            'signature': result['signature'],
+        })
+
+    def test_ticket_upload_and_commit_creates_document(self):
+        import hashlib
+        ticket = self.get_ticket().json()
+        self.assertEqual(ticket['upload_url'], reverse('documents:direct_upload_local'))
+
+        upload = self.upload(ticket, b'%PDF-1.4 direct')
+        self.assertEqual(upload.status_code, 200)
+
+        response = self.commit(ticket, upload.json())
+        self.assertEqual(response.status_code, 201)
+        document = Document.objects.get(id=response.json()['id'])
+        self.assertEqual(document.student, self.student)
+        self.assertEqual(document.document_type, 'AADHAAR')
+        self.assertEqual(document.size_bytes, len(b'%PDF-1.4 direct'))
+        self.assertEqual(document.sha256, hashlib.sha256(b'%PDF-1.4 direct').hexdigest())
+        self.assertEqual(document.original_filename, 'aadhaar.pdf')
+        self.assertEqual(document.content_type, 'application/pdf')
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.visa_status, 'DOCUMENTS_SUBMITTED')
+
+    def test_ticket_rejects_unsupported_extension(self):
+        response = self.get_ticket(filename='virus.exe')
+        self.assertEqual(response.status_code, 400)
+
+    def test_commit_rejects_forged_result(self):
+        ticket = self.get_ticket().json()
+        response = self.client.post(reverse('documents:direct_upload_commit'), {
+            'ticket': ticket['ticket'],
+            'public_id': 'documents/other/AADHAAR/forged.pdf',
+            'version': '1',
+            'signature': 'forged',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+
+    def test_local_storage_rejects_tampered_ticket(self):
+        ticket = self.get_ticket().json()
+        response = Client().post(reverse('documents:direct_upload_local'), {
+            'ticket': ticket['ticket'] + 'x',
+            'file': SimpleUploadedFile('aadhaar.pdf', b'%PDF-1.4'),
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_ticket_signs_formats_and_size_limit(self):
+        from documents.direct_upload import read_ticket
+        payload = read_ticket(self.get_ticket(filename='scan.JPG').json()['ticket'])
+        self.assertEqual(payload['allowed_formats'], ['jpg', 'jpeg'])
+        self.assertEqual(payload['max_size'], 10 * 1024 * 1024)
+
+    @override_settings(DOCUMENT_UPLOAD_MAX_SIZE=16)
+    def test_local_storage_enforces_signed_size_limit(self):
+        ticket = self.get_ticket().json()
+        response = self.upload(ticket, b'%PDF-1.4' + b'x' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('too large', response.json()['error'])
+
+    def test_ticket_is_single_use(self):
+        ticket = self.get_ticket().json()
+        first = self.upload(ticket, b'%PDF-1.4 once')
+        self.assertEqual(first.status_code, 200)
+        again = self.upload(ticket, b'%PDF-1.4 twice')
+        self.assertEqual(again.status_code, 400)
+        self.assertIn('already been used', again.json()['error'])
+        # No suffixed copy next to the first upload
+        path = os.path.join(self.private_root, first.json()['public_id'])
+        stem = os.path.splitext(os.path.basename(path))[0]
+        self.assertEqual([f for f in os.listdir(os.path.dirname(path)) if f.startswith(stem)], [os.path.basename(path)])
+
+        self.assertEqual(self.commit(ticket, first.json()).status_code, 201)
+        response = self.commit(ticket, first.json())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already been used', response.json()['error'])
+        self.assertEqual(Document.objects.count(), 1)
+
+    def test_commit_rejects_stored_content_not_matching_extension(self):
+        from django.core.files.base import ContentFile
+        from documents.direct_upload import read_ticket, sign_local_result
+        from documents.models import StorageTombstone
+        ticket = self.get_ticket().json()
+        name = read_ticket(ticket['ticket'])['name']
+        # Bytes that reached storage without going through the local endpoint's checks
+        Document._meta.get_field('file').storage.save(name, ContentFile(b'MZ\x90\x00 not a pdf'))
+        response = self.commit(ticket, {'public_id': name, 'version': 1, 'signature': sign_local_result(name, 1)})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('does not match its extension', response.json()['error'])
+        self.assertFalse(Document.objects.exists())
+        self.assertTrue(StorageTombstone.objects.filter(name=name).exists())
+
+    def test_identical_direct_uploads_share_a_blob(self):
+        from documents.models import StorageTombstone
+        documents = []
+        for title in ('First', 'Second'):
+            ticket = self.get_ticket(title=title).json()
+            result = self.upload(ticket, b'%PDF-1.4 same bytes').json()
+            documents.append(Document.objects.get(id=self.commit(ticket, result).json()['id']))
+            last_name = result['public_id']
+        self.assertIsNotNone(documents[0].blob)
+        self.assertEqual(documents[0].blob, documents[1].blob)
+        self.assertEqual(documents[1].file.name, documents[0].file.name)
+        documents[0].blob.refresh_from_db()
+        self.assertEqual(documents[0].blob.ref_count, 2)
+        self.assertTrue(StorageTombstone.objects.filter(name=last_name).exists())
+
+    @override_settings(DERIVATIVE_WORKERS=0)
+    def test_duplicate_commit_leaves_no_work_file(self):
+        tickets = [self.get_ticket().json() for _ in range(2)]
+        results = [self.upload(ticket, b'%PDF-1.4 twice') for ticket in tickets]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.commit(tickets[0], results[0].json()).status_code, 201)
+            self.assertEqual(self.commit(tickets[1], results[1].json()).status_code, 409)
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+    def test_local_storage_rejects_content_not_matching_extension(self):
+        ticket = self.get_ticket().json()
+        response = Client().post(ticket['upload_url'], {
+            **ticket['fields'],
+            'file': SimpleUploadedFile('aadhaar.pdf', b'MZ\x90\x00 not a pdf'),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('does not match its extension', response.json()['error'])
+
+    def test_student_cannot_request_admin_ticket(self):
+        response = self.client.post(
+            reverse('documents:admin_direct_upload_ticket', kwargs={'student_id': self.profile.id}),
+            {'document_type': 'PAN', 'filename': 'pan.pdf'},
+        )
+        self.assertEqual(response.status_code, 403)
+
+
 class DocumentURLReverseTests(TestCase):
     def test_all_document_urls_reverse(self):
         reverse('documents:upload')
@@ -127,3 +382,472 @@ class DocumentURLReverseTests(TestCase):
         reverse('documents:view', kwargs={'document_id': 1})
         reverse('documents:download', kwargs={'document_id': 1})
         reverse('documents:delete', kwargs={'document_id': 1})
+        reverse('documents:direct_upload_ticket')
+        reverse('documents:admin_direct_upload_ticket', kwargs={'student_id': 1})
+        reverse('documents:direct_upload_commit')
+        reverse('documents:direct_upload_local')
+
+
+@override_settings(DOCUMENT_UPLOAD_CHUNK_SIZE=4)
+class ChunkedUploadTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+        self.profile = StudentProfile.objects.create(user=self.student, passport_number='', address='')
+        self.client = Client()
+        self.client.login(username='student1', password='testpass123')
+        self.work_dir = use_temp_dir(self, 'DOCUMENT_DERIVATIVE_WORK_DIR')
+
+    def start(self, content):
+        return self.client.post(reverse('documents:chunked_upload_start'), {
+            'document_type': 'PAN', 'title': 'PAN', 'filename': 'pan.pdf', 'total_size': len(content),
+        }).json()
+
+    def send(self, upload_id, offset, data, checksum=None):
+        import hashlib
+        return self.client.post(
+            reverse('documents:chunked_upload_chunk', kwargs={'upload_id': upload_id}),
+            data,
+            content_type='application/octet-stream',
+            HTTP_X_CHUNK_OFFSET=str(offset),
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(data).hexdigest(),
+        )
+
+    def test_resume_after_interruption_creates_document(self):
+        content = b'%PDF-1.4 resumable'
+        session = self.start(content)
+        self.assertEqual(session['chunk_size'], 4)
+        self.send(session['upload_id'], 0, content[0:4])
+        self.send(session['upload_id'], 4, content[4:8])
+
+        # Client reconnects and asks where to resume
+        status = self.client.get(
+            reverse('documents:chunked_upload_chunk', kwargs={'upload_id': session['upload_id']})
+        ).json()
+        self.assertEqual(status['offset'], 8)
+
+        offset = status['offset']
+        while offset < len(content):
+            response = self.send(session['upload_id'], offset, content[offset:offset + 4])
+            offset = response.json()['offset']
+        self.assertEqual(response.status_code, 200)
+        document = Document.objects.get(id=response.json()['document_id'])
+        self.assertEqual(document.size_bytes, len(content))
+        self.assertEqual(document.original_filename, 'pan.pdf')
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.visa_status, 'DOCUMENTS_SUBMITTED')
+
+    def test_bad_checksum_is_rejected_without_advancing(self):
+        session = self.start(b'12345678')
+        response = self.send(session['upload_id'], 0, b'1234', checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_wrong_offset_reports_resume_point(self):
+        session = self.start(b'12345678')
+        response = self.send(session['upload_id'], 4, b'5678')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_other_user_cannot_send_chunks(self):
+        session = self.start(b'12345678')
+        make_student(username='other1')
+        other = Client()
+        other.login(username='other1', password='testpass123')
+        response = other.get(reverse('documents:chunked_upload_chunk', kwargs={'upload_id': session['upload_id']}))
+        self.assertEqual(response.status_code, 404)
+
+    def send_all(self, upload_id, content):
+        for offset in range(0, len(content), 4):
+            response = self.send(upload_id, offset, content[offset:offset + 4])
+        return response
+
+    def test_start_rejects_existing_type_and_title(self):
+        Document.objects.create(student=self.student, document_type='PAN', title='PAN', file='documents/x.pdf')
+        response = self.client.post(reverse('documents:chunked_upload_start'), {
+            'document_type': 'PAN', 'title': 'PAN', 'filename': 'pan.pdf', 'total_size': 8,
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already exists', response.json()['error'])
+
+    def test_duplicate_title_on_completion_fails_the_session(self):
+        from documents.chunked_upload import spool_path
+        from documents.models import UploadSession
+        content = b'%PDF-1.4 duplicate'
+        session = self.start(content)
+        # Another upload with the same type and title finishes first
+        Document.objects.create(student=self.student, document_type='PAN', title='PAN', file='documents/x.pdf')
+        response = self.send_all(session['upload_id'], content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already exists', str(response.json()['errors']['title']))
+        upload = UploadSession.objects.get(pk=session['upload_id'])
+        self.assertEqual(upload.status, UploadSession.STATUS_FAILED)
+        self.assertFalse(os.path.exists(spool_path(upload)))
+        self.assertEqual(Document.objects.count(), 1)
+
+    def test_duplicate_committed_after_the_check_fails_the_session(self):
+        from unittest import mock
+        from documents.models import UploadSession
+        content = b'%PDF-1.4 race'
+        session = self.start(content)
+        Document.objects.create(student=self.student, document_type='PAN', title='PAN', file='documents/x.pdf')
+        with mock.patch('documents.chunked_upload._duplicate', return_value=False), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.send_all(session['upload_id'], content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already exists', str(response.json()['errors']['title']))
+        self.assertEqual(UploadSession.objects.get(pk=session['upload_id']).status, UploadSession.STATUS_FAILED)
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+    def test_error_while_saving_fails_the_session_and_discards_spool(self):
+        from unittest import mock
+        from documents.chunked_upload import spool_path
+        from documents.models import UploadSession
+        content = b'%PDF-1.4 broken'
+        session = self.start(content)
+        with mock.patch.object(Document, 'save', side_effect=RuntimeError('storage down')):
+            with self.assertRaises(RuntimeError):
+                self.send_all(session['upload_id'], content)
+        upload = UploadSession.objects.get(pk=session['upload_id'])
+        self.assertEqual(upload.status, UploadSession.STATUS_FAILED)
+        self.assertIsNone(upload.document)
+        self.assertFalse(os.path.exists(spool_path(upload)))
+
+    def test_content_not_matching_extension_is_rejected(self):
+        content = b'MZ\x90\x00 not a pdf'
+        session = self.start(content)
+        offset = 0
+        while offset < len(content):
+            response = self.send(session['upload_id'], offset, content[offset:offset + 4])
+            offset += 4
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('does not match its extension', str(response.json()['errors']))
+        self.assertFalse(Document.objects.exists())
+
+
+@override_settings(DERIVATIVE_WORKERS=0)
+class BatchUploadTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+        self.profile = StudentProfile.objects.create(user=self.student, passport_number='', address='')
+        self.client.login(username='student1', password='testpass123')
+
+    def batch(self, rows, total=5):
+        data = {'form-TOTAL_FORMS': str(total), 'form-INITIAL_FORMS': '0'}
+        types = [value for value, _ in Document.DOCUMENT_TYPE_CHOICES]
+        for i in range(total):
+            data[f'form-{i}-document_type'] = types[i % len(types)]
+        for i, (document_type, title, name, content) in enumerate(rows):
+            data[f'form-{i}-document_type'] = document_type
+            data[f'form-{i}-title'] = title
+            data[f'form-{i}-file'] = SimpleUploadedFile(name, content)
+        return data
+
+    def test_student_uploads_several_documents_in_one_request(self):
+        from unittest import mock
+        from documents.models import StoredBlob
+        data = self.batch([
+            ('10TH_MARKSHEET', '', '10th.pdf', b'%PDF-1.4 tenth'),
+            ('12TH_MARKSHEET', '', '12th.pdf', b'%PDF-1.4 same bytes'),
+            ('AADHAAR', 'front', 'aadhaar.pdf', b'%PDF-1.4 same bytes'),
+        ])
+        # Rows are bulk-created, never saved one by one
+        with mock.patch.object(Document, 'save', side_effect=AssertionError('save() called')):
+            response = self.client.post(reverse('documents:batch_upload'), data)
+
+        self.assertRedirects(response, reverse('students:dashboard'), fetch_redirect_response=False)
+        self.assertEqual(Document.objects.filter(student=self.student).count(), 3)
+        self.assertEqual(StoredBlob.objects.count(), 2)
+        self.assertEqual(StoredBlob.objects.get(sha256=Document.objects.get(title='front').sha256).ref_count, 2)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.visa_status, 'DOCUMENTS_SUBMITTED')
+
+    def test_batch_rejected_as_a_whole_when_one_file_is_invalid(self):
+        data = self.batch([
+            ('10TH_MARKSHEET', '', '10th.pdf', b'%PDF-1.4 tenth'),
+            ('PAN', '', 'pan.pdf', b'MZ not a pdf'),
+        ])
+        response = self.client.post(reverse('documents:batch_upload'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('does not match its extension', response.context['formset'].forms[1].errors['file'][0])
+        self.assertFalse(Document.objects.exists())
+
+    def test_duplicate_type_and_title_rejected(self):
+        data = self.batch([
+            ('PAN', 'card', 'a.pdf', b'%PDF-1.4 a'),
+            ('PAN', 'card', 'b.pdf', b'%PDF-1.4 b'),
+        ])
+        response = self.client.post(reverse('documents:batch_upload'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['formset'].non_form_errors())
+        self.assertFalse(Document.objects.exists())
+
+    @override_settings(DOCUMENT_DEDUPLICATION=False)
+    def test_admin_batch_upload_for_student(self):
+        make_admin()
+        client = Client()
+        client.login(username='admin1', password='testpass123')
+        response = client.post(
+            reverse('documents:admin_batch_upload', args=[self.profile.id]),
+            self.batch([('PAN', '', 'pan.pdf', b'%PDF-1.4 pan')]),
+        )
+        self.assertRedirects(
+            response, reverse('students:student_detail', args=[self.profile.id]), fetch_redirect_response=False
+        )
+        document = Document.objects.get(student=self.student)
+        self.assertTrue(document.file.name.startswith('documents/student1/PAN/'))
+        self.assertEqual(document.uploaded_by.username, 'admin1')
+
+
+@override_settings(DOCUMENT_THUMBNAILS=True, DERIVATIVE_WORKERS=0, DOCUMENT_DEDUPLICATION=False)
+class DocumentThumbnailTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.media = os.path.join(root, 'media')
+        self.private = os.path.join(root, 'private')
+        override = override_settings(MEDIA_ROOT=self.media, DOCUMENT_PRIVATE_ROOT=self.private)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.student = make_student()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.document = Document.objects.create(
+                student=self.student, document_type='ADDITIONAL', title='Photo',
+                file=SimpleUploadedFile('photo.png', png_bytes(), content_type='image/png'),
+            )
+        self.document.refresh_from_db()
+
+    def test_preview_is_private_and_permission_checked(self):
+        name = self.document.thumbnail.name
+        self.assertTrue(os.path.exists(os.path.join(self.private, name)))
+        self.assertFalse(os.path.exists(os.path.join(self.media, name)))
+
+        url = reverse('documents:thumbnail', args=[self.document.id])
+        self.client.login(username='student1', password='testpass123')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('private', response['Cache-Control'])
+
+        make_student('student2')
+        other = Client()
+        other.login(username='student2', password='testpass123')
+        self.assertEqual(other.get(url).status_code, 404)
+        self.assertEqual(Client().get(url).status_code, 302)
+
+    def test_existing_public_previews_are_moved(self):
+        from django.core.management import call_command
+
+        name = self.document.thumbnail.name
+        os.makedirs(os.path.dirname(os.path.join(self.media, name)))
+        os.replace(os.path.join(self.private, name), os.path.join(self.media, name))
+        with override_settings(MEDIA_STORAGE_BACKEND='local'):
+            call_command('move_document_previews', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(os.path.join(self.private, name)))
+        self.assertFalse(os.path.exists(os.path.join(self.media, name)))
+
+
+@override_settings(DOCUMENT_DEDUPLICATION=False, DOCUMENT_THUMBNAILS=False)
+class DocumentZipExportTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+        self.profile = StudentProfile.objects.create(user=self.student, passport_number='', address='')
+        for document_type, title, content in (
+            ('PAN', '', b'%PDF-1.4 pan'),
+            ('AADHAAR', 'front', b'%PDF-1.4 front'),
+            ('AADHAAR', 'back', b'%PDF-1.4 back'),
+        ):
+            Document.objects.create(
+                student=self.student,
+                document_type=document_type,
+                title=title,
+                file=SimpleUploadedFile('scan.pdf', content),
+            )
+
+    def test_admin_streams_all_documents_as_zip(self):
+        import zipfile
+        make_admin()
+        c = Client()
+        c.login(username='admin1', password='testpass123')
+        response = c.get(reverse('documents:student_documents_zip', args=[self.profile.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(
+            sorted(archive.namelist()),
+            ['AADHAAR/scan (2).pdf', 'AADHAAR/scan.pdf', 'PAN/scan.pdf'],
+        )
+        self.assertEqual(archive.read('PAN/scan.pdf'), b'%PDF-1.4 pan')
+
+    def test_student_cannot_export(self):
+        c = Client()
+        c.login(username='student1', password='testpass123')
+        response = c.get(reverse('documents:student_documents_zip', args=[self.profile.id]))
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(DOCUMENT_DEDUPLICATION=False, DOCUMENT_THUMBNAILS=False)
+class SignedDownloadTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.student = make_student()
+        self.profile = StudentProfile.objects.create(user=self.student, passport_number='', address='')
+        self.document = Document.objects.create(
+            student=self.student,
+            document_type='PAN',
+            title='PAN',
+            file=SimpleUploadedFile('pan.pdf', b'%PDF-1.4 signed'),
+        )
+
+    def test_signed_url_serves_file_without_session(self):
+        from documents import signed_urls
+        response = Client().get(signed_urls.signed_url(self.document))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 signed')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_dashboard_links_to_signed_urls_signed_once_per_ttl(self):
+        from unittest import mock
+        from documents import signed_urls
+        c = Client()
+        c.login(username='student1', password='testpass123')
+        with mock.patch.object(signed_urls, '_sign', wraps=signed_urls._sign) as sign:
+            first = c.get(reverse('students:dashboard'))
+            second = c.get(reverse('students:dashboard'))
+        self.assertEqual(sign.call_count, 1)
+        url = first.context['documents'][0].download_url
+        self.assertTrue(url.startswith('/documents/signed/'))
+        self.assertContains(second, url)
+
+    def test_expired_or_tampered_links_are_rejected(self):
+        from unittest import mock
+        from documents import signed_urls
+        url = signed_urls.signed_url(self.document)
+        with mock.patch('documents.signed_urls.time.time', return_value=10 ** 10):
+            self.assertEqual(Client().get(url).status_code, 404)
+        self.assertEqual(Client().get(url[:-3] + 'xyz/').status_code, 404)
+
+
+@override_settings(DOCUMENT_DEDUPLICATION=False, DOCUMENT_THUMBNAILS=False)
+class LocalStorageServingTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.student = make_student()
+        StudentProfile.objects.create(user=self.student, passport_number='', address='')
+        self.document = Document.objects.create(
+            student=self.student,
+            document_type='PAN',
+            title='PAN',
+            file=SimpleUploadedFile('pan card.pdf', b'%PDF-1.4 local', content_type='application/pdf'),
+        )
+        self.client.login(username='student1', password='testpass123')
+        self.url = reverse('documents:download', kwargs={'document_id': self.document.id})
+
+    def test_private_root_is_used(self):
+        self.assertTrue(self.document.file.path.startswith(self.private_root + os.sep))
+
+    def test_served_directly_without_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 local')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('pan card.pdf', response['Content-Disposition'])
+
+    @override_settings(DOCUMENT_SENDFILE_BACKEND='nginx', DOCUMENT_SENDFILE_URL_PREFIX='/protected-media/')
+    def test_nginx_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.document.file.name.replace(' ', '%20'))
+        self.assertEqual(response.content, b'')
+
+    @override_settings(DOCUMENT_SENDFILE_BACKEND='xsendfile')
+    def test_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.document.file.path)
+
+
+@override_settings(DOCUMENT_DEDUPLICATION=False, DOCUMENT_THUMBNAILS=False)
+class RangeAndConditionalDeliveryTests(TempStorageMixin, TestCase):
+    content = b'%PDF-1.4 0123456789abcdef'
+
+    def setUp(self):
+        self.student = make_student()
+        StudentProfile.objects.create(user=self.student, passport_number='', address='')
+        self.document = Document.objects.create(
+            student=self.student,
+            document_type='PAN',
+            title='PAN',
+            file=SimpleUploadedFile('pan.pdf', self.content, content_type='application/pdf'),
+        )
+        self.client.login(username='student1', password='testpass123')
+        self.url = reverse('documents:download', kwargs={'document_id': self.document.id}) + '?inline=1'
+
+    def test_full_response_has_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{self.document.sha256}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('Last-Modified', response)
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+
+    def test_range_request_returns_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=9-12')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'0123')
+        self.assertEqual(response['Content-Range'], f'bytes 9-12/{len(self.content)}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-6')
+        self.assertEqual(b''.join(response.streaming_content), b'abcdef')
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range_mismatch_serves_full_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_repeat_view_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_other_student_gets_no_validators(self):
+        make_student(username='other1')
+        c = Client()
+        c.login(username='other1', password='testpass123')
+        response = c.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.document.sha256}"')
+        self.assertEqual(response.status_code, 302)
+
+
+class StorageMetricsViewTests(TestCase):
+    def test_admin_sees_breaker_state_and_latency(self):
+        from documents import resilience
+
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+        resilience.guarded('exists', lambda: True)
+        c = Client()
+        c.force_login(make_admin())
+        response = c.get(reverse('documents:storage_metrics'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['circuit_breaker']['state'], 'closed')
+        self.assertEqual(data['operations']['exists']['calls'], 1)
+
+    def test_students_are_refused(self):
+        c = Client()
+        c.force_login(make_student())
+        response = c.get(reverse('documents:storage_metrics'))
+        self.assertEqual(response.status_code, 302)
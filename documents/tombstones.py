@@ -0,0 +1,180 @@
+"""
+Deferred, batched deletion of stored files.
+
+Deleting a Document or StudentProfile used to call the storage provider once
+per file inside the request, so deleting a student with many documents meant
+a chain of blocking Cloudinary round-trips. Signals now only ``bury`` the
+names as StorageTombstone rows in the same transaction, and the
+``drain_storage_deletions`` command removes them in bulk: Cloudinary through
+``cloudinary.api.delete_resources`` (up to DELETE_BATCH_LIMIT public ids per
+call), local storages file by file. Failed deletions are retried with
+exponential backoff.
+"""
+import logging
+import random
+import uuid
+from datetime import timedelta
+
+import cloudinary.api
+from cloudinary_storage.storage import MediaCloudinaryStorage, RawMediaCloudinaryStorage
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Q
+from django.utils import timezone
+
+from . import resilience
+from .models import StorageTombstone
+from .storage import (
+    PrivateFileSystemStorage, ResilientMediaCloudinaryStorage, ResilientRawMediaCloudinaryStorage,
+)
+
+logger = logging.getLogger(__name__)
+
+# Cloudinary's delete_resources accepts at most 100 public ids per call
+DELETE_BATCH_LIMIT = 100
+
+
+def storage_key(storage):
+    """StorageTombstone.storage value for a storage instance."""
+    if isinstance(storage, PrivateFileSystemStorage):
+        return StorageTombstone.STORAGE_PRIVATE
+    if isinstance(storage, FileSystemStorage):
+        return StorageTombstone.STORAGE_PUBLIC
+    if isinstance(storage, RawMediaCloudinaryStorage):
+        return StorageTombstone.STORAGE_CLOUDINARY_RAW
+    if isinstance(storage, MediaCloudinaryStorage):
+        return StorageTombstone.STORAGE_CLOUDINARY_IMAGE
+    raise ValueError(f'Unsupported storage for deferred deletion: {storage!r}')
+
+
+def storage_for(key):
+    return {
+        StorageTombstone.STORAGE_PRIVATE: PrivateFileSystemStorage,
+        StorageTombstone.STORAGE_PUBLIC: FileSystemStorage,
+        StorageTombstone.STORAGE_CLOUDINARY_RAW: ResilientRawMediaCloudinaryStorage,
+        StorageTombstone.STORAGE_CLOUDINARY_IMAGE: ResilientMediaCloudinaryStorage,
+    }[key]()
+
+
+def bury(storage, names):
+    """Queue ``names`` in ``storage`` for deletion (one INSERT, no storage calls)."""
+    names = [name for name in names if name]
+    if not names:
+        return
+    key = storage_key(storage)
+    StorageTombstone.objects.bulk_create([StorageTombstone(storage=key, name=name) for name in names])
+
+
+def bury_files(field_files):
+    """Queue the stored files behind some FieldFiles, skipping empty ones."""
+    by_storage = {}
+    for field_file in field_files:
+        if field_file and field_file.name:
+            by_storage.setdefault(field_file.storage, []).append(field_file.name)
+    rows = [
+        StorageTombstone(storage=storage_key(storage), name=name)
+        for storage, names in by_storage.items()
+        for name in names
+    ]
+    if rows:
+        StorageTombstone.objects.bulk_create(rows)
+
+
+def max_attempts():
+    return getattr(settings, 'STORAGE_DELETE_MAX_ATTEMPTS', 8)
+
+
+def backoff_seconds(attempts):
+    base = getattr(settings, 'STORAGE_DELETE_RETRY_BASE_SECONDS', 60)
+    delay = base * (2 ** (attempts - 1))
+    return delay + random.uniform(0, delay / 2)
+
+
+def _due(now):
+    return Q(attempts__lt=max_attempts()) & (Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+
+
+def claim_due(limit):
+    """
+    Lease up to ``limit`` due tombstones to this worker and return them.
+    A worker that dies leaves its lease to expire, after which the rows are due again.
+    """
+    now = timezone.now()
+    token = uuid.uuid4()
+    lease = now + timedelta(seconds=getattr(settings, 'STORAGE_DELETE_LEASE_SECONDS', 300))
+    ids = list(StorageTombstone.objects.filter(_due(now)).values_list('pk', flat=True)[:limit])
+    if not ids:
+        return []
+    StorageTombstone.objects.filter(pk__in=ids).filter(_due(now)).update(claim=token, next_attempt_at=lease)
+    return list(StorageTombstone.objects.filter(claim=token))
+
+
+def _delete_cloudinary(storage, names):
+    """Return {name: error} for the names Cloudinary did not delete."""
+    response = resilience.guarded(
+        'delete_resources', cloudinary.api.delete_resources, names,
+        resource_type=storage.RESOURCE_TYPE, type=storage.DELIVERY_TYPE, invalidate=True,
+        timeout=resilience.timeout(),
+    )
+    results = response.get('deleted', {})
+    # 'not_found' means someone already removed it, which is what we wanted
+    return {
+        name: f'cloudinary: {results.get(name, "missing from response")}'
+        for name in names
+        if results.get(name) not in ('deleted', 'not_found')
+    }
+
+
+def _delete_each(storage, names):
+    errors = {}
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception as e:
+            errors[name] = str(e)
+    return errors
+
+
+def delete_batch(key, names):
+    """Delete ``names`` (at most DELETE_BATCH_LIMIT) from one storage; returns {name: error}."""
+    storage = storage_for(key)
+    try:
+        if isinstance(storage, MediaCloudinaryStorage):
+            return _delete_cloudinary(storage, names)
+        return _delete_each(storage, names)
+    except Exception as e:
+        return {name: str(e) for name in names}
+
+
+def drain(limit=1000, batch_size=DELETE_BATCH_LIMIT):
+    """Delete up to ``limit`` due files. Returns {'deleted': n, 'retry': n, 'failed': n}."""
+    batch_size = max(1, min(batch_size, DELETE_BATCH_LIMIT))
+    counts = {'deleted': 0, 'retry': 0, 'failed': 0}
+    by_storage = {}
+    for tombstone in claim_due(limit):
+        by_storage.setdefault(tombstone.storage, []).append(tombstone)
+
+    for key, tombstones in by_storage.items():
+        for start in range(0, len(tombstones), batch_size):
+            batch = tombstones[start:start + batch_size]
+            errors = delete_batch(key, [t.name for t in batch])
+            done = [t.pk for t in batch if t.name not in errors]
+            StorageTombstone.objects.filter(pk__in=done).delete()
+            counts['deleted'] += len(done)
+            for tombstone in batch:
+                if tombstone.name in errors:
+                    counts[_record_failure(tombstone, errors[tombstone.name])] += 1
+    return counts
+
+
+def _record_failure(tombstone, error):
+    attempts = tombstone.attempts + 1
+    failed = attempts >= max_attempts()
+    StorageTombstone.objects.filter(pk=tombstone.pk).update(
+        attempts=attempts,
+        claim=None,
+        last_error=error[:1000],
+        next_attempt_at=None if failed else timezone.now() + timedelta(seconds=backoff_seconds(attempts)),
+    )
+    logger.warning('Storage delete failed: %s attempt=%s error=%s', tombstone, attempts, error)
+    return 'failed' if failed else 'retry'
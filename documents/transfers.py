@@ -0,0 +1,186 @@
+"""
+Background storage-transfer queue.
+
+When DOCUMENT_ASYNC_STORAGE_TRANSFER is enabled, an upload request only moves
+the received file into a local spool directory and saves the Document with
+storage_state=PENDING. The ``process_storage_transfers`` command then pushes
+spooled files to the document storage with a bounded thread pool, retrying
+failures with exponential backoff.
+"""
+import logging
+import os
+import random
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def async_enabled():
+    return getattr(settings, 'DOCUMENT_ASYNC_STORAGE_TRANSFER', False)
+
+
+def spool_dir():
+    path = getattr(settings, 'DOCUMENT_TRANSFER_SPOOL_DIR')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def spool_document_file(document):
+    """
+    Move a fresh upload into the spool and mark the document PENDING.
+    Called from Document.save() before the row is written.
+    """
+    uploaded = document.file.file
+    filename = os.path.basename(uploaded.name)
+    path = os.path.join(spool_dir(), f'{uuid.uuid4().hex}_{filename}')
+    if hasattr(uploaded, 'temporary_file_path'):
+        # Already on local disk (streaming upload handler): a rename, not a copy
+        shutil.move(uploaded.temporary_file_path(), path)
+    else:
+        with open(path, 'wb') as spool:
+            for chunk in uploaded.chunks():
+                spool.write(chunk)
+
+    document.file = None
+    document.spool_path = path
+    document.storage_state = document.STORAGE_PENDING
+    document.transfer_attempts = 0
+    document.next_transfer_at = None
+
+
+def discard_spool(document):
+    """Remove the document's spool file, if it has one."""
+    if document.spool_path:
+        try:
+            os.remove(document.spool_path)
+        except OSError:
+            pass
+
+
+def claim(document_id):
+    """Atomically claim a document for transfer; returns False if another worker has it."""
+    from .models import Document
+
+    now = timezone.now()
+    lease = now + timedelta(seconds=getattr(settings, 'DOCUMENT_TRANSFER_LEASE_SECONDS', 600))
+    return Document.objects.filter(pk=document_id).filter(_claimable(now)).update(
+        storage_state=Document.STORAGE_TRANSFERRING,
+        next_transfer_at=lease,
+    ) == 1
+
+
+def _claimable(now):
+    from .models import Document
+
+    due = Q(next_transfer_at__isnull=True) | Q(next_transfer_at__lte=now)
+    pending = Q(storage_state=Document.STORAGE_PENDING) & due
+    # A TRANSFERRING row whose lease ran out belongs to a worker that died
+    stale = Q(storage_state=Document.STORAGE_TRANSFERRING, next_transfer_at__lt=now)
+    return pending | stale
+
+
+def due_document_ids(limit):
+    from .models import Document
+
+    return list(
+        Document.objects.filter(_claimable(timezone.now()))
+        .order_by('uploaded_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+
+
+def backoff_seconds(attempts):
+    base = getattr(settings, 'DOCUMENT_TRANSFER_RETRY_BASE_SECONDS', 30)
+    delay = base * (2 ** (attempts - 1))
+    return delay + random.uniform(0, delay / 2)
+
+
+def transfer_document(document_id):
+    """
+    Push one claimed document from the spool to storage.
+    Returns 'ready', 'retry', 'failed' or 'skipped'.
+    """
+    from . import blobs, derivatives
+    from .models import Document, document_upload_path
+
+    if not claim(document_id):
+        return 'skipped'
+    document = Document.objects.select_related('student').get(pk=document_id)
+    storage = Document._meta.get_field('file').storage
+    filename = document.original_filename or os.path.basename(document.spool_path)
+    blob = None
+    try:
+        with open(document.spool_path, 'rb') as spool:
+            if blobs.dedup_enabled() and document.sha256:
+                with transaction.atomic():
+                    blob = blobs.acquire_blob(document.sha256, document.size_bytes, filename, File(spool))
+                name = blob.name
+            else:
+                name = storage.save(document_upload_path(document, filename), File(spool))
+    except Exception as e:
+        attempts = document.transfer_attempts + 1
+        max_attempts = getattr(settings, 'DOCUMENT_TRANSFER_MAX_ATTEMPTS', 5)
+        failed = attempts >= max_attempts or not os.path.exists(document.spool_path)
+        Document.objects.filter(pk=document_id).update(
+            storage_state=Document.STORAGE_FAILED if failed else Document.STORAGE_PENDING,
+            transfer_attempts=attempts,
+            transfer_error=str(e)[:1000],
+            next_transfer_at=None if failed else timezone.now() + timedelta(seconds=backoff_seconds(attempts)),
+        )
+        logger.warning('Storage transfer failed: document=%s attempt=%s error=%s', document_id, attempts, e)
+        return 'failed' if failed else 'retry'
+
+    updated = Document.objects.filter(pk=document_id, storage_state=Document.STORAGE_TRANSFERRING).update(
+        file=name,
+        blob=blob,
+        storage_state=Document.STORAGE_READY,
+        spool_path='',
+        transfer_error='',
+        next_transfer_at=None,
+    )
+    if not updated:
+        # Document was deleted while we were uploading: don't leave an orphan behind
+        if blob is not None:
+            blobs.release_blob(blob.pk)
+        else:
+            storage.delete(name)
+    else:
+        document.file = name
+        document.storage_state = Document.STORAGE_READY
+        derivatives.schedule_document(document)
+    try:
+        os.remove(document.spool_path)
+    except FileNotFoundError:
+        pass
+    return 'ready'
+
+
+def process_pending(max_workers=None, limit=100):
+    """Transfer up to ``limit`` due documents with a bounded thread pool. Returns result counts."""
+    max_workers = max_workers or getattr(settings, 'DOCUMENT_TRANSFER_MAX_WORKERS', 4)
+    counts = {'ready': 0, 'retry': 0, 'failed': 0, 'skipped': 0}
+    ids = due_document_ids(limit)
+    if not ids:
+        return counts
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for result in pool.map(_transfer_in_thread, ids):
+            counts[result] += 1
+    return counts
+
+
+def _transfer_in_thread(document_id):
+    from django.db import connection
+
+    try:
+        return transfer_document(document_id)
+    finally:
+        connection.close()
@@ -0,0 +1,161 @@
+"""
+Streaming upload handler for documents and photos.
+
+Validates each uploaded file while the request body is still being parsed:
+the extension when the file starts, the magic bytes on the first chunk, and
+the size as chunks arrive. Accepted bytes go straight to a temporary spool
+file while the SHA-256 is computed incrementally, so a worker holds at most
+one chunk of each upload in memory. Rejected files are replaced by a
+``RejectedUpload`` placeholder that the upload forms turn into a validation error.
+
+The handler is installed per view (``streaming_uploads``), not through
+FILE_UPLOAD_HANDLERS: every other form, the Django admin included, keeps
+Django's default handlers.
+
+The same signature check (``content_matches``) is applied again by the
+shared form validator, so uploads that never pass through this handler
+(chunked, batch and direct uploads) are held to the same rules.
+"""
+import hashlib
+import re
+from functools import wraps
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+# Leading bytes for each allowed extension, as patterns matched at offset 0
+MAGIC_BYTES = {
+    'pdf': [re.compile(rb'%PDF-')],
+    'jpg': [re.compile(rb'\xff\xd8\xff')],
+    'jpeg': [re.compile(rb'\xff\xd8\xff')],
+    'png': [re.compile(rb'\x89PNG\r\n\x1a\n')],
+    # RIFF container: 4-byte little-endian size, then the WEBP form type
+    'webp': [re.compile(rb'RIFF.{4}WEBP', re.DOTALL)],
+}
+# Enough leading bytes to tell every signature apart
+HEAD_SIZE = 16
+
+DOCUMENT_EXTENSIONS = ('pdf', 'jpg', 'jpeg', 'png')
+PHOTO_EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp')
+
+
+def max_upload_size():
+    return getattr(settings, 'DOCUMENT_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+
+
+def size_error():
+    """The "too large" message for the configured DOCUMENT_UPLOAD_MAX_SIZE."""
+    limit = max_upload_size()
+    if limit >= 1024 * 1024:
+        return f'File size too large. Max {limit / (1024 * 1024):g}MB.'
+    if limit >= 1024:
+        return f'File size too large. Max {limit / 1024:g}KB.'
+    return f'File size too large. Max {limit} bytes.'
+
+
+def content_matches(extension, head):
+    """True if ``head`` (the first bytes of a file) looks like a file of ``extension``."""
+    return any(magic.match(head) for magic in MAGIC_BYTES.get(extension, ()))
+
+
+def read_head(file):
+    """The first HEAD_SIZE bytes of an uploaded or stored file, leaving its position unchanged."""
+    position = file.tell() if hasattr(file, 'tell') else 0
+    file.seek(0)
+    head = file.read(HEAD_SIZE)
+    file.seek(position)
+    return head
+
+
+class RejectedUpload(UploadedFile):
+    """Placeholder for a file the upload handler refused; carries the reason."""
+
+    def __init__(self, name, content_type, size, upload_error):
+        super().__init__(BytesIO(), name, content_type, size)
+        self.upload_error = upload_error
+
+
+class StreamingValidationUploadHandler(FileUploadHandler):
+    """
+    Validate uploads on the fly and spool accepted bytes to disk.
+    Replaces Django's memory/temporary-file handlers for the views it is installed on.
+    """
+
+    def __init__(self, request=None, extensions=DOCUMENT_EXTENSIONS):
+        super().__init__(request)
+        self.extensions = extensions
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.digest = hashlib.sha256()
+        self.received = 0
+        self.upload_error = None
+        self.file = None
+
+        ext = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else ''
+        if ext not in self.extensions:
+            self.upload_error = f'Unsupported file extension: {ext}. Allowed: {", ".join(self.extensions)}'
+        elif content_length is not None and content_length > max_upload_size():
+            self.upload_error = size_error()
+        else:
+            self.extension = ext
+            self.file = TemporaryUploadedFile(file_name, content_type, 0, charset, content_type_extra)
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        # Once rejected, remaining chunks are dropped instead of buffered
+        if self.upload_error:
+            self.received += len(raw_data)
+            return None
+
+        if start == 0 and not content_matches(self.extension, raw_data):
+            self._reject('File content does not match its extension.')
+        elif self.received + len(raw_data) > max_upload_size():
+            self._reject(size_error())
+        else:
+            self.digest.update(raw_data)
+            self.file.write(raw_data)
+        self.received += len(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.upload_error:
+            return RejectedUpload(self.file_name, self.content_type, max(file_size, 1), self.upload_error)
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.digest.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if getattr(self, 'file', None) is not None:
+            self.file.close()
+
+    def _reject(self, message):
+        self.upload_error = message
+        self.file.close()
+        self.file = None
+
+
+def streaming_uploads(extensions=DOCUMENT_EXTENSIONS):
+    """
+    View decorator: parse the view's uploads with StreamingValidationUploadHandler.
+
+    Handlers must be in place before anything reads request.POST, and
+    CsrfViewMiddleware reads it, so (as the Django docs describe) the view is
+    csrf_exempt on the outside and csrf_protect'ed once the handler is added.
+    """
+    def decorator(view):
+        protected = csrf_protect(view)
+
+        @csrf_exempt
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            request.upload_handlers.insert(0, StreamingValidationUploadHandler(request, extensions))
+            return protected(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -9,7 +9,20 @@ app_name = 'documents'
 urlpatterns = [
     path('upload/', views.document_upload, name='upload'),
     path('admin/upload/<int:student_id>/', views.admin_document_upload, name='admin_upload'),
+    path('batch/', views.document_batch_upload, name='batch_upload'),
+    path('admin/batch/<int:student_id>/', views.document_batch_upload, name='admin_batch_upload'),
+    path('direct/ticket/', views.direct_upload_ticket, name='direct_upload_ticket'),
+    path('admin/direct/ticket/<int:student_id>/', views.direct_upload_ticket, name='admin_direct_upload_ticket'),
+    path('direct/commit/', views.direct_upload_commit, name='direct_upload_commit'),
+    path('direct/local-storage/', views.direct_upload_local, name='direct_upload_local'),
+    path('chunked/start/', views.chunked_upload_start, name='chunked_upload_start'),
+    path('admin/chunked/start/<int:student_id>/', views.chunked_upload_start, name='admin_chunked_upload_start'),
+    path('chunked/<uuid:upload_id>/', views.chunked_upload_chunk, name='chunked_upload_chunk'),
     path('view/<int:document_id>/', views.document_view, name='view'),
     path('download/<int:document_id>/', views.document_download, name='download'),
+    path('thumbnail/<int:document_id>/', views.document_thumbnail, name='thumbnail'),
+    path('admin/export/<int:student_id>/', views.student_documents_zip, name='student_documents_zip'),
+    path('signed/<str:token>/', views.document_signed_download, name='signed_download'),
     path('delete/<int:document_id>/', views.document_delete, name='delete'),
+    path('admin/storage-metrics/', views.storage_metrics, name='storage_metrics'),
 ]
@@ -0,0 +1,94 @@
+"""
+File metadata helpers for Documents
+"""
+import hashlib
+import mimetypes
+import os
+from io import UnsupportedOperation
+
+
+def compute_file_metadata(uploaded_file):
+    """
+    Return size, MIME type, SHA-256 and original filename for an uploaded file.
+    The file is hashed chunk by chunk so it is never read into memory at once,
+    unless the upload handler already hashed it while streaming.
+    """
+    checksum = getattr(uploaded_file, 'sha256', None)
+    if checksum:
+        size = uploaded_file.size
+    else:
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        try:
+            uploaded_file.seek(0)
+        except (AttributeError, UnsupportedOperation):
+            # Streamed remote files can only be read once
+            pass
+        checksum = digest.hexdigest()
+
+    original_name = os.path.basename(getattr(uploaded_file, 'name', '') or '')
+    content_type = (
+        getattr(uploaded_file, 'content_type', None)
+        or mimetypes.guess_type(original_name)[0]
+        or 'application/octet-stream'
+    )
+    return {
+        'size_bytes': size,
+        'content_type': content_type[:100],
+        'sha256': checksum,
+        'original_filename': original_name[:255],
+    }
+
+
+class LoadedFilesMixin:
+    """
+    Remember the stored values of ``loaded_file_fields`` as they were loaded
+    from (or last saved to) the database, so pre_save handlers can tell
+    whether a file was replaced without re-querying the row. Instances that
+    were never loaded, or were loaded with one of these fields deferred, have
+    no snapshot and the handlers fall back to a query.
+    """
+    loaded_file_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_files()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(self.loaded_file_fields):
+            self._remember_loaded_files()
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_loaded_files()
+
+    def _remember_loaded_files(self):
+        deferred = self.get_deferred_fields()
+        fields = [self._meta.get_field(name) for name in self.loaded_file_fields]
+        if any(field.attname in deferred for field in fields):
+            self._loaded_files = None
+            return
+        self._loaded_files = {}
+        for field in fields:
+            value = getattr(self, field.attname)
+            # FieldFiles are snapshotted by name; an empty file is None
+            self._loaded_files[field.name] = (value.name or None) if hasattr(value, 'field') else value
+
+    def has_loaded_files(self):
+        return getattr(self, '_loaded_files', None) is not None
+
+    def loaded_value(self, name):
+        """The snapshotted value of a tracked field (a file name, or e.g. a foreign key id)."""
+        return self._loaded_files[name]
+
+    def loaded_file(self, name):
+        """The snapshotted file of a tracked FileField, as a FieldFile."""
+        field = self._meta.get_field(name)
+        return field.attr_class(self, field, self._loaded_files[name])
@@ -2,15 +2,22 @@
 Document Views: Upload, View, Download
 """
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import FileResponse, Http404
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.db import IntegrityError
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST, require_safe
+from django.core import signing
 import os
 from .models import Document
-from .forms import DocumentUploadForm, AdminDocumentUploadForm
+from .forms import DocumentUploadForm, AdminDocumentUploadForm, BatchUploadFormSet
+from . import batch_upload, chunked_upload, delivery, direct_upload, resilience, signed_urls, zip_export
+from .storage import is_local_file, serve_local_file
+from .upload_handlers import StreamingValidationUploadHandler, streaming_uploads
 from students.models import StudentProfile
-import cloudinary.utils
 
 
 def is_admin(user):
@@ -18,7 +25,16 @@ def is_admin(user):
     return user.is_authenticated and user.is_admin()
 
 
+def mark_documents_submitted(student):
+    """Move a student from REGISTERED to DOCUMENTS_SUBMITTED after their first upload."""
+    profile, created = StudentProfile.objects.get_or_create(user=student)
+    if profile.visa_status == 'REGISTERED':
+        profile.visa_status = 'DOCUMENTS_SUBMITTED'
+        profile.save()
+
+
 @login_required
+@streaming_uploads()
 def document_upload(request):
     """
     Student Document Upload View
@@ -37,10 +53,7 @@ def document_upload(request):
             document = form.save()
             
             # Update visa status if first document upload
-            profile, created = StudentProfile.objects.get_or_create(user=request.user)
-            if profile.visa_status == 'REGISTERED':
-                profile.visa_status = 'DOCUMENTS_SUBMITTED'
-                profile.save()
+            mark_documents_submitted(request.user)
             
             messages.success(request, 'Document uploaded successfully!')
             return redirect('students:dashboard')
@@ -52,6 +65,7 @@ def document_upload(request):
 
 @login_required
 @user_passes_test(is_admin)
+@streaming_uploads()
 def admin_document_upload(request, student_id):
     """
     Admin Document Upload View
@@ -86,6 +100,208 @@ def admin_document_upload(request, student_id):
     })
 
 
+@login_required
+@streaming_uploads()
+def document_batch_upload(request, student_id=None):
+    """
+    Upload several documents in one request, each with its own type and title.
+    Students upload for themselves; admins pass a StudentProfile.id.
+    """
+    student_profile = None
+    if student_id is not None:
+        if not request.user.is_admin():
+            return redirect('students:dashboard')
+        student_profile = get_object_or_404(StudentProfile, id=student_id)
+        student = student_profile.user
+    elif request.user.is_student():
+        student = request.user
+    else:
+        return redirect('students:admin_dashboard')
+
+    if request.method == 'POST':
+        formset = BatchUploadFormSet(request.POST, request.FILES, student=student)
+        if formset.is_valid():
+            try:
+                documents = batch_upload.save_batch(formset.items(), student, request.user)
+            except IntegrityError:
+                messages.error(request, 'A document with this type and title already exists.')
+            else:
+                count = len(documents)
+                if student_profile is not None:
+                    messages.success(
+                        request,
+                        f'{count} documents uploaded for {student.get_full_name() or student.username}!'
+                    )
+                    return redirect('students:student_detail', student_id=student_profile.id)
+                mark_documents_submitted(student)
+                messages.success(request, f'{count} documents uploaded successfully!')
+                return redirect('students:dashboard')
+    else:
+        formset = BatchUploadFormSet(student=student)
+
+    return render(request, 'documents/batch_upload.html', {
+        'formset': formset,
+        'student': student,
+        'student_profile': student_profile,
+    })
+
+
+@login_required
+@require_POST
+def direct_upload_ticket(request, student_id=None):
+    """
+    Phase one of a direct upload: issue a signed, short-lived upload ticket.
+    Students get tickets for themselves; admins pass a StudentProfile.id.
+    """
+    if student_id is not None:
+        if not request.user.is_admin():
+            return JsonResponse({'error': 'Permission denied.'}, status=403)
+        student = get_object_or_404(StudentProfile, id=student_id).user
+    elif request.user.is_student():
+        student = request.user
+    else:
+        return JsonResponse({'error': 'Permission denied.'}, status=403)
+
+    try:
+        data = direct_upload.issue_ticket(
+            student=student,
+            uploaded_by=request.user,
+            document_type=request.POST.get('document_type', ''),
+            title=request.POST.get('title', ''),
+            filename=request.POST.get('filename', ''),
+        )
+    except direct_upload.DirectUploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(data)
+
+
+@login_required
+@require_POST
+def direct_upload_commit(request):
+    """
+    Phase two of a direct upload: verify the storage result and create the Document.
+    """
+    try:
+        payload = direct_upload.read_ticket(request.POST.get('ticket', ''))
+        if payload['uploaded_by'] != request.user.pk:
+            return JsonResponse({'error': 'Permission denied.'}, status=403)
+        document = direct_upload.commit_upload(payload, request.POST)
+    except direct_upload.DirectUploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except IntegrityError:
+        return JsonResponse({'error': 'A document with this type and title already exists.'}, status=409)
+
+    if request.user.is_admin():
+        profile = StudentProfile.objects.filter(user_id=document.student_id).first()
+        redirect_url = (
+            reverse('students:student_detail', kwargs={'student_id': profile.id})
+            if profile else reverse('students:admin_dashboard')
+        )
+    else:
+        mark_documents_submitted(request.user)
+        redirect_url = reverse('students:dashboard')
+    return JsonResponse({'id': document.id, 'redirect': redirect_url}, status=201)
+
+
+@csrf_exempt
+@require_POST
+def direct_upload_local(request):
+    """
+    Local stand-in for the storage provider's upload API, used when Cloudinary is
+    not configured. Authorised by the signed ticket rather than the session.
+    """
+    request.upload_handlers.insert(0, StreamingValidationUploadHandler(request))
+    uploaded_file = request.FILES.get('file')
+    if uploaded_file is None:
+        return JsonResponse({'error': 'No file provided.'}, status=400)
+    try:
+        result = direct_upload.store_local_upload(request.POST.get('ticket', ''), uploaded_file)
+    except direct_upload.DirectUploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(result)
+
+
+def _chunked_session_state(session):
+    return {
+        'upload_id': str(session.id),
+        'offset': session.received_bytes,
+        'total_size': session.total_size,
+        'chunk_size': session.chunk_size,
+        'status': session.status,
+    }
+
+
+@login_required
+@require_POST
+def chunked_upload_start(request, student_id=None):
+    """
+    Open a resumable chunked upload session.
+    Students upload for themselves; admins pass a StudentProfile.id.
+    """
+    if student_id is not None:
+        if not request.user.is_admin():
+            return JsonResponse({'error': 'Permission denied.'}, status=403)
+        student = get_object_or_404(StudentProfile, id=student_id).user
+    elif request.user.is_student():
+        student = request.user
+    else:
+        return JsonResponse({'error': 'Permission denied.'}, status=403)
+
+    try:
+        total_size = int(request.POST.get('total_size', 0))
+    except ValueError:
+        return JsonResponse({'error': 'total_size must be an integer.'}, status=400)
+    try:
+        session = chunked_upload.start_session(
+            student=student,
+            uploaded_by=request.user,
+            document_type=request.POST.get('document_type', ''),
+            title=request.POST.get('title', ''),
+            filename=request.POST.get('filename', ''),
+            total_size=total_size,
+        )
+    except chunked_upload.ChunkError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse(_chunked_session_state(session), status=201)
+
+
+@login_required
+def chunked_upload_chunk(request, upload_id):
+    """
+    GET: report the resume offset. POST: append one chunk (raw body) at X-Chunk-Offset,
+    verified against X-Chunk-SHA256. The last chunk creates the Document.
+    """
+    from .models import UploadSession
+    session = get_object_or_404(UploadSession, id=upload_id, uploaded_by=request.user)
+
+    if request.method == 'GET':
+        return JsonResponse(_chunked_session_state(session))
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed.'}, status=405)
+
+    try:
+        offset = int(request.headers.get('X-Chunk-Offset', ''))
+    except ValueError:
+        return JsonResponse({'error': 'X-Chunk-Offset header is required.'}, status=400)
+    try:
+        session = chunked_upload.receive_chunk(
+            session.id, offset, request.body, request.headers.get('X-Chunk-SHA256', '')
+        )
+    except chunked_upload.ChunkError as e:
+        return JsonResponse({'error': str(e), 'offset': e.offset}, status=e.status)
+
+    state = _chunked_session_state(session)
+    form = getattr(session, 'form', None)
+    if form is not None and not form.is_valid():
+        state['errors'] = form.errors.get_json_data()
+        return JsonResponse(state, status=400)
+    if session.document_id:
+        state['document_id'] = session.document_id
+        if request.user.is_student():
+            mark_documents_submitted(request.user)
+    return JsonResponse(state)
+
+
 @login_required
 @user_passes_test(is_admin)
 def document_view(request, document_id):
@@ -96,7 +312,7 @@ def document_view(request, document_id):
     
     # Determine if we can preview in browser (PDF, images)
     filename = document.filename().lower()
-    is_previewable = (
+    is_previewable = bool(document.file) and (
         filename.endswith('.pdf') or
         filename.endswith('.jpg') or filename.endswith('.jpeg') or
         filename.endswith('.png') or filename.endswith('.gif') or filename.endswith('.webp')
@@ -109,11 +325,21 @@ def document_view(request, document_id):
     except Exception:
         profile_id = None
     
+    preview_url = None
+    if is_previewable:
+        if is_local_file(document.file):
+            # Served by document_download, which supports Range and conditional requests
+            preview_url = reverse('documents:download', kwargs={'document_id': document.id}) + '?inline=1'
+        else:
+            preview_url = signed_urls.signed_url(document, attachment=False)
+
     context = {
         'document': document,
         'is_previewable': is_previewable,
         'is_pdf': is_pdf,
         'profile_id': profile_id,
+        'preview_url': preview_url,
+        'download_url': signed_urls.signed_url(document),
     }
     
     return render(request, 'documents/view.html', context)
@@ -133,23 +359,98 @@ def document_download(request, document_id):
         messages.error(request, 'You do not have permission to access this document.')
         return redirect('students:dashboard')
     
+    if document.is_processing():
+        messages.info(request, 'This document is still being processed. Please try again in a moment.')
+        return redirect('students:dashboard')
+
     # Serve file
     if not document.file:
         messages.error(request, 'File not found.')
         return redirect('students:dashboard')
     
-    # Redirect to Cloudinary URL with attachment flag to bypass some restrictions
-    
-    # Determine resource type
-    filename = document.filename().lower()
-    resource_type = 'raw' if filename.endswith('.pdf') else 'image'
-    
-    url, options = cloudinary.utils.cloudinary_url(
-        document.file.name,
-        resource_type=resource_type,
-        flags="attachment"
+    # Local storage: permission checked above, so hand the file over directly
+    if is_local_file(document.file):
+        return delivery.serve_document(request, document, as_attachment=request.GET.get('inline') != '1')
+
+    # Pages link to signed URLs directly; this keeps old links working
+    return redirect(signed_urls.signed_url(document))
+
+
+@login_required
+@require_safe
+def document_thumbnail(request, document_id):
+    """
+    A document's preview image, with the same permission check as the
+    download: previews show the first page, so they are as private as the file.
+    """
+    document = get_object_or_404(Document, id=document_id)
+    if not (request.user.is_admin() or document.student == request.user) or not document.thumbnail:
+        raise Http404('No preview for this document.')
+
+    if is_local_file(document.thumbnail):
+        response = serve_local_file(
+            document.thumbnail, os.path.basename(document.thumbnail.name),
+            as_attachment=False, content_type='image/webp',
+        )
+        response['Cache-Control'] = 'private, max-age=3600'
+    else:
+        # An expiring private link: the redirect must not outlive it
+        response = redirect(document.thumbnail.url)
+        response['Cache-Control'] = f'private, max-age={max(signed_urls.url_ttl() - signed_urls.REFRESH_MARGIN, 0)}'
+    return response
+
+
+@require_safe
+def document_signed_download(request, token):
+    """
+    Serve a document from local storage for a signed, expiring link.
+    The token is the authorisation, so no session is needed.
+    """
+    try:
+        payload = signed_urls.read_token(token)
+    except signing.BadSignature:
+        raise Http404('This download link is invalid or has expired.')
+    document = get_object_or_404(Document, id=payload['d'])
+    if not document.file or document.file.name != payload['n']:
+        raise Http404('This download link is invalid or has expired.')
+    return delivery.serve_document(request, document, as_attachment=payload['a'])
+
+
+@login_required
+@user_passes_test(is_admin)
+def student_documents_zip(request, student_id):
+    """
+    Admin only: download all of a student's stored documents as one ZIP,
+    streamed while it is being built.
+    Note: student_id here refers to StudentProfile.id, not User.id
+    """
+    student_profile = get_object_or_404(StudentProfile.objects.select_related('user'), id=student_id)
+    student = student_profile.user
+    documents = (
+        Document.objects.filter(student=student, storage_state=Document.STORAGE_READY)
+        .exclude(file='').exclude(file__isnull=True)
+        .order_by('document_type', 'uploaded_at')
+    )
+    if not documents.exists():
+        messages.info(request, 'This student has no stored documents to download.')
+        return redirect('students:student_detail', student_id=student_profile.id)
+
+    response = StreamingHttpResponse(
+        zip_export.stream_documents_zip(documents),
+        content_type='application/zip',
     )
-    return redirect(url)
+    response['Content-Disposition'] = f'attachment; filename="{student.username}-documents.zip"'
+    return response
+
+
+@login_required
+@user_passes_test(is_admin)
+def storage_metrics(request):
+    """
+    Admin only: storage call latency, retries and circuit-breaker state as JSON.
+    Figures are for the worker process that serves the request.
+    """
+    return JsonResponse(resilience.snapshot())
 
 
 @login_required
@@ -0,0 +1,118 @@
+"""
+Streaming ZIP export of a student's documents.
+
+The archive is written on the fly into a small buffer that the response
+generator drains after every write, so neither the archive nor the whole set
+of files is ever held in memory or on disk. Files are fetched from storage
+concurrently by a bounded thread pool; each fetcher hands its chunks to the
+writer through a short queue, so memory use depends on the worker count and
+chunk size, not on how many documents the student has.
+"""
+import os
+import queue
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+CHUNK_SIZE = 64 * 1024
+QUEUE_CHUNKS = 4
+_DONE = object()
+
+
+def fetch_workers():
+    return getattr(settings, 'DOCUMENT_ZIP_FETCH_WORKERS', 4)
+
+
+class _StreamBuffer:
+    """Write-only, unseekable sink for ZipFile; the generator drains it after each write."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def archive_name(document, used):
+    """Unique path inside the archive: <DOCUMENT_TYPE>/<filename>"""
+    base, ext = os.path.splitext(document.filename() or f'document-{document.pk}')
+    name = f'{document.document_type}/{base}{ext}'
+    counter = 1
+    while name in used:
+        counter += 1
+        name = f'{document.document_type}/{base} ({counter}){ext}'
+    used.add(name)
+    return name
+
+
+def _fetch(field_file, out, cancelled):
+    """Read one stored file chunk by chunk into ``out`` (runs in a worker thread)."""
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        storage = field_file.storage
+        with storage.open(field_file.name, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk or not put(chunk):
+                    break
+    except Exception as e:
+        put(e)
+        return
+    put(_DONE)
+
+
+def stream_documents_zip(documents):
+    """
+    Yield a ZIP archive of ``documents`` (an iterable of Documents with stored files).
+    Entries are stored uncompressed: PDFs and JPEG/PNG scans are already compressed.
+    """
+    documents = list(documents)
+    cancelled = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=max(1, fetch_workers()))
+    queues = []
+    for document in documents:
+        q = queue.Queue(maxsize=QUEUE_CHUNKS)
+        pool.submit(_fetch, document.file, q, cancelled)
+        queues.append(q)
+
+    sink = _StreamBuffer()
+    used = set()
+    try:
+        with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for document, q in zip(documents, queues):
+                info = zipfile.ZipInfo(archive_name(document, used), date_time=document.uploaded_at.timetuple()[:6])
+                with archive.open(info, mode='w') as entry:
+                    while True:
+                        item = q.get()
+                        if item is _DONE:
+                            break
+                        if isinstance(item, Exception):
+                            raise item
+                        entry.write(item)
+                        data = sink.drain()
+                        if data:
+                            yield data
+        yield sink.drain()
+    finally:
+        # Also reached when the client disconnects and the generator is closed
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
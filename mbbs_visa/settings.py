@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 from decouple import config
 
@@ -154,6 +155,19 @@ CLOUDINARY_STORAGE = {
 if config('CLOUDINARY_CLOUD_NAME', default=''):
     DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Where uploaded files live: 'cloudinary' or 'local' (defaults to Cloudinary when configured).
+# Local documents are kept outside MEDIA_ROOT and served by the document views,
+# optionally through the front-end server: DOCUMENT_SENDFILE_BACKEND = 'nginx'
+# (X-Accel-Redirect to DOCUMENT_SENDFILE_URL_PREFIX, an internal location aliased
+# to DOCUMENT_PRIVATE_ROOT) or 'xsendfile' (X-Sendfile with the absolute path).
+MEDIA_STORAGE_BACKEND = config(
+    'MEDIA_STORAGE_BACKEND',
+    default='cloudinary' if config('CLOUDINARY_CLOUD_NAME', default='') else 'local',
+)
+DOCUMENT_PRIVATE_ROOT = config('DOCUMENT_PRIVATE_ROOT', default=str(BASE_DIR / 'private_media'))
+DOCUMENT_SENDFILE_BACKEND = config('DOCUMENT_SENDFILE_BACKEND', default='')
+DOCUMENT_SENDFILE_URL_PREFIX = config('DOCUMENT_SENDFILE_URL_PREFIX', default='/protected-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -169,9 +183,81 @@ LOGIN_REDIRECT_URL = 'students:dashboard'
 LOGOUT_REDIRECT_URL = 'accounts:landing'
 
 # File Upload Settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
+# Document and photo upload views validate and spool uploads chunk by chunk
+# (documents.upload_handlers.streaming_uploads); other views use Django's defaults.
+DOCUMENT_UPLOAD_MAX_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 
+# Direct-to-storage uploads: 'cloudinary' or 'local' (blank = Cloudinary when configured)
+DOCUMENT_DIRECT_UPLOAD_BACKEND = config('DOCUMENT_DIRECT_UPLOAD_BACKEND', default='')
+DOCUMENT_DIRECT_UPLOAD_TICKET_MAX_AGE = int(config('DOCUMENT_DIRECT_UPLOAD_TICKET_MAX_AGE', default=300))  # seconds
+
+# Resumable chunked uploads
+DOCUMENT_UPLOAD_CHUNK_SIZE = int(config('DOCUMENT_UPLOAD_CHUNK_SIZE', default=1048576))  # 1MB
+DOCUMENT_UPLOAD_SPOOL_DIR = config('DOCUMENT_UPLOAD_SPOOL_DIR', default=os.path.join(tempfile.gettempdir(), 'mbbs_upload_spool'))
+
+# Background storage transfers: uploads are spooled locally and pushed to storage by
+# `python manage.py process_storage_transfers`
+DOCUMENT_ASYNC_STORAGE_TRANSFER = config('DOCUMENT_ASYNC_STORAGE_TRANSFER', default=False, cast=bool)
+DOCUMENT_TRANSFER_SPOOL_DIR = config('DOCUMENT_TRANSFER_SPOOL_DIR', default=str(BASE_DIR / 'spool' / 'transfers'))
+DOCUMENT_TRANSFER_MAX_WORKERS = int(config('DOCUMENT_TRANSFER_MAX_WORKERS', default=4))
+DOCUMENT_TRANSFER_MAX_ATTEMPTS = int(config('DOCUMENT_TRANSFER_MAX_ATTEMPTS', default=5))
+DOCUMENT_TRANSFER_RETRY_BASE_SECONDS = int(config('DOCUMENT_TRANSFER_RETRY_BASE_SECONDS', default=30))
+
+# Admin dashboard headline metrics: cached until a profile or document changes (and at
+# most this many seconds); one worker recomputes while others serve the previous value
+DASHBOARD_METRICS_TTL = int(config('DASHBOARD_METRICS_TTL', default=300))
+DASHBOARD_METRICS_LOCK_SECONDS = int(config('DASHBOARD_METRICS_LOCK_SECONDS', default=30))
+
+# Remote storage calls: timeouts, retries for idempotent calls, a circuit breaker that
+# fails fast while the provider is unhealthy and a per-process cap on in-flight calls
+STORAGE_TIMEOUT_SECONDS = float(config('STORAGE_TIMEOUT_SECONDS', default=10))
+STORAGE_UPLOAD_TIMEOUT_SECONDS = float(config('STORAGE_UPLOAD_TIMEOUT_SECONDS', default=60))
+STORAGE_RETRY_ATTEMPTS = int(config('STORAGE_RETRY_ATTEMPTS', default=3))
+STORAGE_RETRY_BASE_DELAY = float(config('STORAGE_RETRY_BASE_DELAY', default=0.2))  # seconds
+STORAGE_BREAKER_FAILURE_THRESHOLD = int(config('STORAGE_BREAKER_FAILURE_THRESHOLD', default=5))
+STORAGE_BREAKER_RESET_SECONDS = float(config('STORAGE_BREAKER_RESET_SECONDS', default=30))
+STORAGE_MAX_CONCURRENCY = int(config('STORAGE_MAX_CONCURRENCY', default=8))
+STORAGE_BULKHEAD_WAIT_SECONDS = float(config('STORAGE_BULKHEAD_WAIT_SECONDS', default=2))
+
+# Deleted files are queued as tombstones and removed in bulk by
+# `python manage.py drain_storage_deletions`
+STORAGE_DELETE_MAX_ATTEMPTS = int(config('STORAGE_DELETE_MAX_ATTEMPTS', default=8))
+STORAGE_DELETE_RETRY_BASE_SECONDS = int(config('STORAGE_DELETE_RETRY_BASE_SECONDS', default=60))
+
+# Store identical document bytes once (content-addressed by SHA-256)
+DOCUMENT_DEDUPLICATION = config('DOCUMENT_DEDUPLICATION', default=True, cast=bool)
+
+# Batch uploads: files per request and concurrent storage pushes
+DOCUMENT_BATCH_UPLOAD_MAX_FILES = int(config('DOCUMENT_BATCH_UPLOAD_MAX_FILES', default=10))
+DOCUMENT_BATCH_UPLOAD_MAX_WORKERS = int(config('DOCUMENT_BATCH_UPLOAD_MAX_WORKERS', default=4))
+
+# Concurrent storage fetches while streaming a student's documents as a ZIP
+DOCUMENT_ZIP_FETCH_WORKERS = int(config('DOCUMENT_ZIP_FETCH_WORKERS', default=4))
+
+# Lifetime of signed document download links (seconds); URLs are cached until shortly before expiry
+# On Cloudinary, document files and previews use 'authenticated' delivery, so these links are the only
+# way in (run `manage.py protect_document_assets` once for older uploads); student photos stay public.
+DOCUMENT_SIGNED_URL_TTL = int(config('DOCUMENT_SIGNED_URL_TTL', default=900))
+
+# Preview thumbnails for documents and photos, rendered in a process pool after upload
+# (PDF previews need the optional pypdfium2 package; 0 workers renders inline)
+DOCUMENT_THUMBNAILS = config('DOCUMENT_THUMBNAILS', default=True, cast=bool)
+DERIVATIVE_WORKERS = int(config('DERIVATIVE_WORKERS', default=2))
+# Local copies the workers render from, written once the upload has committed
+DOCUMENT_DERIVATIVE_WORK_DIR = config('DOCUMENT_DERIVATIVE_WORK_DIR', default=os.path.join(tempfile.gettempdir(), 'mbbs_derivatives'))
+
+# Optional PDF ingest stage (needs pikepdf): linearize for fast web view and
+# recompress embedded images above the size/quality budget, in the same pool
+DOCUMENT_PDF_OPTIMIZE = config('DOCUMENT_PDF_OPTIMIZE', default=False, cast=bool)
+DOCUMENT_PDF_MAX_IMAGE_DIMENSION = int(config('DOCUMENT_PDF_MAX_IMAGE_DIMENSION', default=2000))  # pixels
+DOCUMENT_PDF_JPEG_QUALITY = int(config('DOCUMENT_PDF_JPEG_QUALITY', default=75))
+
+# Student photos are normalized on upload: EXIF stripped, capped, re-encoded ('JPEG' or 'WEBP')
+STUDENT_PHOTO_MAX_DIMENSION = int(config('STUDENT_PHOTO_MAX_DIMENSION', default=1024))  # pixels
+STUDENT_PHOTO_FORMAT = config('STUDENT_PHOTO_FORMAT', default='JPEG')
+STUDENT_PHOTO_QUALITY = int(config('STUDENT_PHOTO_QUALITY', default=85))
+
 # Session Settings
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_SAVE_EVERY_REQUEST = True
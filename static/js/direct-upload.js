@@ -0,0 +1,73 @@
+/**
+ * Documents – direct-to-storage uploads
+ * Forms marked with data-direct-upload-ticket send the file straight to storage
+ * using a signed ticket, then commit the result. Falls back to a normal POST.
+ */
+(function () {
+  'use strict';
+
+  function ready(fn) {
+    if (document.readyState !== 'loading') fn();
+    else document.addEventListener('DOMContentLoaded', fn);
+  }
+
+  function postForm(url, data) {
+    return fetch(url, { method: 'POST', body: data, credentials: 'same-origin' }).then(function (res) {
+      return res.json().then(function (body) {
+        if (!res.ok) throw new Error(body.error || body.error_message || 'Upload failed');
+        return body;
+      });
+    });
+  }
+
+  function initDirectUploads() {
+    document.querySelectorAll('form[data-direct-upload-ticket]').forEach(function (form) {
+      form.addEventListener('submit', function (e) {
+        var fileInput = form.querySelector('input[type="file"]');
+        if (!window.fetch || !window.FormData || !fileInput || !fileInput.files.length) return;
+        if (form.dataset.directUploadFallback) return;
+        e.preventDefault();
+
+        var file = fileInput.files[0];
+        var csrf = form.querySelector('[name="csrfmiddlewaretoken"]').value;
+        var ticketData = new FormData();
+        ticketData.append('csrfmiddlewaretoken', csrf);
+        ticketData.append('document_type', form.querySelector('[name="document_type"]').value);
+        ticketData.append('title', form.querySelector('[name="title"]').value);
+        ticketData.append('filename', file.name);
+
+        var submit = form.querySelector('[type="submit"]');
+        if (submit) submit.disabled = true;
+
+        postForm(form.dataset.directUploadTicket, ticketData).then(function (ticket) {
+          var uploadData = new FormData();
+          Object.keys(ticket.fields).forEach(function (key) {
+            uploadData.append(key, ticket.fields[key]);
+          });
+          uploadData.append('file', file);
+          return fetch(ticket.upload_url, { method: 'POST', body: uploadData }).then(function (res) {
+            return res.json();
+          }).then(function (result) {
+            if (!result.public_id) throw new Error((result.error && result.error.message) || result.error || 'Upload failed');
+            var commitData = new FormData();
+            commitData.append('csrfmiddlewaretoken', csrf);
+            commitData.append('ticket', ticket.ticket);
+            commitData.append('public_id', result.public_id);
+            commitData.append('version', result.version);
+            commitData.append('signature', result.signature);
+            return postForm(form.dataset.directUploadCommit, commitData);
+          });
+        }).then(function (committed) {
+          window.location.href = committed.redirect;
+        }).catch(function () {
+          // Let the server-side form report the error through the classic upload path
+          form.dataset.directUploadFallback = '1';
+          if (submit) submit.disabled = false;
+          form.submit();
+        });
+      });
+    });
+  }
+
+  ready(initDirectUploads);
+})();
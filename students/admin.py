@@ -1,15 +1,34 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import StudentProfile
+from .models import DOCUMENT_COUNT_FIELDS, StudentProfile
+from documents.models import Document
+
+
+class MissingDocumentFilter(admin.SimpleListFilter):
+    """Students with no document of a given type (reads the counter columns, no join)"""
+    title = 'missing document'
+    parameter_name = 'missing'
+
+    def lookups(self, request, model_admin):
+        return Document.DOCUMENT_TYPE_CHOICES
+
+    def queryset(self, request, queryset):
+        field = DOCUMENT_COUNT_FIELDS.get(self.value())
+        if field:
+            return queryset.filter(**{field: 0})
+        return queryset
 
 
 @admin.register(StudentProfile)
 class StudentProfileAdmin(admin.ModelAdmin):
     """Admin interface for Student Profile"""
-    list_display = ['photo_thumbnail', 'user', 'passport_number', 'visa_status', 'created_at']
-    list_filter = ['visa_status', 'created_at']
+    list_display = ['photo_thumbnail', 'user', 'passport_number', 'visa_status', 'document_count', 'created_at']
+    list_filter = ['visa_status', MissingDocumentFilter, 'created_at']
     search_fields = ['user__username', 'user__email', 'passport_number', 'user__first_name', 'user__last_name']
-    readonly_fields = ['created_at', 'updated_at', 'photo_preview']
+    readonly_fields = [
+        'created_at', 'updated_at', 'photo_preview',
+        'document_count', 'marksheet_10th_count', 'marksheet_12th_count', 'aadhaar_count', 'pan_count', 'additional_count',
+    ]
     fieldsets = (
         ('User Information', {
             'fields': ('user', 'photo', 'photo_preview')
@@ -17,6 +36,9 @@ class StudentProfileAdmin(admin.ModelAdmin):
         ('Visa Information', {
             'fields': ('passport_number', 'address', 'visa_status')
         }),
+        ('Documents', {
+            'fields': ('document_count', 'marksheet_10th_count', 'marksheet_12th_count', 'aadhaar_count', 'pan_count', 'additional_count')
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -24,11 +46,11 @@ class StudentProfileAdmin(admin.ModelAdmin):
     )
     
     def photo_thumbnail(self, obj):
-        """Display small photo thumbnail in list view"""
-        if obj.photo:
+        """Display small photo thumbnail in list view (the 80px avatar, never the original)"""
+        if obj.photo_avatar or obj.photo_thumbnail:
             return format_html(
                 '<img src="{}" style="width: 40px; height: 40px; border-radius: 50%; object-fit: cover;" />',
-                obj.photo.url
+                (obj.photo_avatar or obj.photo_thumbnail).url
             )
         return format_html(
             '<div style="width: 40px; height: 40px; border-radius: 50%; background: #e9ecef; display: flex; align-items: center; justify-content: center;">'
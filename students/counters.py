@@ -0,0 +1,108 @@
+"""
+Denormalized Document counts on StudentProfile.
+
+``document_count`` and the per-type columns (DOCUMENT_COUNT_FIELDS) are
+adjusted by the Document signals with ``F()`` updates in the same transaction
+as the Document write, so the admin student list can show, sort and filter by
+them without joining the Document table. Every path that adds or removes
+Documents is covered: saves, deletes (single, queryset and cascade, which all
+send post_delete) and ``documents_bulk_created``.
+
+``recount`` rebuilds the columns from the Document table in pk batches, for
+rows written before the columns existed or by code that bypasses signals
+(``QuerySet.update``, raw SQL).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+
+from documents.models import Document
+
+from .models import DOCUMENT_COUNT_FIELDS, DOCUMENT_COUNTER_COLUMNS, StudentProfile
+
+
+def _changes(deltas):
+    """{column: expression} for one student's {document_type: delta}."""
+    total = sum(deltas.values())
+    by_field = Counter()
+    for document_type, delta in deltas.items():
+        field = DOCUMENT_COUNT_FIELDS.get(document_type)
+        if field:
+            by_field[field] += delta
+    by_field['document_count'] += total
+    # Clamped at zero: a drifted counter must not make a delete fail
+    return {
+        field: Greatest(F(field) + Value(delta), Value(0))
+        for field, delta in by_field.items() if delta
+    }
+
+
+def adjust(deltas):
+    """Apply {(student user id, document_type): delta}, one UPDATE per student."""
+    by_student = {}
+    for (user_id, document_type), delta in deltas.items():
+        if user_id and delta:
+            by_student.setdefault(user_id, Counter())[document_type] += delta
+    for user_id, student_deltas in by_student.items():
+        changes = _changes(student_deltas)
+        if changes:
+            StudentProfile.objects.filter(user_id=user_id).update(**changes)
+
+
+def counted(documents):
+    """{(student user id, document_type): n} for some Document instances."""
+    return Counter((document.student_id, document.document_type) for document in documents)
+
+
+def counts_for(user_ids):
+    """{user id: {column: value}} computed from the Document table."""
+    result = {user_id: dict.fromkeys(DOCUMENT_COUNTER_COLUMNS, 0) for user_id in user_ids}
+    rows = (
+        Document.objects.filter(student_id__in=user_ids)
+        .values('student_id', 'document_type').annotate(n=Count('id')).order_by()
+    )
+    for row in rows:
+        counts = result[row['student_id']]
+        counts['document_count'] += row['n']
+        field = DOCUMENT_COUNT_FIELDS.get(row['document_type'])
+        if field:
+            counts[field] += row['n']
+    return result
+
+
+def recount(batch_size=500, user_ids=None):
+    """
+    Recompute the counters in pk order, ``batch_size`` profiles per
+    transaction. Each batch locks its profiles while counting, so signal
+    updates for those students wait instead of being overwritten. Returns
+    (profiles checked, profiles corrected).
+    """
+    fields = list(DOCUMENT_COUNTER_COLUMNS)
+    queryset = StudentProfile.objects.order_by('pk')
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    last_pk = 0
+    checked = corrected = 0
+    while True:
+        with transaction.atomic():
+            profiles = list(
+                queryset.select_for_update().filter(pk__gt=last_pk)
+                .only('pk', 'user_id', *fields)[:batch_size]
+            )
+            if not profiles:
+                break
+            last_pk = profiles[-1].pk
+            counts = counts_for([profile.user_id for profile in profiles])
+            changed = []
+            for profile in profiles:
+                expected = counts[profile.user_id]
+                if any(getattr(profile, field) != expected[field] for field in fields):
+                    for field in fields:
+                        setattr(profile, field, expected[field])
+                    changed.append(profile)
+            StudentProfile.objects.bulk_update(changed, fields)
+        checked += len(profiles)
+        corrected += len(changed)
+    return checked, corrected
@@ -0,0 +1,138 @@
+"""
+Cached headline metrics for the admin dashboard.
+
+The status counts and the recent-documents list only change when a
+StudentProfile or Document does, so they are computed once per change rather
+than once per page view. The cache entry is keyed by a version token that the
+signal handlers replace (after commit) whenever either model is saved or
+deleted, so a change is visible on the next load.
+
+On a miss, one worker takes a short lock and recomputes while the others keep
+serving the last computed value, so a burst of admins opening the dashboard
+right after a change costs one computation, not one per request.
+"""
+import os
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.urls import reverse
+
+from documents.models import Document
+
+from .models import StudentProfile
+
+VERSION_KEY = 'students:dashboard-metrics:version'
+LATEST_KEY = 'students:dashboard-metrics:latest'
+LOCK_KEY = 'students:dashboard-metrics:lock'
+
+
+def _metrics_key(version):
+    return f'students:dashboard-metrics:{version}'
+
+
+def metrics_ttl():
+    return getattr(settings, 'DASHBOARD_METRICS_TTL', 300)
+
+
+def recent_activity(limit=20):
+    """
+    The newest documents as plain dicts holding exactly what the recent
+    documents table shows, read with one values() query. Nothing on a row
+    needs a model instance, a lazy relation or a storage call to render, and
+    the rows stay small in the cache.
+    """
+    rows = Document.objects.order_by('-uploaded_at', '-id').values(
+        'id', 'document_type', 'original_filename', 'file', 'size_bytes', 'thumbnail',
+        'storage_state', 'uploaded_at',
+        'student__username', 'student__first_name', 'student__last_name',
+        'student__student_profile__id',
+        'uploaded_by__role', 'uploaded_by__is_staff', 'uploaded_by__is_superuser',
+    )[:limit]
+    type_labels = dict(Document.DOCUMENT_TYPE_CHOICES)
+    processing = (Document.STORAGE_PENDING, Document.STORAGE_TRANSFERRING)
+    activity = []
+    for row in rows:
+        full_name = f"{row['student__first_name']} {row['student__last_name']}".strip()
+        activity.append({
+            'id': row['id'],
+            'profile_id': row['student__student_profile__id'],
+            'student_name': full_name or row['student__username'],
+            'document_type_display': type_labels.get(row['document_type'], row['document_type']),
+            'filename': row['original_filename'] or os.path.basename(row['file'] or ''),
+            'size_kb': round(row['size_bytes'] / 1024, 2) if row['size_bytes'] is not None else 0,
+            # Same test as User.is_admin(); a deleted uploader reads as a student upload
+            'uploaded_by_admin': bool(
+                row['uploaded_by__role'] == 'ADMIN' or row['uploaded_by__is_staff'] or row['uploaded_by__is_superuser']
+            ),
+            'thumbnail_url': reverse('documents:thumbnail', args=[row['id']]) if row['thumbnail'] else None,
+            'processing': row['storage_state'] in processing,
+            'failed': row['storage_state'] == Document.STORAGE_FAILED,
+            'uploaded_at': row['uploaded_at'],
+        })
+    return activity
+
+
+def compute_metrics():
+    """Headline numbers (one conditional aggregate) and the 20 most recent documents."""
+    recent_documents = recent_activity()
+
+    statuses = [status for status, _ in StudentProfile.STATUS_CHOICES]
+    totals = StudentProfile.objects.aggregate(
+        total=Count('id'),
+        **{status: Count('id', filter=Q(visa_status=status)) for status in statuses}
+    )
+    return {
+        'recent_documents': recent_documents,
+        'total_students': totals['total'],
+        'approved_count': totals['APPROVED'],
+        'pending_count': totals['REGISTERED'] + totals['DOCUMENTS_SUBMITTED'] + totals['UNDER_REVIEW'],
+        'rejected_count': totals['REJECTED'],
+        'status_breakdown': [
+            {'visa_status': status, 'count': totals[status]}
+            for status in sorted(statuses) if totals[status]
+        ],
+    }
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_metrics():
+    """Return the dashboard metrics, recomputing at most once per change."""
+    version = _current_version()
+    key = _metrics_key(version)
+    metrics = cache.get(key)
+    if metrics is not None:
+        return metrics
+
+    if cache.add(LOCK_KEY, version, timeout=getattr(settings, 'DASHBOARD_METRICS_LOCK_SECONDS', 30)):
+        try:
+            metrics = compute_metrics()
+            cache.set(key, metrics, timeout=metrics_ttl())
+            cache.set(LATEST_KEY, metrics, timeout=None)
+        finally:
+            cache.delete(LOCK_KEY)
+        return metrics
+
+    # Someone else is recomputing: serve the previous numbers meanwhile
+    stale = cache.get(LATEST_KEY)
+    if stale is not None:
+        return stale
+    return compute_metrics()
+
+
+def invalidate():
+    """
+    Start a new version once the current transaction commits. A random token
+    rather than a counter, so a version lost from the cache can never come
+    back and match an old entry.
+    """
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None))
@@ -32,6 +32,13 @@ class StudentProfileForm(forms.ModelForm):
             Submit('submit', 'Save Profile', css_class='btn btn-primary mt-3')
         )
 
+    def clean_photo(self):
+        photo = self.cleaned_data.get('photo')
+        # Rejected while streaming by StreamingValidationUploadHandler
+        if photo and getattr(photo, 'upload_error', None):
+            raise forms.ValidationError(photo.upload_error)
+        return photo
+
 
 class VisaStatusUpdateForm(forms.ModelForm):
     """
@@ -0,0 +1,75 @@
+"""
+Photo normalization for StudentProfile.
+
+Phone photos arrive as multi-megabyte JPEGs with EXIF orientation and GPS
+data. On ingest they are rotated upright, stripped of metadata, capped at
+STUDENT_PHOTO_MAX_DIMENSION and re-encoded (progressive JPEG by default, or
+WebP). Square avatar variants are cut from the normalized image so list pages
+never load the full photo.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# (field, pixel size): the admin list shows 40px circles, student_detail 120px (2x for HiDPI)
+AVATAR_SIZES = {
+    'photo_avatar': 80,
+    'photo_thumbnail': 240,
+}
+
+
+def _photo_format():
+    fmt = getattr(settings, 'STUDENT_PHOTO_FORMAT', 'JPEG').upper()
+    return 'WEBP' if fmt == 'WEBP' else 'JPEG'
+
+
+def _encode(image, fmt, quality):
+    out = BytesIO()
+    if fmt == 'WEBP':
+        image.save(out, 'WEBP', quality=quality, method=4)
+    else:
+        image.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def load_upright(file):
+    """Open an image, apply its EXIF orientation and drop everything but the pixels."""
+    file.seek(0)
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            background = Image.new('RGB', image.size, 'white')
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+    return image
+
+
+def normalize_photo(file, filename):
+    """
+    Return (ContentFile, image) for the normalized photo; the file is named
+    after the upload with the new extension.
+    """
+    image = load_upright(file)
+    max_dimension = getattr(settings, 'STUDENT_PHOTO_MAX_DIMENSION', 1024)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    fmt = _photo_format()
+    quality = getattr(settings, 'STUDENT_PHOTO_QUALITY', 85)
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    ext = 'webp' if fmt == 'WEBP' else 'jpg'
+    return ContentFile(_encode(image, fmt, quality), name=f'{stem}.{ext}'), image
+
+
+def avatar_variants(image, filename):
+    """{field: ContentFile} with a square WebP avatar per AVATAR_SIZES entry."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    variants = {}
+    for field, size in AVATAR_SIZES.items():
+        avatar = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        variants[field] = ContentFile(_encode(avatar, 'WEBP', 80), name=f'{stem}_{size}.webp')
+    return variants
@@ -0,0 +1,59 @@
+"""
+Store width and height for profile photos saved before the columns existed.
+
+The columns are only informational (the photo field does not read them), so
+photos that cannot be read are reported and left empty.
+
+Usage:
+    python manage.py backfill_photo_dimensions --batch-size 200
+"""
+from io import BytesIO
+
+from django.core.files.images import get_image_dimensions
+from django.core.management.base import BaseCommand
+
+from students.models import StudentProfile
+
+
+class Command(BaseCommand):
+    help = 'Populate photo_width/photo_height for existing student photos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        storage = StudentProfile._meta.get_field('photo').storage
+        queryset = (
+            StudentProfile.objects.exclude(photo='').exclude(photo__isnull=True)
+            .filter(photo_width__isnull=True)
+        )
+        last_pk = 0
+        updated = failed = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'photo')[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            changed = []
+            for pk, name in rows:
+                try:
+                    with storage.open(name, 'rb') as f:
+                        # Remote files are streamed and unseekable; photos are small enough to buffer
+                        width, height = get_image_dimensions(BytesIO(f.read()))
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'StudentProfile {pk}: could not read {name} ({e})')
+                    continue
+                if width is None:
+                    failed += 1
+                    self.stderr.write(f'StudentProfile {pk}: {name} is not a readable image')
+                    continue
+                changed.append(StudentProfile(pk=pk, photo_width=width, photo_height=height))
+
+            StudentProfile.objects.bulk_update(changed, ['photo_width', 'photo_height'])
+            updated += len(changed)
+            self.stdout.write(f'Processed up to id {last_pk}: {updated} updated, {failed} failed')
+
+        self.stdout.write(self.style.SUCCESS(f'Done. {updated} photos updated, {failed} failed.'))
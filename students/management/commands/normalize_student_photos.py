@@ -0,0 +1,49 @@
+"""
+Normalize profile photos uploaded before normalization existed and cut their avatars.
+
+Usage:
+    python manage.py normalize_student_photos --batch-size 50
+"""
+from io import BytesIO
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from students.models import StudentProfile
+
+
+class Command(BaseCommand):
+    help = 'Re-encode existing student photos and generate avatar variants.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = (
+            StudentProfile.objects.exclude(photo='').exclude(photo__isnull=True)
+            .filter(Q(photo_avatar__isnull=True) | Q(photo_avatar=''))
+            .select_related('user')
+        )
+        last_pk = 0
+        done = failed = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for profile in batch:
+                try:
+                    with profile.photo.open('rb') as f:
+                        # An uncommitted file makes save() normalize it and cut the avatars
+                        # Remote files are streamed and unseekable; photos are small enough to buffer
+                        profile.photo = File(BytesIO(f.read()), name=profile.photo.name.rsplit('/', 1)[-1])
+                        profile.save()
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'StudentProfile {profile.pk}: {e}')
+            self.stdout.write(f'Processed up to id {last_pk}: {done} normalized, {failed} failed')
+
+        self.stdout.write(self.style.SUCCESS(f'Done. {done} photos normalized, {failed} failed.'))
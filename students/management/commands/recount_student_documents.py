@@ -0,0 +1,24 @@
+"""
+Recompute the denormalized document counters on StudentProfile.
+
+The counters are kept current by signals; run this after writing Documents
+in a way that skips them (QuerySet.update, raw SQL, fixtures loaded raw), or
+to check for drift.
+
+Usage:
+    python manage.py recount_student_documents --batch-size 500
+"""
+from django.core.management.base import BaseCommand
+
+from students.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Recompute document_count and the per-type document counts for every student profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        checked, corrected = recount(batch_size=max(1, options['batch_size']))
+        self.stdout.write(self.style.SUCCESS(f'Done. {checked} profiles checked, {corrected} corrected.'))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:07
+
+import cloudinary_storage.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0005_alter_studentprofile_photo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='photo_thumbnail',
+            field=models.ImageField(blank=True, editable=False, help_text='Small WebP version of the photo for lists', null=True, storage=cloudinary_storage.storage.MediaCloudinaryStorage(), upload_to=''),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:16
+
+import django.core.validators
+import documents.storage
+import students.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0006_studentprofile_photo_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='studentprofile',
+            name='photo',
+            field=models.ImageField(blank=True, help_text='Student passport-size photo (JPG, PNG)', null=True, storage=documents.storage.image_storage, upload_to=students.models.student_photo_path, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png'])]),
+        ),
+        migrations.AlterField(
+            model_name='studentprofile',
+            name='photo_thumbnail',
+            field=models.ImageField(blank=True, editable=False, help_text='Small WebP version of the photo for lists', null=True, storage=documents.storage.image_storage, upload_to=''),
+        ),
+    ]
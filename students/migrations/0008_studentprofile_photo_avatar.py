@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:24
+
+import django.core.validators
+import documents.storage
+import students.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0007_studentprofile_storage_backend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='photo_avatar',
+            field=models.ImageField(blank=True, editable=False, help_text='80px square avatar for student lists', null=True, storage=documents.storage.image_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='studentprofile',
+            name='photo',
+            field=models.ImageField(blank=True, help_text='Student passport-size photo (JPG, PNG)', null=True, storage=documents.storage.image_storage, upload_to=students.models.student_photo_path, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])]),
+        ),
+        migrations.AlterField(
+            model_name='studentprofile',
+            name='photo_thumbnail',
+            field=models.ImageField(blank=True, editable=False, help_text='240px square avatar for the student detail page', null=True, storage=documents.storage.image_storage, upload_to=''),
+        ),
+    ]
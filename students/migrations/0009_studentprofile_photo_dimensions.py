@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:26
+
+import django.core.validators
+import documents.storage
+import students.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0008_studentprofile_photo_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='photo_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='photo_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='studentprofile',
+            name='photo',
+            field=models.ImageField(blank=True, height_field='photo_height', help_text='Student passport-size photo (JPG, PNG)', null=True, storage=documents.storage.image_storage, upload_to=students.models.student_photo_path, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])], width_field='photo_width'),
+        ),
+    ]
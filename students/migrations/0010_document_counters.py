@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:49
+
+from django.db import migrations, models
+from django.db.models import Count
+
+COUNT_FIELDS = {
+    '10TH_MARKSHEET': 'marksheet_10th_count',
+    '12TH_MARKSHEET': 'marksheet_12th_count',
+    'AADHAAR': 'aadhaar_count',
+    'PAN': 'pan_count',
+    'ADDITIONAL': 'additional_count',
+}
+
+
+def forwards(apps, schema_editor):
+    StudentProfile = apps.get_model('students', 'StudentProfile')
+    Document = apps.get_model('documents', 'Document')
+    counts = {}
+    rows = Document.objects.values('student_id', 'document_type').annotate(n=Count('id')).order_by()
+    for row in rows:
+        student = counts.setdefault(row['student_id'], {'document_count': 0})
+        student['document_count'] += row['n']
+        field = COUNT_FIELDS.get(row['document_type'])
+        if field:
+            student[field] = student.get(field, 0) + row['n']
+    for user_id, values in counts.items():
+        StudentProfile.objects.filter(user_id=user_id).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0009_studentprofile_photo_dimensions'),
+        ('documents', '0015_storagetombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='aadhaar_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='additional_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='document_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='marksheet_10th_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='marksheet_12th_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='pan_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(forwards, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0010_document_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentprofile',
+            index=models.Index(fields=['-created_at', '-id'], name='studentprofile_created_id'),
+        ),
+    ]
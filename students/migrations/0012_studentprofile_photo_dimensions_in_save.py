@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:03
+
+import django.core.validators
+import documents.storage
+import students.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0011_studentprofile_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='studentprofile',
+            name='photo',
+            field=models.ImageField(blank=True, help_text='Student passport-size photo (JPG, PNG)', null=True, storage=documents.storage.image_storage, upload_to=students.models.student_photo_path, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])]),
+        ),
+    ]
@@ -5,16 +5,32 @@ Stores additional information for students
 from django.db import models
 from django.conf import settings
 from django.core.validators import RegexValidator
-from cloudinary_storage.storage import MediaCloudinaryStorage
+from documents.storage import image_storage
+from documents.utils import LoadedFilesMixin
 from django.core.validators import FileExtensionValidator
 
 
+# Document.document_type -> StudentProfile per-type counter column
+DOCUMENT_COUNT_FIELDS = {
+    '10TH_MARKSHEET': 'marksheet_10th_count',
+    '12TH_MARKSHEET': 'marksheet_12th_count',
+    'AADHAAR': 'aadhaar_count',
+    'PAN': 'pan_count',
+    'ADDITIONAL': 'additional_count',
+}
+DOCUMENT_COUNTER_COLUMNS = ('document_count', *DOCUMENT_COUNT_FIELDS.values())
+
+
+# Every profile photo (and its avatars) is stored under this directory
+STUDENT_PHOTO_ROOT = 'student_photos'
+
+
 def student_photo_path(instance, filename):
     """Generate upload path for student photos"""
-    return f'student_photos/{instance.user.username}/{filename}'
+    return f'{STUDENT_PHOTO_ROOT}/{instance.user.username}/{filename}'
 
 
-class StudentProfile(models.Model):
+class StudentProfile(LoadedFilesMixin, models.Model):
     """
     Student Profile Model
     Extended information for visa processing
@@ -26,6 +42,8 @@ class StudentProfile(models.Model):
         ('APPROVED', 'Approved'),
         ('REJECTED', 'Rejected'),
     ]
+    # Snapshotted on load so the pre_save signal can detect a replaced photo without a query
+    loaded_file_fields = ('photo', 'photo_thumbnail', 'photo_avatar')
     
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -34,12 +52,31 @@ class StudentProfile(models.Model):
     )
     photo = models.ImageField(
         upload_to=student_photo_path,
-        storage=MediaCloudinaryStorage(),
+        storage=image_storage,
         blank=True,
         null=True,
-        validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png'])],
+        # webp: normalized photos may be re-encoded to it (see STUDENT_PHOTO_FORMAT)
+        validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])],
         help_text='Student passport-size photo (JPG, PNG)'
     )
+    # Written by save() (not width_field/height_field, whose post_init hook opens the
+    # photo of every row loaded with empty columns), so loading a profile never touches storage
+    photo_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    photo_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    photo_thumbnail = models.ImageField(
+        storage=image_storage,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text='240px square avatar for the student detail page'
+    )
+    photo_avatar = models.ImageField(
+        storage=image_storage,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text='80px square avatar for student lists'
+    )
     passport_number = models.CharField(
         max_length=20,
         unique=True,
@@ -60,11 +97,22 @@ class StudentProfile(models.Model):
         default='REGISTERED',
         help_text='Current visa processing status'
     )
+    # Denormalized Document counts, kept current by signals (see students.counters)
+    document_count = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+    marksheet_10th_count = models.PositiveIntegerField(default=0, editable=False)
+    marksheet_12th_count = models.PositiveIntegerField(default=0, editable=False)
+    aadhaar_count = models.PositiveIntegerField(default=0, editable=False)
+    pan_count = models.PositiveIntegerField(default=0, editable=False)
+    additional_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         verbose_name = 'Student Profile'
         verbose_name_plural = 'Student Profiles'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the admin student list (students.pagination)
+            models.Index(fields=['-created_at', '-id'], name='studentprofile_created_id'),
+        ]
     
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.username} - {self.passport_number}"
@@ -73,6 +121,10 @@ class StudentProfile(models.Model):
         """Normalize empty passport_number to NULL so DB unique constraint won't be violated.
 
         Convert empty strings or whitespace-only values to None before saving.
+        A new photo is normalized (upright, no EXIF, capped size) and its avatars are cut.
+        The document counters are only ever written by F() updates: a new profile
+        starts from the student's existing documents, and a full save of a loaded
+        one leaves them out so it cannot overwrite a concurrent increment.
         """
         if self.passport_number is not None:
             pn = str(self.passport_number).strip()
@@ -80,8 +132,35 @@ class StudentProfile(models.Model):
                 self.passport_number = None
             else:
                 self.passport_number = pn
+
+        if self.photo and not self.photo._committed:
+            from .images import normalize_photo
+            normalized, image = normalize_photo(self.photo.file, self.photo.name)
+            self.photo = normalized
+            self.photo_width, self.photo_height = image.size
+            self.set_avatars(image)
+        elif not self.photo:
+            self.photo_width = self.photo_height = None
+
+        if self._state.adding and self.user_id:
+            from .counters import counts_for
+            for field, value in counts_for([self.user_id])[self.user_id].items():
+                setattr(self, field, value)
+        elif not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in DOCUMENT_COUNTER_COLUMNS
+            ]
         super().save(*args, **kwargs)
 
+    def set_avatars(self, image):
+        """Store fresh avatar variants of ``image`` (a normalized PIL image)."""
+        from .images import avatar_variants
+        for field, content in avatar_variants(image, self.photo.name).items():
+            getattr(self, field).save(
+                student_photo_path(self, f'avatars/{content.name}'), content, save=False
+            )
+
     def get_status_display_class(self):
         """Return Bootstrap class for status badge"""
         status_classes = {
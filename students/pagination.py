@@ -0,0 +1,216 @@
+"""
+Keyset (cursor) pagination for the admin student list.
+
+Pages are read newest first on (created_at, id) with a ``WHERE (created_at, id) <
+cursor ... LIMIT`` query instead of OFFSET, so page 5,000 costs the same as page
+one, and no COUNT is needed anywhere. Cursors are opaque URL tokens for the
+first or last row of the page they came from.
+
+The navigator links to the first and last pages and to a window of WINDOW
+page numbers either side of the current one, with gaps elided. The window's
+cursors come from one key-only query in each direction, of at most
+``per_page * WINDOW + 1`` rows. Page numbers are carried along in the URL; the
+total, and so the number of the last page, is an estimate (the cached
+dashboard count).
+
+Page boundaries are counted from the newest row, so the last page holds
+whatever is left over. ``last=1`` seeks from the oldest end and reads that
+remainder as worked out from the estimate, so (while the estimate is right)
+paging back from it lands on the same pages, with the same numbers, as
+paging forward.
+"""
+import base64
+import math
+from datetime import datetime
+
+from django.db.models import Q
+
+ORDER = ('-created_at', '-id')
+REVERSE_ORDER = ('created_at', 'id')
+
+
+# Page numbers linked on either side of the current page
+WINDOW = 2
+
+
+def _encode(created_at, pk):
+    raw = f'{created_at.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def encode_cursor(obj):
+    return _encode(obj.created_at, obj.pk)
+
+
+def decode_cursor(token):
+    """(created_at, id) for a cursor token, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of objects plus what the template needs to link to its neighbours."""
+
+    def __init__(self, object_list, number, has_next, has_previous, estimated_total, per_page):
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.estimated_total = estimated_total
+        self.estimated_pages = math.ceil(estimated_total / per_page) if estimated_total else None
+        # PageLinks and None for elided gaps, filled in by keyset_page
+        self.page_links = []
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_cursor(self):
+        return encode_cursor(self.object_list[-1]) if self._has_next else None
+
+    def previous_cursor(self):
+        return encode_cursor(self.object_list[0]) if self._has_previous else None
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return max(1, self.number - 1)
+
+
+class PageLink:
+    """A numbered link in the navigator; ``query`` is the URL query string for that page."""
+
+    def __init__(self, number, query, current=False):
+        self.number = number
+        self.query = query
+        self.current = current
+
+
+def _page_number(value, default=1):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _newer(queryset, created_at, pk):
+    return queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+
+
+def _older(queryset, created_at, pk):
+    return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+
+def keyset_page(queryset, per_page, params, estimated_total=None):
+    """
+    The page of ``queryset`` named by ``params`` (request.GET): ``after`` or
+    ``before`` a cursor, ``last=1`` for the oldest page, otherwise the first.
+    Each costs one query of at most ``per_page + 1`` rows, plus one key-only
+    query per direction the navigator can go.
+    """
+    page = _read_page(queryset, per_page, params, estimated_total)
+    page.page_links = _page_links(queryset, page, per_page)
+    return page
+
+
+def _read_page(queryset, per_page, params, estimated_total):
+    after = decode_cursor(params.get('after', ''))
+    before = decode_cursor(params.get('before', ''))
+    number = _page_number(params.get('page'))
+
+    if after:
+        rows = list(_older(queryset, *after).order_by(*ORDER)[:per_page + 1])
+        return KeysetPage(rows[:per_page], number, len(rows) > per_page, True, estimated_total, per_page)
+
+    if before:
+        rows = list(_newer(queryset, *before).order_by(*REVERSE_ORDER)[:per_page + 1])
+        has_previous = len(rows) > per_page
+        return KeysetPage(
+            rows[:per_page][::-1], number if has_previous else 1, True, has_previous, estimated_total, per_page
+        )
+
+    if params.get('last'):
+        # The remainder after the full pages counted from the newest row (by
+        # the estimate), so the pages before this one keep their boundaries
+        pages = math.ceil(estimated_total / per_page) if estimated_total else 1
+        size = estimated_total % per_page or per_page if estimated_total else per_page
+        rows = list(queryset.order_by(*REVERSE_ORDER)[:size + 1])
+        has_previous = len(rows) > size
+        return KeysetPage(
+            rows[:size][::-1], max(pages, 2) if has_previous else 1, False, has_previous, estimated_total, per_page
+        )
+
+    rows = list(queryset.order_by(*ORDER)[:per_page + 1])
+    return KeysetPage(rows[:per_page], 1, len(rows) > per_page, False, estimated_total, per_page)
+
+
+def _page_links(queryset, page, per_page):
+    """
+    Links for the first page, WINDOW pages either side of ``page``, and the
+    last page, with None where pages are left out.
+    """
+    if not page.has_other_pages():
+        return []
+    limit = per_page * WINDOW + 1
+
+    earlier = []
+    if page.has_previous():
+        first = page.object_list[0]
+        # Keys of the newer rows, nearest first: page n-k ends where n-k+1 began
+        keys = list(
+            _newer(queryset, first.created_at, first.pk)
+            .order_by(*REVERSE_ORDER).values_list('created_at', 'pk')[:limit]
+        )
+        cursor = (first.created_at, first.pk)
+        for k in range(1, WINDOW + 1):
+            chunk = keys[(k - 1) * per_page:k * per_page]
+            if len(keys) <= k * per_page:
+                # Nothing newer than this chunk: it is the first page
+                earlier.append(PageLink(1, ''))
+                break
+            number = max(page.number - k, 2)
+            earlier.append(PageLink(number, f'before={_encode(*cursor)}&page={number}'))
+            cursor = chunk[-1]
+        else:
+            if page.number - WINDOW > 2:
+                earlier.append(None)
+            earlier.append(PageLink(1, ''))
+
+    later = []
+    if page.has_next():
+        last = page.object_list[-1]
+        keys = list(
+            _older(queryset, last.created_at, last.pk)
+            .order_by(*ORDER).values_list('created_at', 'pk')[:limit]
+        )
+        cursor = (last.created_at, last.pk)
+        for k in range(1, WINDOW + 1):
+            chunk = keys[(k - 1) * per_page:k * per_page]
+            later.append(PageLink(page.number + k, f'after={_encode(*cursor)}&page={page.number + k}'))
+            if len(keys) <= k * per_page:
+                # Nothing older than this chunk: it is the last page
+                break
+            cursor = chunk[-1]
+        else:
+            last_number = max(page.estimated_pages or 0, page.number + WINDOW + 1)
+            if last_number > page.number + WINDOW + 1:
+                later.append(None)
+            later.append(PageLink(last_number, 'last=1'))
+
+    return earlier[::-1] + [PageLink(page.number, '', current=True)] + later
@@ -1,36 +1,93 @@
-from django.db.models.signals import post_delete, pre_save
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
+from documents.models import Document
+from documents.signals import deleted_with_student, documents_bulk_created
+from documents.tombstones import bury_files
+
+from . import counters, dashboard
 from .models import StudentProfile
 
 
 @receiver(post_delete, sender=StudentProfile)
 def delete_student_photo_on_delete(sender, instance: StudentProfile, **kwargs):
     """
-    Delete the underlying photo file when a StudentProfile row is deleted.
+    Queue the photo files for deletion when a StudentProfile row is deleted.
     Covers cascade deletes when a User is deleted.
     """
-    if instance.photo:
-        try:
-            instance.photo.delete(save=False)
-        except Exception:
-            pass
+    bury_files([instance.photo, instance.photo_thumbnail, instance.photo_avatar])
 
 
 @receiver(pre_save, sender=StudentProfile)
 def delete_student_photo_on_change(sender, instance: StudentProfile, **kwargs):
     """
-    If the profile photo is changed, remove the old file from storage.
+    If the profile photo is changed, queue the old files for deletion.
+    The old names come from the snapshot taken when the profile was loaded;
+    only profiles without one (e.g. built by hand with a pk) cost a query.
     """
     if not instance.pk:
         return
-    try:
-        old = StudentProfile.objects.get(pk=instance.pk)
-    except StudentProfile.DoesNotExist:
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'photo' not in update_fields:
+        return
+    old = instance if instance.has_loaded_files() else StudentProfile.objects.filter(pk=instance.pk).first()
+    if old is None:
+        return
+    old_name = old.loaded_value('photo')
+    if old_name and old_name != getattr(instance.photo, 'name', None):
+        bury_files([old.loaded_file(name) for name in StudentProfile.loaded_file_fields])
+
+
+@receiver(post_save, sender=Document)
+def count_document_on_save(sender, instance: Document, created, **kwargs):
+    """
+    Count a new document on its student's profile. For an existing one, the
+    load-time snapshot still holds the old student and type here, so a move
+    is one decrement and one increment. Documents saved without a snapshot
+    (built by hand with a pk) have their student recounted instead.
+    """
+    if created:
+        counters.adjust({(instance.student_id, instance.document_type): 1})
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not {'student', 'document_type'} & set(update_fields):
+        return
+    if not instance.has_loaded_files():
+        counters.recount(user_ids=[instance.student_id])
+        return
+    old = (instance.loaded_value('student'), instance.loaded_value('document_type'))
+    new = (instance.student_id, instance.document_type)
+    if old != new:
+        counters.adjust({old: -1, new: 1})
+
+
+@receiver(post_delete, sender=Document)
+def uncount_document_on_delete(sender, instance: Document, **kwargs):
+    """
+    Also sent for queryset deletes, one document at a time. A cascade from
+    deleting the student is skipped: the counters go with the profile.
+    """
+    if deleted_with_student(instance):
         return
-    if old.photo and old.photo.name and old.photo.name != getattr(instance.photo, 'name', None):
-        try:
-            old.photo.delete(save=False)
-        except Exception:
-            pass
+    counters.adjust({(instance.student_id, instance.document_type): -1})
+    dashboard.invalidate()
+
 
+@receiver(documents_bulk_created, sender=Document)
+def count_bulk_created_documents(sender, documents, **kwargs):
+    counters.adjust(counters.counted(documents))
+
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_delete, sender=StudentProfile)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+@receiver(post_save, sender=Document)
+@receiver(documents_bulk_created, sender=Document)
+def invalidate_dashboard_metrics(sender, **kwargs):
+    """
+    Profiles and documents feed the cached admin dashboard numbers (document
+    deletes invalidate in ``uncount_document_on_delete``, once per student
+    for a cascade).
+    """
+    dashboard.invalidate()
@@ -0,0 +1,213 @@
+"""Tests for students app models."""
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from documents.batch_upload import save_batch
+from documents.models import Document
+from documents.tests import TempStorageMixin
+from students.models import StudentProfile
+
+User = get_user_model()
+
+
+def phone_photo(size=(4000, 3000), orientation=6):
+    """A large JPEG with an EXIF orientation tag and a camera model, like a phone produces."""
+    image = Image.new('RGB', size, 'white')
+    image.paste((200, 30, 30), (0, 0, size[0] // 2, size[1]))
+    exif = Image.Exif()
+    exif[0x0112] = orientation  # Orientation: rotate 90 CW to display
+    exif[0x0110] = 'TestPhone 12'  # Model
+    out = BytesIO()
+    image.save(out, 'JPEG', exif=exif, quality=95)
+    return out.getvalue()
+
+
+@override_settings(STUDENT_PHOTO_MAX_DIMENSION=1024)
+class PhotoNormalizationTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='stu1', email='s@x.com', password='testpass123', role='STUDENT')
+        self.profile = StudentProfile.objects.create(user=user)
+
+    def save_photo(self, content, name='IMG_0001.jpg'):
+        self.profile.photo = SimpleUploadedFile(name, content, content_type='image/jpeg')
+        self.profile.save()
+        self.profile.refresh_from_db()
+
+    def test_photo_is_upright_capped_and_stripped(self):
+        original = phone_photo()
+        self.save_photo(original)
+
+        with self.profile.photo.open('rb') as f:
+            data = f.read()
+        self.assertLess(len(data), len(original))
+        image = Image.open(BytesIO(data))
+        # 4000x3000 landscape with orientation 6 is a 3000x4000 portrait
+        self.assertEqual(image.size, (768, 1024))
+        self.assertEqual(image.format, 'JPEG')
+        self.assertTrue(image.info.get('progressive') or image.info.get('progression'))
+        self.assertEqual(len(image.getexif()), 0)
+
+    def test_square_avatars_are_generated(self):
+        self.save_photo(phone_photo())
+        for field, size in (('photo_avatar', 80), ('photo_thumbnail', 240)):
+            with getattr(self.profile, field).open('rb') as f:
+                self.assertEqual(Image.open(f).size, (size, size))
+
+    def test_replacing_photo_removes_old_files(self):
+        self.save_photo(phone_photo())
+        storage = self.profile.photo.storage
+        old_names = [self.profile.photo.name, self.profile.photo_avatar.name, self.profile.photo_thumbnail.name]
+        self.save_photo(phone_photo(size=(800, 600), orientation=1), name='new.jpg')
+        call_command('drain_storage_deletions', stdout=StringIO())
+        for name in old_names:
+            self.assertFalse(storage.exists(name))
+        self.assertTrue(storage.exists(self.profile.photo_avatar.name))
+
+    def test_status_save_does_not_query_old_photo(self):
+        self.save_photo(phone_photo(orientation=1))
+        profile = StudentProfile.objects.get(pk=self.profile.pk)
+        profile.visa_status = 'UNDER_REVIEW'
+        with self.assertNumQueries(1):
+            profile.save()
+        with self.assertNumQueries(1):
+            profile.save(update_fields=['visa_status'])
+
+    @override_settings(STUDENT_PHOTO_FORMAT='WEBP')
+    def test_webp_output(self):
+        self.save_photo(phone_photo(orientation=1), name='IMG.png')
+        self.assertTrue(self.profile.photo.name.endswith('.webp'))
+        self.profile.full_clean()
+
+
+class PhotoDimensionTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.profiles = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'stu{i}', email=f's{i}@x.com', password='x', role='STUDENT')
+            profile = StudentProfile.objects.create(user=user)
+            profile.photo = SimpleUploadedFile(f'p{i}.jpg', phone_photo(size=(1200, 900), orientation=1))
+            profile.save()
+            self.profiles.append(profile)
+
+    def test_dimensions_stored_on_upload(self):
+        profile = StudentProfile.objects.get(pk=self.profiles[0].pk)
+        self.assertEqual((profile.photo_width, profile.photo_height), (1024, 768))
+
+    def test_backfill_command(self):
+        StudentProfile.objects.update(photo_width=None, photo_height=None)
+        call_command('backfill_photo_dimensions', stdout=StringIO())
+        self.assertFalse(StudentProfile.objects.filter(photo_width__isnull=True).exists())
+        self.assertEqual(StudentProfile.objects.filter(photo_width=1024, photo_height=768).count(), 3)
+
+    def test_loading_a_row_without_dimensions_never_opens_the_photo(self):
+        # Legacy rows: empty columns and a file that is gone
+        StudentProfile.objects.filter(pk=self.profiles[0].pk).update(
+            photo='student_photos/missing.jpg', photo_width=None, photo_height=None
+        )
+        profile = StudentProfile.objects.get(pk=self.profiles[0].pk)
+        self.assertIsNone(profile.photo_width)
+
+    def test_clearing_the_photo_clears_dimensions(self):
+        profile = StudentProfile.objects.get(pk=self.profiles[0].pk)
+        profile.photo = None
+        profile.save()
+        profile.refresh_from_db()
+        self.assertEqual((profile.photo_width, profile.photo_height), (None, None))
+
+    def test_pages_make_no_storage_reads(self):
+        """Rendering the admin changelist and student_detail never opens, stats or probes a stored file."""
+        from unittest import mock
+        from django.core.files.storage import FileSystemStorage
+        from django.urls import reverse
+
+        admin = User.objects.create_superuser(username='admin1', email='a@x.com', password='x', role='ADMIN')
+        self.client.force_login(admin)
+        reads = []
+
+        def record(name):
+            def read(storage, *args, **kwargs):
+                reads.append((name, args))
+                raise AssertionError(f'storage.{name} called')
+            return read
+
+        with mock.patch.multiple(
+            FileSystemStorage,
+            _open=record('open'),
+            size=record('size'),
+            exists=record('exists'),
+            get_modified_time=record('get_modified_time'),
+        ):
+            self.client.get(reverse('admin:students_studentprofile_changelist'))
+            self.client.get(reverse('admin:students_studentprofile_change', args=[self.profiles[0].pk]))
+            self.client.get(reverse('students:student_detail', args=[self.profiles[0].pk]))
+            self.client.get(reverse('students:admin_dashboard'))
+        self.assertEqual(reads, [])
+
+
+class DocumentCounterTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='stu3', email='s3@x.com', password='testpass123', role='STUDENT')
+        self.profile = StudentProfile.objects.create(user=self.user)
+
+    def add(self, document_type='PAN', user=None):
+        self.added = getattr(self, 'added', 0) + 1
+        return Document.objects.create(
+            student=user or self.user, document_type=document_type, title=f'doc {self.added}',
+            file=SimpleUploadedFile('doc.pdf', b'%PDF-1.4 ' + document_type.encode()),
+        )
+
+    def counts(self):
+        self.profile.refresh_from_db()
+        return (self.profile.document_count, self.profile.pan_count, self.profile.aadhaar_count)
+
+    def test_create_and_delete_adjust_counters(self):
+        pan = self.add('PAN')
+        self.add('AADHAAR')
+        self.add('AADHAAR')
+        self.assertEqual(self.counts(), (3, 1, 2))
+        pan.delete()
+        self.assertEqual(self.counts(), (2, 0, 2))
+        Document.objects.filter(document_type='AADHAAR').delete()
+        self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_type_change_and_bulk_create(self):
+        doc = Document.objects.get(pk=self.add('PAN').pk)
+        doc.document_type = 'AADHAAR'
+        doc.save()
+        self.assertEqual(self.counts(), (1, 0, 1))
+        save_batch(
+            [('PAN', 'p', SimpleUploadedFile('p.pdf', b'%PDF-1.4 p')),
+             ('PAN', 'q', SimpleUploadedFile('q.pdf', b'%PDF-1.4 q'))],
+            self.user, self.user,
+        )
+        self.assertEqual(self.counts(), (3, 2, 1))
+
+    def test_profile_save_does_not_overwrite_concurrent_increment(self):
+        stale = StudentProfile.objects.get(pk=self.profile.pk)
+        self.add('PAN')
+        stale.visa_status = 'UNDER_REVIEW'
+        stale.save()
+        self.assertEqual(self.counts(), (1, 1, 0))
+
+    def test_new_profile_counts_existing_documents(self):
+        other = User.objects.create_user(username='stu4', email='s4@x.com', password='testpass123', role='STUDENT')
+        self.add('AADHAAR', user=other)
+        profile = StudentProfile.objects.create(user=other)
+        self.assertEqual((profile.document_count, profile.aadhaar_count), (1, 1))
+
+    def test_recount_repairs_drift(self):
+        self.add('PAN')
+        self.add('ADDITIONAL')
+        StudentProfile.objects.filter(pk=self.profile.pk).update(document_count=9, pan_count=0)
+        out = StringIO()
+        call_command('recount_student_documents', batch_size=1, stdout=out)
+        self.assertIn('1 corrected', out.getvalue())
+        self.profile.refresh_from_db()
+        self.assertEqual(
+            (self.profile.document_count, self.profile.pan_count, self.profile.additional_count), (2, 1, 1)
+        )
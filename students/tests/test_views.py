@@ -1,5 +1,9 @@
 """Tests for students app views."""
+from django.core.cache import cache
+from django.db import connection
+from django.http import QueryDict
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from students.models import StudentProfile
@@ -67,6 +71,182 @@ class AdminDashboardTests(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+    def add_students(self, start, count):
+        from documents.models import Document
+
+        statuses = [status for status, _ in StudentProfile.STATUS_CHOICES]
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(start, start + count):
+                user = make_student(f'bulk{i}')
+                StudentProfile.objects.create(user=user, visa_status=statuses[i % len(statuses)])
+                Document.objects.create(student=user, document_type='PASSPORT', title=f'p{i}', uploaded_by=user)
+
+    def test_dashboard_query_count_does_not_grow_with_students(self):
+        cache.clear()
+        c = Client()
+        c.force_login(make_admin())
+        self.add_students(0, 3)
+        # session, user, recent documents, one aggregate, one page of students, session save (3)
+        with self.assertNumQueries(8):
+            c.get(reverse('students:admin_dashboard'))
+        # Once there are more pages, one key-only query for the page links
+        self.add_students(3, 22)
+        with self.assertNumQueries(9):
+            response = c.get(reverse('students:admin_dashboard'))
+        self.assertEqual(response.context['total_students'], 25)
+        self.assertEqual(response.context['approved_count'], 5)
+        self.assertEqual(response.context['pending_count'], 15)
+        self.assertEqual(response.context['rejected_count'], 5)
+        self.assertEqual(
+            response.context['status_breakdown'],
+            [{'visa_status': s, 'count': 5} for s in sorted(s for s, _ in StudentProfile.STATUS_CHOICES)],
+        )
+        self.assertEqual(response.context['students'].estimated_pages, 3)
+        self.add_students(25, 20)
+        cache.clear()
+        c.get(reverse('students:admin_dashboard'))
+        # Cached metrics, and still one query for the links however many pages there are
+        with self.assertNumQueries(7):
+            c.get(reverse('students:admin_dashboard'))
+
+    def test_student_list_is_walked_with_cursors(self):
+        cache.clear()
+        c = Client()
+        c.force_login(make_admin())
+        self.add_students(0, 25)
+        # Equal timestamps are ordered by id, so no student is skipped or repeated
+        StudentProfile.objects.filter(user__username__in=['bulk3', 'bulk4', 'bulk5']).update(
+            created_at=StudentProfile.objects.get(user__username='bulk3').created_at
+        )
+        expected = list(StudentProfile.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+        seen, pages, url = [], [], reverse('students:admin_dashboard')
+        while url:
+            response = c.get(url)
+            page = response.context['students']
+            seen.extend(student.pk for student in page)
+            pages.append(page)
+            url = f"{reverse('students:admin_dashboard')}?after={page.next_cursor()}&page={page.next_page_number()}" if page.has_next() else None
+        self.assertEqual(seen, expected)
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+        self.assertContains(response, 'Page 3 of about 3')
+        self.assertNotContains(response, '>Next<')
+
+        back = c.get(f"{reverse('students:admin_dashboard')}?before={pages[2].previous_cursor()}&page=2")
+        self.assertEqual([student.pk for student in back.context['students']], expected[10:20])
+
+        # The last page is the same partial page the forward walk ended on
+        last = c.get(f"{reverse('students:admin_dashboard')}?last=1").context['students']
+        self.assertEqual([student.pk for student in last], expected[20:])
+        self.assertEqual(last.number, 3)
+        self.assertFalse(last.has_next())
+        previous = c.get(
+            f"{reverse('students:admin_dashboard')}?before={last.previous_cursor()}&page={last.previous_page_number()}"
+        ).context['students']
+        self.assertEqual([student.pk for student in previous], expected[10:20])
+        self.assertEqual(previous.number, 2)
+
+        # Seeking from the oldest end needs no COUNT
+        with CaptureQueriesContext(connection) as queries:
+            c.get(f"{reverse('students:admin_dashboard')}?last=1")
+        self.assertFalse([q['sql'] for q in queries if 'COUNT(' in q['sql'].upper()])
+
+        # A malformed cursor falls back to the first page
+        first = c.get(f"{reverse('students:admin_dashboard')}?after=not-a-cursor").context['students']
+        self.assertEqual([student.pk for student in first], expected[:10])
+
+    def test_page_links_are_a_window_around_the_current_page(self):
+        from students.pagination import keyset_page
+
+        self.add_students(0, 19)
+        students = StudentProfile.objects.all()
+        expected = list(students.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+        def open_page(query):
+            return keyset_page(students, 2, QueryDict(query), estimated_total=19)
+
+        def numbers(page):
+            return [link and (link.number, link.current) for link in page.page_links]
+
+        def follow(page, number):
+            link = next(link for link in page.page_links if link and link.number == number)
+            target = open_page(link.query)
+            self.assertEqual(target.number, number)
+            self.assertEqual([student.pk for student in target], expected[(number - 1) * 2:number * 2])
+            return target
+
+        first = open_page('')
+        self.assertEqual(numbers(first), [(1, True), (2, False), (3, False), None, (10, False)])
+        fifth = follow(follow(first, 3), 5)
+        self.assertEqual(
+            numbers(fifth),
+            [(1, False), None, (3, False), (4, False), (5, True), (6, False), (7, False), None, (10, False)],
+        )
+        for number in (1, 3, 4, 6, 7, 10):
+            follow(fifth, number)
+
+        last = follow(fifth, 10)
+        self.assertEqual([student.pk for student in last], expected[18:])
+        self.assertEqual(numbers(last), [(1, False), None, (8, False), (9, False), (10, True)])
+        follow(follow(last, 8), 6)
+        self.assertEqual(numbers(follow(last, 1)), numbers(first))
+
+    def test_metrics_are_cached_until_a_profile_changes(self):
+        cache.clear()
+        c = Client()
+        c.force_login(make_admin())
+        self.add_students(0, 5)
+        c.get(reverse('students:admin_dashboard'))
+        # Cached: no aggregate and no recent-documents query
+        with self.assertNumQueries(6):
+            response = c.get(reverse('students:admin_dashboard'))
+        self.assertEqual(response.context['approved_count'], 1)
+
+        profile = StudentProfile.objects.filter(visa_status='REGISTERED').first()
+        profile.visa_status = 'APPROVED'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        response = c.get(reverse('students:admin_dashboard'))
+        self.assertEqual(response.context['approved_count'], 2)
+
+    def test_recent_activity_is_one_query(self):
+        from documents.models import Document
+        from students import dashboard
+
+        admin = make_admin()
+        self.add_students(0, 12)
+        orphan = make_student('noprofile', first_name='No', last_name='Profile')
+        for i in range(10):
+            Document.objects.create(
+                student=orphan, document_type='PAN', title=f'pan{i}', uploaded_by=admin,
+                original_filename=f'pan{i}.pdf', size_bytes=2048,
+            )
+        with self.assertNumQueries(1):
+            rows = dashboard.recent_activity()
+        self.assertEqual(len(rows), 20)
+        newest = rows[0]
+        self.assertEqual(newest['student_name'], 'No Profile')
+        self.assertIsNone(newest['profile_id'])
+        self.assertTrue(newest['uploaded_by_admin'])
+        self.assertEqual((newest['filename'], newest['size_kb']), ('pan9.pdf', 2.0))
+        self.assertEqual(newest['document_type_display'], dict(Document.DOCUMENT_TYPE_CHOICES)['PAN'])
+        oldest = rows[-1]
+        self.assertEqual(oldest['profile_id'], StudentProfile.objects.get(user__username=oldest['student_name']).pk)
+        self.assertFalse(oldest['uploaded_by_admin'])
+
+    def test_stale_metrics_are_served_while_another_worker_recomputes(self):
+        from students import dashboard
+
+        cache.clear()
+        self.add_students(0, 5)
+        self.assertEqual(dashboard.get_metrics()['total_students'], 5)
+        self.add_students(5, 1)
+        cache.add(dashboard.LOCK_KEY, 'other-worker')
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard.get_metrics()['total_students'], 5)
+        cache.delete(dashboard.LOCK_KEY)
+        self.assertEqual(dashboard.get_metrics()['total_students'], 6)
+
 class StudentDetailTests(TestCase):
     def setUp(self):
         self.admin = make_admin()
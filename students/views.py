@@ -4,11 +4,14 @@ Student and Admin Views
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Count, Q
-from django.core.paginator import Paginator
+from django.db.models import Count
+from . import dashboard
+from .pagination import keyset_page
 from .models import StudentProfile
 from .forms import StudentProfileForm, VisaStatusUpdateForm, AdminUserUpdateForm, AdminStudentProfileUpdateForm
 from documents.models import Document
+from documents.signed_urls import attach_download_urls
+from documents.upload_handlers import PHOTO_EXTENSIONS, streaming_uploads
 from accounts.models import Notification
 
 
@@ -56,7 +59,7 @@ def student_dashboard(request):
     
     context = {
         'profile': profile,
-        'documents': student_documents,
+        'documents': attach_download_urls(student_documents),
         'document_counts': document_counts,
         'total_documents': student_documents.count(),
         'unread_notifications': unread_notifications,
@@ -67,6 +70,7 @@ def student_dashboard(request):
 
 
 @login_required
+@streaming_uploads(PHOTO_EXTENSIONS)
 def student_profile_edit(request):
     """
     Student Profile Edit View with photo upload
@@ -95,52 +99,17 @@ def admin_dashboard(request):
     Admin Dashboard
     Shows all students, analytics, documents view, and quick actions
     """
-    # Get all students
-    students = StudentProfile.objects.select_related('user').all().order_by('-created_at')
+    # Headline numbers and recent documents, cached until a profile or document changes
+    metrics = dashboard.get_metrics()
     
-    # Get recent documents across all students (with student profile id for links)
-    docs = Document.objects.select_related('student', 'uploaded_by').order_by('-uploaded_at')[:20]
-    recent_documents = []
-    for doc in docs:
-        try:
-            profile_id = doc.student.student_profile.id
-        except Exception:
-            profile_id = None
-        recent_documents.append({'doc': doc, 'profile_id': profile_id})
-    
-    # Document count per student (for students table)
-    students_with_doc_count = StudentProfile.objects.select_related('user').annotate(
-        document_count=Count('user__documents')
-    ).order_by('-created_at')
-    
-    # Analytics
-    total_students = students.count()
-    approved_count = students.filter(visa_status='APPROVED').count()
-    pending_count = students.filter(
-        Q(visa_status='REGISTERED') | 
-        Q(visa_status='DOCUMENTS_SUBMITTED') | 
-        Q(visa_status='UNDER_REVIEW')
-    ).count()
-    rejected_count = students.filter(visa_status='REJECTED').count()
-    
-    # Status breakdown
-    status_breakdown = students.values('visa_status').annotate(
-        count=Count('id')
-    ).order_by('visa_status')
-    
-    # Pagination for students
-    paginator = Paginator(students_with_doc_count, 10)  # 10 students per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Students table; document_count is a counter column, so no join with documents.
+    # Keyset pages on (created_at, id): no OFFSET and no COUNT, the total shown is the cached one
+    students = StudentProfile.objects.select_related('user')
+    page_obj = keyset_page(students, 10, request.GET, estimated_total=metrics['total_students'])
     
     context = {
         'students': page_obj,
-        'recent_documents': recent_documents,
-        'total_students': total_students,
-        'approved_count': approved_count,
-        'pending_count': pending_count,
-        'rejected_count': rejected_count,
-        'status_breakdown': status_breakdown,
+        **metrics,
     }
     
     return render(request, 'students/admin_dashboard.html', context)
@@ -167,7 +136,7 @@ def student_detail(request, student_id):
     
     context = {
         'student': student,
-        'documents': documents,
+        'documents': attach_download_urls(documents),
         'status_form': status_form,
     }
     
@@ -267,7 +236,8 @@ def admin_student_edit_confirm(request, student_id):
 def admin_student_delete(request, student_id):
     """
     Admin: delete a student (User + related records) with confirmation.
-    Uploaded files are cleaned up by model signals.
+    Uploaded files are queued for deletion by model signals and removed
+    by drain_storage_deletions, so no storage calls happen here.
     """
     student_profile = get_object_or_404(StudentProfile, id=student_id)
     user_obj = student_profile.user